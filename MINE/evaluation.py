@@ -1,13 +1,19 @@
+import argparse
+import hashlib
 import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import networkx as nx
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from openai import OpenAI
-import os
 
 # Set OpenAI API key
-client = OpenAI(api_key="YOUR_OPENAI_KEY")
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", "YOUR_OPENAI_KEY"))
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+ENCODE_BATCH_SIZE = 256
 
 # Load JSON data
 def load_graph_from_json(file_path):
@@ -28,20 +34,44 @@ def load_graph_from_json(file_path):
 
     return G
 
-# Generate embeddings
-def generate_embeddings(graph, model):
-    node_embeddings = {node: model.encode(node).tolist() for node in graph.nodes}
-    relation_embeddings = {rel: model.encode(rel).tolist()
-                           for rel in set(edge[2]["relation"] for edge in graph.edges(data=True))}
-    return node_embeddings, relation_embeddings
-
-# Retrieve top-k relevant nodes
-def retrieve_relevant_nodes(query, node_embeddings, model, k=8):
-    query_embedding = model.encode(query).reshape(1, -1)
-    similarities = [(node, cosine_similarity(query_embedding, np.array(embed).reshape(1, -1))[0][0])
-                    for node, embed in node_embeddings.items()]
-    similarities = sorted(similarities, key=lambda x: x[1], reverse=True)
-    return similarities[:k]
+# Encode a batch of strings into a matrix of unit-length rows
+def encode(texts, model):
+    return model.encode(
+        list(texts),
+        batch_size=ENCODE_BATCH_SIZE,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    ).astype(np.float32)
+
+# Generate embeddings, reusing the cached matrix when the graph's nodes are unchanged
+def generate_embeddings(graph, model, cache_file=None):
+    nodes = sorted(graph.nodes)
+    key = hashlib.sha256("\n".join([EMBEDDING_MODEL, *nodes]).encode("utf-8")).hexdigest()
+
+    if cache_file and os.path.exists(cache_file):
+        cached = np.load(cache_file)
+        if str(cached["key"]) == key:
+            return nodes, cached["embeddings"]
+
+    embeddings = encode(nodes, model) if nodes else np.zeros((0, 0), dtype=np.float32)
+    if cache_file:
+        np.savez(cache_file, key=key, embeddings=embeddings)
+    return nodes, embeddings
+
+# Retrieve top-k relevant nodes for every query at once
+def retrieve_relevant_nodes(query_embeddings, nodes, node_embeddings, k=8):
+    if not nodes:
+        return [[] for _ in range(len(query_embeddings))]
+    # Rows are normalized, so the dot product is the cosine similarity
+    similarities = query_embeddings @ node_embeddings.T
+    k = min(k, len(nodes))
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    results = []
+    for row, candidates in zip(similarities, top):
+        ranked = candidates[np.argsort(-row[candidates], kind="stable")]
+        results.append([(nodes[i], float(row[i])) for i in ranked])
+    return results
 
 # Retrieve context from relationships
 def retrieve_context(node, graph, depth=2):
@@ -78,38 +108,57 @@ def gpt_evaluate_response(correct_answer, context):
     )
     return int(response.choices[0].message.content.strip())
 
-# Evaluate accuracy
-def evaluate_accuracy(questions_answers, node_embeddings, model, graph, output_file):
-    correct = 0
-    results = []
+# Local stand-in for the GPT judge: 1 if most content words of the answer appear in the context
+def local_evaluate_response(correct_answer, context, threshold=0.6):
+    words = {w for w in re.findall(r"\w+", correct_answer.lower()) if len(w) > 3}
+    if not words:
+        return 0
+    context_words = set(re.findall(r"\w+", context.lower()))
+    return int(len(words & context_words) / len(words) >= threshold)
 
-    for qa in questions_answers:
-        correct_answer = qa["answer"]
-        top_nodes = retrieve_relevant_nodes(correct_answer, node_embeddings, model)
+JUDGES = {"gpt": gpt_evaluate_response, "local": local_evaluate_response}
+
+# Build the retrieved context for every question of one graph
+def build_contexts(questions_answers, graph, nodes, node_embeddings, model):
+    answers = [qa["answer"] for qa in questions_answers]
+    query_embeddings = encode(answers, model)
+    contexts = []
+    for top_nodes in retrieve_relevant_nodes(query_embeddings, nodes, node_embeddings):
         context = []
         for node, _ in top_nodes:
             context.extend(retrieve_context(node, graph))
-        context_text = " ".join(context)
+        contexts.append(" ".join(context))
+    return answers, contexts
 
-        evaluation = gpt_evaluate_response(correct_answer, context_text)
-        results.append({
+# Evaluate accuracy
+def evaluate_accuracy(answers, contexts, evaluations, output_file):
+    results = [
+        {
             "correct_answer": correct_answer,
             "retrieved_context": context_text,
             "evaluation": evaluation
-        })
-        correct += evaluation
-
-    accuracy = correct / len(questions_answers)
+        }
+        for correct_answer, context_text, evaluation in zip(answers, contexts, evaluations)
+    ]
+    accuracy = sum(evaluations) / len(answers)
     results.append({"accuracy": f"{accuracy * 100:.2f}%"})
 
     # Save results to file
     with open(output_file, "w") as f:
         json.dump(results, f, indent=2)
     print(f"Results saved to {output_file}")
+    return accuracy
 
 # Main function to process multiple files
 def main():
-    json_files = [f"KGs/{i}.json" for i in range(1, 107)] 
+    parser = argparse.ArgumentParser(description="Evaluate generated KGs on the MINE benchmark.")
+    parser.add_argument("--kg_dir", type=str, default="KGs", help="Folder containing 1.json ... 106.json.")
+    parser.add_argument("--judge", choices=sorted(JUDGES), default="gpt", help="Judge used to score retrieved context.")
+    parser.add_argument("--workers", type=int, default=16, help="Number of concurrent judge calls.")
+    parser.add_argument("--no_cache", action="store_true", help="Re-encode nodes instead of reusing cached embeddings.")
+    args = parser.parse_args()
+
+    json_files = [os.path.join(args.kg_dir, f"{i}.json") for i in range(1, 107)]
 
     all_questions_answers = [
 [{"answer": "Butterflies undergo a remarkable transformation throughout their life cycle."}, {"answer": "Female butterflies lay their eggs on specific host plants."}, {"answer": "Butterfly eggs are usually laid on the underside of leaves."}, {"answer": "The size, shape, and color of butterfly eggs vary depending on the species."}, {"answer": "After hatching, a tiny larva, known as a caterpillar, emerges."}, {"answer": "Caterpillars are voracious eaters and spend most of their time feeding on leaves."}, {"answer": "Caterpillars shed their skin several times as they grow."}, {"answer": "Caterpillars come in a variety of shapes, sizes, and colors."}, {"answer": "Caterpillars play a crucial role in pollination and maintaining plant populations."}, {"answer": "The caterpillar attaches itself to a leaf or stem and forms a chrysalis."}, {"answer": "Inside the chrysalis, the caterpillar undergoes metamorphosis."}, {"answer": "During metamorphosis, the caterpillar's body undergoes significant changes."}, {"answer": "The adult butterfly emerges from the chrysalis after metamorphosis is complete."}, {"answer": "Adult butterflies feed on nectar from flowers using their proboscis."}, {"answer": "Butterflies play a crucial role in pollination and serve as a food source for other animals."}]
@@ -218,15 +267,35 @@ def main():
 ,[{"answer": "Pop culture refers to the mainstream lifestyle and ideas driven by mass media and entertainment."}, {"answer": "Pop culture influences global trends in fashion through celebrity endorsements and social media."}, {"answer": "Fast fashion and online shopping have contributed to a more globalized fashion landscape."}, {"answer": "Music artists shape popular culture through songs, music videos, and public personas."}, {"answer": "K-pop has led to a surge in interest in Korean culture and fashion worldwide."}, {"answer": "Technology trends spread quickly across the globe with the help of social media platforms."}, {"answer": "Social media is a powerful tool for spreading ideas and influencing behavior globally."}, {"answer": "Tech companies leverage pop culture trends to market their products and services."}, {"answer": "Pop culture influences societal norms and values, shaping perceptions of gender, race, and sexuality."}, {"answer": "Increased visibility of LGBTQ+ characters in media promotes acceptance and inclusivity."}, {"answer": "Pop culture critics argue it promotes superficiality and consumerism."}, {"answer": "Critics raise concerns about cultural appropriation and misrepresentation in popular media."}, {"answer": "Pop culture brings people together, sparks creativity, and drives social change."}, {"answer": "Pop culture plays a crucial role in shaping global trends across various industries."}, {"answer": "Understanding the influence of pop culture helps navigate the ever-changing landscape of popular culture."}]
 ,[{"answer": "Water is crucial for the development of civilization."}, {"answer": "Water is essential for human survival."}, {"answer": "Water is important for drinking."}, {"answer": "Water is important for cooking."}, {"answer": "Water is important for sanitation."}, {"answer": "Early human settlements were established near sources of water."}, {"answer": "Access to water was crucial for the survival of early civilizations."}, {"answer": "The availability of water determined the success of settlements."}, {"answer": "Water is vital for agriculture."}, {"answer": "Water is used to irrigate crops."}, {"answer": "Water allows societies to cultivate larger areas of land."}, {"answer": "Water has been essential for transportation and trade."}, {"answer": "Rivers and seas have served as natural highways for trade."}, {"answer": "Water has been a source of power for industry and innovation."}, {"answer": "Watermills and waterwheels were used in ancient times for various purposes."}]
 ]
+    from sentence_transformers import SentenceTransformer
+
     # Initialize embedding model
-    embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+    embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+    judge = JUDGES[args.judge]
 
+    # Retrieval is local and fast, so it runs first for every graph; the judge calls
+    # for all graphs then share one pool instead of blocking one question at a time.
+    jobs = []
     for json_file, questions_answers in zip(json_files, all_questions_answers):
-        output_file = json_file.replace(".json", "_results.json")
+        if not os.path.exists(json_file):
+            print(f"Skipping missing file: {json_file}")
+            continue
         print(f"Processing file: {json_file}")
         G = load_graph_from_json(json_file)
-        node_embeddings, _ = generate_embeddings(G, embedding_model)
-        evaluate_accuracy(questions_answers, node_embeddings, embedding_model, G, output_file)
+        cache_file = None if args.no_cache else json_file.replace(".json", "_embeddings.npz")
+        nodes, node_embeddings = generate_embeddings(G, embedding_model, cache_file)
+        answers, contexts = build_contexts(questions_answers, G, nodes, node_embeddings, embedding_model)
+        jobs.append((json_file, answers, contexts))
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            [executor.submit(judge, answer, context) for answer, context in zip(answers, contexts)]
+            for _, answers, contexts in jobs
+        ]
+        for (json_file, answers, contexts), graph_futures in zip(jobs, futures):
+            evaluations = [future.result() for future in graph_futures]
+            output_file = json_file.replace(".json", "_results.json")
+            evaluate_accuracy(answers, contexts, evaluations, output_file)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,342 @@
+"""Offline throughput benchmarks for generate, cluster and aggregate, and chunk triage savings.
+
+Every model call goes to a deterministic MockLM, so the numbers measure kg-gen's own
+overhead (prompt formatting, parsing, scheduling, set bookkeeping) plus whatever
+latency is injected with --latency. Results are written as JSON so runs from
+different commits can be compared with --compare.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.kg_gen import KGGen
+from src.kg_gen.models import Graph, merge
+from src.kg_gen.steps._3_cluster_graph import cluster_graph
+from src.kg_gen.utils.http_pool import PooledOpenAI
+from src.kg_gen.utils.triage import ChunkTriage
+from tests.mock_lm import MockLM
+from tests.mock_server import MockServer
+
+TEXT_SIZES = [2_000, 8_000, 32_000]
+ESSAY_COUNTS = [1, 5, 20]
+CLUSTER_SIZES = [50, 200, 800]
+AGGREGATE_SIZES = [10, 100, 1_000]
+QUERY_SIZES = [10_000, 100_000]
+QUERY_COUNT = 1_000
+DIFF_SIZES = [100_000, 1_000_000]
+DIFF_CHANGE = 0.05
+TRIAGE_CHUNK_SIZE = 1_000
+HTTP_WORKERS = 8
+HTTP_SENTENCES = 400
+CHUNK_SIZE = 2_000
+
+NOUNS = [
+  "cat", "dog", "bird", "tree", "river", "city", "planet", "engine", "market", "garden",
+  "library", "bridge", "forest", "signal", "protein", "galaxy", "harbor", "village", "machine", "theory",
+]
+VERBS = ["like", "chase", "feed", "build", "visit", "study", "watch", "carry", "follow", "support"]
+
+
+def git_commit() -> str:
+  try:
+    return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return "unknown"
+
+
+def synthetic_graph(n_entities: int, n_relations: int, seed: int = 0) -> Graph:
+  """Graph whose entity and edge names come in singular/plural pairs, so clustering has work to do."""
+  rng = random.Random(seed)
+  entities = []
+  for i in range(n_entities // 2 + 1):
+    base = f"{NOUNS[i % len(NOUNS)]} {i // len(NOUNS)}" if i >= len(NOUNS) else NOUNS[i]
+    entities.extend([base, base + "s"])
+  entities = entities[:n_entities]
+  edges = VERBS + [verb + "s" for verb in VERBS]
+  relations = {
+    (rng.choice(entities), rng.choice(edges), rng.choice(entities))
+    for _ in range(n_relations)
+  }
+  return Graph(entities=set(entities), edges=set(edges), relations=relations)
+
+
+def sparse_graph(n_entities: int, seed: int = 0) -> Graph:
+  """Graph whose names share no normal form, so clustering finds nothing to merge."""
+  rng = random.Random(seed)
+  entities = [f"entity {i}" for i in range(n_entities)]
+  relations = {(rng.choice(entities), rng.choice(VERBS), rng.choice(entities)) for _ in range(n_entities * 2)}
+  return Graph(entities=set(entities), edges=set(VERBS), relations=relations)
+
+
+def measure(lm: MockLM, fn) -> dict:
+  calls, history = lm.calls, len(lm.history)
+  start = time.perf_counter()
+  result = fn()
+  seconds = time.perf_counter() - start
+  usage = [entry["usage"] for entry in lm.history[history:]]
+  return {
+    "seconds": round(seconds, 4),
+    "llm_calls": lm.calls - calls,
+    "prompt_tokens": sum(u["prompt_tokens"] for u in usage),
+    "completion_tokens": sum(u["completion_tokens"] for u in usage),
+    "entities": len(result.entities),
+    "relations": len(result.relations),
+  }
+
+
+def bench_generate_text(kg: KGGen, lm: MockLM) -> list[dict]:
+  results = []
+  for path in sorted(glob.glob(os.path.join(ROOT, "tests", "data", "*.txt"))):
+    with open(path, "r", encoding="utf-8") as f:
+      text = f.read()
+    for size in TEXT_SIZES + [len(text)]:
+      if size > len(text):
+        continue
+      row = measure(lm, lambda: kg.generate(input_data=text[:size], chunk_size=CHUNK_SIZE))
+      row.update(benchmark="generate", input=os.path.basename(path), size=size)
+      row["chars_per_second"] = round(size / row["seconds"], 1) if row["seconds"] else None
+      results.append(row)
+  return results
+
+
+def bench_generate_essays(kg: KGGen, lm: MockLM) -> list[dict]:
+  with open(os.path.join(ROOT, "MINE", "essays.json"), "r", encoding="utf-8") as f:
+    essays = [essay["content"] for essay in json.load(f)]
+  results = []
+  for count in ESSAY_COUNTS:
+    batch = essays[:count]
+    row = measure(lm, lambda: kg.aggregate([kg.generate(input_data=essay) for essay in batch]))
+    row.update(benchmark="generate_essays", input="MINE/essays.json", size=count)
+    row["chars_per_second"] = round(sum(map(len, batch)) / row["seconds"], 1) if row["seconds"] else None
+    results.append(row)
+  return results
+
+
+def bench_cluster(kg: KGGen, lm: MockLM) -> list[dict]:
+  results = []
+  for size in CLUSTER_SIZES:
+    graph = synthetic_graph(size, size * 2, seed=size)
+    row = measure(lm, lambda: cluster_graph(kg.dspy, graph))
+    row.update(benchmark="cluster_graph", input="synthetic", size=size)
+    results.append(row)
+    graph = sparse_graph(size, seed=size)
+    row = measure(lm, lambda: cluster_graph(kg.dspy, graph))
+    row.update(benchmark="cluster_graph", input="synthetic_sparse", size=size)
+    results.append(row)
+  return results
+
+
+def bench_aggregate(kg: KGGen, lm: MockLM) -> list[dict]:
+  results = []
+  for size in AGGREGATE_SIZES:
+    graphs = [synthetic_graph(200, 500, seed=i) for i in range(size)]
+    row = measure(lm, lambda: kg.aggregate(graphs))
+    row.update(benchmark="aggregate", input="synthetic", size=size)
+    results.append(row)
+  return results
+
+
+def bench_graph_queries(kg: KGGen, lm: MockLM) -> list[dict]:
+  results = []
+  for size in QUERY_SIZES:
+    graph = synthetic_graph(size // 5, size, seed=size)
+    seeds = sorted(graph.entities)[:QUERY_COUNT]
+    start = time.perf_counter()
+    graph.index
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    reached = sum(len(graph.neighborhood([seed], k=2)) for seed in seeds)
+    queries = time.perf_counter() - start
+    results.append({
+      "benchmark": "graph_queries",
+      "input": "synthetic",
+      "size": size,
+      "seconds": round(build + queries, 4),
+      "index_build_seconds": round(build, 4),
+      "ms_per_2_hop_query": round(queries / len(seeds) * 1000, 4),
+      "llm_calls": 0,
+      "relations_reached": reached,
+    })
+  return results
+
+
+def bench_graph_diff(kg: KGGen, lm: MockLM) -> list[dict]:
+  results = []
+  for size in DIFF_SIZES:
+    base = synthetic_graph(size // 5, size, seed=size)
+    # Replace DIFF_CHANGE of the relations, as an incremental run would
+    rng = random.Random(size)
+    dropped = set(rng.sample(sorted(base.relations), int(size * DIFF_CHANGE)))
+    entities, edges = sorted(base.entities), sorted(base.edges)
+    added = {(rng.choice(entities), rng.choice(edges), rng.choice(entities)) for _ in range(len(dropped))}
+    new = Graph(entities=base.entities, edges=base.edges, relations=(base.relations - dropped) | added)
+    base.index, new.index
+    start = time.perf_counter()
+    delta = base.diff(new)
+    diff_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    merged = merge(base, delta)
+    merge_seconds = time.perf_counter() - start
+    assert merged.relations == new.relations
+    results.append({
+      "benchmark": "graph_diff",
+      "input": "synthetic",
+      "size": len(base.relations),
+      "seconds": round(diff_seconds + merge_seconds, 4),
+      "diff_seconds": round(diff_seconds, 4),
+      "merge_seconds": round(merge_seconds, 4),
+      "llm_calls": 0,
+      "delta_relations": len(delta.added_relations) + len(delta.removed_relations),
+      "delta_json_bytes": len(json.dumps(delta.to_compact(), separators=(",", ":"))),
+    })
+  return results
+
+
+def bench_triage(kg: KGGen, lm: MockLM) -> list[dict]:
+  """LLM calls saved versus triples lost by chunk triage, per corpus."""
+  corpora = []
+  for path in sorted(glob.glob(os.path.join(ROOT, "tests", "data", "*.txt")) + glob.glob(os.path.join(ROOT, "tests", "data", "*.md"))):
+    with open(path, "r", encoding="utf-8") as f:
+      corpora.append((os.path.basename(path), [f.read()]))
+  with open(os.path.join(ROOT, "MINE", "essays.json"), "r", encoding="utf-8") as f:
+    corpora.append(("MINE/essays.json", [essay["content"] for essay in json.load(f)]))
+
+  results = []
+  for name, documents in corpora:
+    calls = lm.calls
+    plain = list(kg.generate_many(documents, chunk_size=TRIAGE_CHUNK_SIZE))
+    plain_calls = lm.calls - calls
+    triage = ChunkTriage()
+    triaged = []
+    def run():
+      triaged.extend(kg.generate_many(documents, chunk_size=TRIAGE_CHUNK_SIZE, triage=triage))
+      return kg.aggregate(triaged)
+    row = measure(lm, run)
+    row.update(
+      benchmark="triage", input=name, size=sum(map(len, documents)), chunks=triage.checked,
+      skipped_chunks=triage.skipped, downgraded_chunks=triage.downgraded, calls_saved=plain_calls - row["llm_calls"],
+      triples_total=sum(len(graph.relations) for graph in plain),
+      triples_lost=sum(len(before.relations - after.relations) for before, after in zip(plain, triaged)),
+    )
+    results.append(row)
+  return results
+
+
+def bench_http_pool(kg: KGGen, lm: MockLM) -> list[dict]:
+  """Per-call overhead of the HTTP stack against a local OpenAI-compatible stand-in server."""
+  text = " ".join(f"{NOUNS[i % len(NOUNS)].title()}{i} knows {NOUNS[(i + 1) % len(NOUNS)].title()}{i + 1}." for i in range(HTTP_SENTENCES))
+  results = []
+  for mode in ("litellm default", "no keep-alive", "pooled"):
+    with MockServer() as server:
+      environ = {key: os.environ.get(key) for key in ("OPENAI_API_BASE", "OPENAI_API_KEY")}
+      os.environ.update(OPENAI_API_BASE=server.url, OPENAI_API_KEY="local")
+      try:
+        pooled = KGGen(model="openai/stand-in", max_workers=HTTP_WORKERS)
+        pooled.lm.cache = False
+        if mode == "litellm default":
+          del pooled.lm.kwargs["client"]
+        elif mode == "no keep-alive":
+          client = httpx.Client(limits=httpx.Limits(max_keepalive_connections=0))
+          pooled.lm.kwargs["client"] = PooledOpenAI(api_key="local", base_url=server.url, http_client=client)
+        # Warm up imports and litellm's client cache before timing
+        pooled.generate(input_data="Warm Up knows Stand In.")
+        requests, connections = server.requests, server.connections
+        start = time.perf_counter()
+        graph = pooled.generate(input_data=text, chunk_size=CHUNK_SIZE // 10)
+        seconds = time.perf_counter() - start
+        pooled.close()
+        requests, connections = server.requests - requests, server.connections - connections
+      finally:
+        for key, value in environ.items():
+          if value is None:
+            os.environ.pop(key, None)
+          else:
+            os.environ[key] = value
+    results.append({
+      "benchmark": "http_pool",
+      "input": mode,
+      "size": requests,
+      "seconds": round(seconds, 4),
+      "llm_calls": requests,
+      "connections": connections,
+      "ms_per_call": round(seconds / requests * HTTP_WORKERS * 1000, 3),
+      "relations": len(graph.relations),
+    })
+  return results
+
+
+BENCHMARKS = {
+  "generate": bench_generate_text,
+  "generate_essays": bench_generate_essays,
+  "cluster_graph": bench_cluster,
+  "aggregate": bench_aggregate,
+  "graph_queries": bench_graph_queries,
+  "graph_diff": bench_graph_diff,
+  "triage": bench_triage,
+  "http_pool": bench_http_pool,
+}
+
+
+def compare(old_path: str, new_path: str):
+  with open(old_path) as f:
+    old = {(r["benchmark"], r["input"], r["size"]): r for r in json.load(f)["results"]}
+  with open(new_path) as f:
+    new = json.load(f)["results"]
+  print(f"{'benchmark':<18}{'input':<30}{'size':>8}{'old s':>10}{'new s':>10}{'change':>9}{'calls':>12}")
+  for row in new:
+    key = (row["benchmark"], row["input"], row["size"])
+    if key not in old:
+      continue
+    before, after = old[key]["seconds"], row["seconds"]
+    change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+    calls = f"{old[key]['llm_calls']}->{row['llm_calls']}"
+    print(f"{key[0]:<18}{key[1]:<30}{key[2]:>8}{before:>10.3f}{after:>10.3f}{change:>9}{calls:>12}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Run kg-gen benchmarks against a deterministic mock LM.")
+  parser.add_argument("--latency", type=float, default=0.0, help="Seconds of simulated latency per LM call.")
+  parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Subset of benchmarks to run.")
+  parser.add_argument("--output", type=str, default=None, help="Path of the JSON results file.")
+  parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two results files and exit.")
+  args = parser.parse_args()
+
+  if args.compare:
+    compare(*args.compare)
+    return
+
+  lm = MockLM(latency=args.latency)
+  kg = KGGen(lm=lm)
+  commit = git_commit()
+  results = []
+  for name in args.only or BENCHMARKS:
+    print(f"Running {name}...")
+    results.extend(BENCHMARKS[name](kg, lm))
+
+  output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{commit}.json")
+  os.makedirs(os.path.dirname(output), exist_ok=True)
+  with open(output, "w") as f:
+    json.dump({
+      "commit": commit,
+      "timestamp": datetime.now().isoformat(),
+      "python": platform.python_version(),
+      "latency": args.latency,
+      "results": results,
+    }, f, indent=2)
+  print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+  main()
@@ -1,2 +1,4 @@
 from .kg_gen import KGGen 
-from .models import Graph
\ No newline at end of file
+from .models import Graph, GraphDelta, ClusterMap, RunStats, merge
+from .utils.retriever import GraphRetriever
+from .utils.planning import Plan, PlanAssumptions
@@ -0,0 +1,274 @@
+"""kg-gen command line interface for batch extraction over a corpus.
+
+  kg-gen corpus/ -o out/ --chunk-size 5000 --workers 16 --cluster --format ntriples
+
+Every document's graph is written to out/documents/ as soon as it is extracted, so an
+interrupted run picks up where it stopped when started again with the same arguments.
+The arguments that shape a document's graph are saved to out/run.json, and resuming with
+different ones is refused rather than mixing graphs from both (see --no-resume).
+The combined graph is written in the requested format and run counters to out/stats.json.
+With --plan, nothing is extracted: the estimated calls, tokens, cost and time are printed
+and saved to out/plan.json, and a later real run reports its actual usage against them.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from typing import Iterator, Optional, Union
+from urllib.parse import quote
+
+from .kg_gen import KGGen
+from .models import Graph, RunStats
+from .utils.planning import Plan
+from .utils.triage import DEFAULT_THRESHOLD, ChunkTriage
+from .utils.export import write_neo4j_csv, write_ntriples, write_turtle
+
+FORMATS = ("json", "neo4j", "ntriples", "turtle")
+DOCUMENTS_DIR = "documents"
+PLAN_FILE = "plan.json"
+RUN_FILE = "run.json"
+# Arguments that change a document's graph, so outputs of a run with other values can't be resumed
+EXTRACTION_ARGS = (
+  "model", "temperature", "structured", "chunk_size", "pack_tokens", "deduplicate", "triage", "triage_threshold", "context",
+)
+
+Document = Union[str, list[dict]]
+
+
+def iter_documents(path: str) -> Iterator[tuple[str, Document]]:
+  """(id, document) pairs from a directory (one document per file, in sorted order), a
+  JSONL file of {"id", "text"} or {"id", "messages"} records, or a single text file.
+
+  A JSONL record without an id is identified by a hash of its document, so ids stay the
+  same when lines are added or moved between runs; repeats of the same document are told
+  apart by a "-2", "-3"... suffix. Raises ValueError on a repeated explicit id, which
+  would otherwise overwrite another document's output."""
+  if os.path.isdir(path):
+    for root, dirs, files in os.walk(path):
+      dirs.sort()
+      for name in sorted(files):
+        file_path = os.path.join(root, name)
+        with open(file_path, "r", encoding="utf-8") as f:
+          yield os.path.relpath(file_path, path), f.read()
+  elif path.endswith(".jsonl"):
+    seen, occurrences = {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+      for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+          continue
+        record = json.loads(line)
+        document = record.get("messages", record.get("text"))
+        if document is None:
+          raise ValueError(f"{path}:{line_number}: record needs a 'text' or 'messages' field")
+        if "id" in record:
+          document_id = str(record["id"])
+        else:
+          document_id = content_id(document)
+          occurrences[document_id] = occurrences.get(document_id, 0) + 1
+          if occurrences[document_id] > 1:
+            document_id += f"-{occurrences[document_id]}"
+        if document_id in seen:
+          raise ValueError(f"{path}:{line_number}: id {document_id!r} repeats the record on line {seen[document_id]}")
+        seen[document_id] = line_number
+        yield document_id, document
+  else:
+    with open(path, "r", encoding="utf-8") as f:
+      yield os.path.basename(path), f.read()
+
+
+def content_id(document: Document) -> str:
+  return hashlib.sha1(json.dumps(document, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def count_documents(path: str) -> int:
+  if os.path.isdir(path):
+    return sum(len(files) for _, _, files in os.walk(path))
+  if path.endswith(".jsonl"):
+    # Reads every record, so a bad or repeated id fails before any extraction
+    return sum(1 for _ in iter_documents(path))
+  return 1
+
+
+def document_path(output: str, document_id: str) -> str:
+  return os.path.join(output, DOCUMENTS_DIR, quote(document_id, safe="") + ".json")
+
+
+def write_json(path: str, data: str):
+  # Write then rename, so an interrupted run never leaves a truncated file to resume from
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    f.write(data)
+  os.replace(tmp_path, path)
+
+
+def write_graph(graph: Graph, output: str, output_format: str) -> str:
+  if output_format == "neo4j":
+    write_neo4j_csv(graph, os.path.join(output, "neo4j"))
+    return os.path.join(output, "neo4j")
+  if output_format == "ntriples":
+    path = os.path.join(output, "graph.nt")
+    write_ntriples(graph, path)
+    return path
+  if output_format == "turtle":
+    path = os.path.join(output, "graph.ttl")
+    write_turtle(graph, path)
+    return path
+  path = os.path.join(output, "graph.json")
+  write_json(path, graph.model_dump_json())
+  return path
+
+
+def build_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(
+    prog="kg-gen",
+    description="Extract knowledge graphs from a directory, JSONL file or text file of documents.",
+  )
+  parser.add_argument("input", help="Directory (one document per file), JSONL file or text file.")
+  parser.add_argument("-o", "--output", required=True, help="Output directory.")
+  parser.add_argument("--model", default="openai/gpt-4o", help="Model name, e.g. openai/gpt-4o.")
+  parser.add_argument("--api-key", default=None, help="API key; defaults to the provider's environment variable.")
+  parser.add_argument("--temperature", type=float, default=0.0)
+  parser.add_argument("--workers", type=int, default=None, help="Max chunks extracted concurrently.")
+  parser.add_argument("--hedge", action="store_true", help="Re-send LLM calls slower than the run's p95 latency (max 5%% extra calls).")
+  parser.add_argument("--structured", action="store_true", help="Request JSON output and re-ask only for fields that fail validation.")
+  parser.add_argument("--cache-dir", default=None, help="Directory for the on-disk LLM response cache.")
+  parser.add_argument("--chunk-size", type=int, default=5000, help="Max chunk size in characters (0 to send documents whole).")
+  parser.add_argument("--pack-tokens", type=int, default=None, help="Pack small documents/chunks into requests of up to this many tokens.")
+  parser.add_argument("--deduplicate", action="store_true", help="Reuse results of repeated or near-identical chunks.")
+  parser.add_argument("--triage", action="store_true", help="Skip chunks unlikely to yield triples (tables, link lists, code).")
+  parser.add_argument("--triage-threshold", type=float, default=DEFAULT_THRESHOLD, help="Min triage score of a chunk sent to the LLM.")
+  parser.add_argument("--context", default="", help="Description of the data, given to the extraction prompts and clustering.")
+  parser.add_argument("--cluster", action="store_true", help="Cluster the combined graph.")
+  parser.add_argument("--cluster-map", default=None, help="JSON cluster map to reuse and extend across runs.")
+  parser.add_argument("--format", choices=FORMATS, default="json", help="Format of the combined graph.")
+  parser.add_argument("--plan", action="store_true", help="Only estimate LLM calls, tokens, cost and time; call no model.")
+  parser.add_argument("--no-resume", action="store_true", help="Re-extract documents that already have output.")
+  parser.add_argument("--quiet", action="store_true", help="Don't report progress.")
+  return parser
+
+
+def set_cache_dir(cache_dir: str):
+  """Point the LLM response cache (litellm's disk cache, used by dspy.LM) at cache_dir."""
+  import litellm
+  from litellm.caching import Cache
+  os.makedirs(cache_dir, exist_ok=True)
+  litellm.cache = Cache(disk_cache_dir=cache_dir, type="disk")
+
+
+def check_run_args(args: argparse.Namespace) -> Optional[str]:
+  """Save the extraction arguments to the output directory. Returns the arguments that
+  differ from the saved ones of an earlier run being resumed, if any (and saves nothing)."""
+  path = os.path.join(args.output, RUN_FILE)
+  run_args = {name: getattr(args, name) for name in EXTRACTION_ARGS}
+  if not args.no_resume and os.path.exists(path):
+    with open(path, "r", encoding="utf-8") as f:
+      saved = json.load(f)
+    changed = [name for name in EXTRACTION_ARGS if saved.get(name) != run_args[name]]
+    if changed:
+      return ", ".join("--" + name.replace("_", "-") for name in changed)
+  write_json(path, json.dumps(run_args, indent=2))
+  return None
+
+
+def main(argv: Optional[list[str]] = None, lm=None) -> int:
+  """Run the CLI. lm replaces the model built from --model, e.g. a MockLM in tests."""
+  parser = build_parser()
+  args = parser.parse_args(argv)
+  log = (lambda message: None) if args.quiet else (lambda message: print(message, file=sys.stderr, flush=True))
+
+  if args.cache_dir:
+    set_cache_dir(args.cache_dir)
+  os.makedirs(os.path.join(args.output, DOCUMENTS_DIR), exist_ok=True)
+  kg = KGGen(
+    model=args.model, temperature=args.temperature, api_key=args.api_key, lm=lm,
+    max_workers=args.workers, hedge=args.hedge, structured=args.structured,
+  )
+
+  if args.plan:
+    plan = kg.plan(
+      (document for _, document in iter_documents(args.input)), chunk_size=args.chunk_size or None,
+      context=args.context, cluster=args.cluster, pack_tokens=args.pack_tokens,
+    )
+    write_json(os.path.join(args.output, PLAN_FILE), plan.model_dump_json(indent=2))
+    print(plan.report())
+    return 0
+
+  changed = check_run_args(args)
+  if changed:
+    parser.error(
+      f"{args.output} holds documents extracted with a different {changed}; rerun with the same "
+      "arguments to resume, or pass --no-resume to extract every document again"
+    )
+  stats = RunStats()
+  start = time.perf_counter()
+  total = count_documents(args.input)
+  entities, edges, relations = set(), set(), set()
+  pending_ids = deque()
+
+  def add(graph: Graph):
+    entities.update(graph.entities)
+    edges.update(graph.edges)
+    relations.update(graph.relations)
+
+  def documents():
+    for document_id, document in iter_documents(args.input):
+      path = document_path(args.output, document_id)
+      if not args.no_resume and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+          add(Graph.model_validate_json(f.read()))
+        stats.skipped_documents += 1
+        continue
+      pending_ids.append(document_id)
+      yield document
+
+  graphs = kg.generate_many(
+    documents(), chunk_size=args.chunk_size or None, context=args.context, deduplicate=args.deduplicate,
+    triage=ChunkTriage(threshold=args.triage_threshold) if args.triage else False, pack_tokens=args.pack_tokens,
+    stats=stats,
+  )
+  for graph in graphs:
+    document_id = pending_ids.popleft()
+    write_json(document_path(args.output, document_id), graph.model_dump_json())
+    add(graph)
+    done = stats.documents + stats.skipped_documents
+    log(
+      f"[{done}/{total}] {document_id}: {len(graph.entities)} entities, {len(graph.relations)} relations "
+      f"({stats.seconds:.1f}s, {stats.llm_calls} LLM calls, {stats.prompt_tokens + stats.completion_tokens} tokens)"
+    )
+  if stats.skipped_documents:
+    log(f"Resumed: {stats.skipped_documents} documents already extracted")
+  if stats.skipped_chunks:
+    log(f"Deduplicated: {stats.skipped_chunks} repeated chunks reused instead of extracted")
+  if stats.triaged_chunks or stats.downgraded_chunks:
+    log(f"Triaged: {stats.triaged_chunks} chunks skipped, {stats.downgraded_chunks} without a relation call")
+  if kg.adapter is not None and kg.adapter.stats.calls:
+    log(
+      f"Structured output: {stats.parse_failures} answers needed repair ({kg.adapter.stats.failure_rate:.1%}), "
+      f"{stats.retry_tokens_saved} tokens saved (est.) over retrying whole calls"
+    )
+
+  combined = Graph(entities=entities, edges=edges, relations=relations)
+  if args.cluster:
+    history = len(kg.dspy.settings.lm.history)
+    combined = kg.cluster(combined, context=args.context, cluster_map=args.cluster_map)
+    stats.record_lm(kg.dspy.settings.lm, history)
+
+  path = write_graph(combined, args.output, args.format)
+  stats.seconds = round(time.perf_counter() - start, 3)
+  write_json(os.path.join(args.output, "stats.json"), stats.model_dump_json(indent=2))
+  plan_path = os.path.join(args.output, PLAN_FILE)
+  if os.path.exists(plan_path):
+    with open(plan_path, "r", encoding="utf-8") as f:
+      log(Plan.model_validate_json(f.read()).report(stats))
+  log(
+    f"Wrote {len(combined.entities)} entities and {len(combined.relations)} relations to {path} "
+    f"({stats.documents} documents extracted, {stats.chunks} chunks, {stats.llm_calls} LLM calls)"
+  )
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,22 +1,40 @@
-from typing import Union, List, Dict, Optional
+from typing import Union, List, Dict, Optional, Iterable, Iterator, Callable
 from openai import OpenAI
 
-from .steps._1_get_entities import get_entities
-from .steps._2_get_relations import get_relations
-from .steps._3_cluster_graph import cluster_graph
-from .utils.chunk_text import chunk_text
-from .models import Graph
+from .steps._1_get_entities import get_entities, get_entities_packed
+from .steps._2_get_relations import get_relations, get_relations_packed, RelationFilterStats
+from .steps._3_cluster_graph import cluster_graph, ClusterProgress
+from .utils.chunk_text import chunk_text, iter_chunks, iter_file_chunks
+from .utils.chunk_conversation import chunk_conversation, format_turns
+from .utils.entity_registry import EntityRegistry
+from .utils.dedup import ChunkDeduplicator
+from .utils.batch import BatchJob
+from .utils.hedging import HedgedLM
+from .utils.http_pool import openai_client, pooled_http_client
+from .utils.packing import estimate_tokens, pack_items
+from .utils.planning import Plan, PlanAssumptions, Planner
+from .utils.triage import ChunkTriage
+from .utils.structured import StructuredAdapter
+from .utils.provenance import Provenance, ProvenanceBuilder, relation_span
+from .models import Graph, ClusterMap, RunStats
 import dspy
 import json
 import os
-from concurrent.futures import ThreadPoolExecutor
+import time
+from collections import deque
+from itertools import chain
+from concurrent.futures import Future, ThreadPoolExecutor
   
 class KGGen:
   def __init__(
     self,
     model: str = "openai/gpt-4o",
     temperature: float = 0.0,
-    api_key: str = None
+    api_key: str = None,
+    lm: Optional[dspy.LM] = None,
+    max_workers: Optional[int] = None,
+    hedge: bool = False,
+    structured: Union[bool, StructuredAdapter] = False
   ):
     """Initialize KGGen with optional model configuration
     
@@ -24,18 +42,35 @@ class KGGen:
         model: Name of model to use (e.g. 'gpt-4')
         temperature: Temperature for model sampling
         api_key: API key for model access
+        lm: Prebuilt dspy LM to use instead of one built from model (e.g. a MockLM)
+        max_workers: Max number of chunks extracted concurrently (ThreadPoolExecutor default if None)
+        hedge: Wrap the LM in a HedgedLM, which re-sends calls slower than the run's p95
+            latency (at most 5% extra calls). Pass lm=HedgedLM(...) to tune the policy
+        structured: Request JSON output (schema-constrained where the model supports it)
+            through a StructuredAdapter, which validates answers locally and re-asks only
+            for fields that fail instead of retrying the call. Pass an instance to tune it
+    
+    Models served through an OpenAI-compatible API share one keep-alive connection pool,
+    kg.http_client, sized to max_workers (doubled with hedge). Call close() to release it.
     """
     self.dspy = dspy
     self.model = model
     self.temperature = temperature
     self.api_key = api_key
-    self.init_model(model, temperature, api_key)
+    self.max_workers = max_workers
+    self.hedge = hedge
+    self.http_client = None
+    self.adapter = self._resolve_adapter(structured)
+    # Running totals of triples repaired onto or dropped for not matching an extracted entity
+    self.relation_stats = RelationFilterStats()
+    self.init_model(model, temperature, api_key, lm=lm)
       
   def init_model(
     self,
     model: str = None,
     temperature: float = None,
     api_key: str = None,
+    lm: Optional[dspy.LM] = None,
   ):
     """Initialize or reinitialize the model with new parameters
     
@@ -43,6 +78,7 @@ class KGGen:
         model: Name of model to use (e.g. 'gpt-4')
         temperature: Temperature for model sampling
         api_key: API key for model access
+        lm: Prebuilt dspy LM to use instead of one built from model
     """
     # Update instance variables if new values provided
     if model is not None:
@@ -53,12 +89,20 @@ class KGGen:
       self.api_key = api_key
       
     # Initialize dspy LM with current settings
-    if self.api_key:
-      self.lm = dspy.LM(model=self.model, api_key=self.api_key, temperature=self.temperature)
+    if lm is not None:
+      self.lm = lm
     else:
-      self.lm = dspy.LM(model=self.model, temperature=self.temperature)
+      kwargs = {"api_key": self.api_key} if self.api_key else {}
+      client = self._openai_client()
+      if client is not None:
+        # api_base keeps litellm's response cache, which ignores client, apart per endpoint
+        kwargs["client"] = client
+        kwargs["api_base"] = str(client.base_url)
+      self.lm = dspy.LM(model=self.model, temperature=self.temperature, **kwargs)
+    if self.hedge and not isinstance(self.lm, HedgedLM):
+      self.lm = HedgedLM(self.lm)
       
-    self.dspy.configure(lm=self.lm)
+    self.dspy.configure(lm=self.lm, adapter=self.adapter)
     
   def generate(
     self,
@@ -73,6 +117,11 @@ class KGGen:
     chunk_size: Optional[int] = None,
     cluster: bool = False,
     temperature: float = None,
+    overlap_turns: int = 0,
+    entity_registry: Union[bool, EntityRegistry] = False,
+    deduplicate: Union[bool, ChunkDeduplicator] = False,
+    triage: Union[bool, ChunkTriage] = False,
+    provenance: bool = False,
     # node_labels: Optional[List[str]] = None,
     # edge_labels: Optional[List[str]] = None,
     # ontology: Optional[List[Tuple[str, str, str]]] = None,
@@ -85,7 +134,19 @@ class KGGen:
         model: Name of OpenAI model to use
         api_key (str): OpenAI API key for making model calls
         chunk_size: Max size of text chunks in characters to process
-        context: Description of data context
+        context: Description of data context, given to the extraction prompts and clustering
+        overlap_turns: For message lists, trailing turns of each chunk repeated in the next
+        entity_registry: With chunk_size, share entity names across chunks. True for a fresh
+            EntityRegistry, or pass one to reuse it across runs
+        deduplicate: With chunk_size, reuse the result of an identical or near-identical
+            chunk instead of extracting it again. True for a fresh ChunkDeduplicator, or
+            pass one to reuse results across runs; its skipped counts the chunks saved
+        triage: With chunk_size, score each chunk locally and skip those unlikely to yield
+            triples (tables, link lists, code) without any LLM call, and skip the relation
+            call when fewer than two entities were found. True for a ChunkTriage with default
+            threshold, or pass one to tune it and read its skipped and downgraded counts
+        provenance: Record the chunk id and character span each relation came from, see
+            Graph.sources. Without chunk_size the whole input is chunk 0
         example_relations: Example relationship tuples
         node_labels: Valid node label strings
         edge_labels: Valid edge label strings
@@ -99,16 +160,8 @@ class KGGen:
     # Process input data
     is_conversation = isinstance(input_data, list)
     if is_conversation:
-      # Extract text from messages
-      text_content = []
-      for message in input_data:
-        if not isinstance(message, dict) or 'role' not in message or 'content' not in message:
-          raise ValueError("Messages must be dicts with 'role' and 'content' keys")
-        if message['role'] in ['user', 'assistant']:
-          text_content.append(f"{message['role']}: {message['content']}")
-      
       # Join with newlines to preserve message boundaries
-      processed_input = "\n".join(text_content)
+      processed_input = "\n".join(format_turns(input_data))
     else:
       processed_input = input_data
 
@@ -119,33 +172,583 @@ class KGGen:
         api_key=api_key or self.api_key
       )
     
+    sources = ProvenanceBuilder() if provenance else None
     if not chunk_size:
-      entities = get_entities(self.dspy, processed_input, is_conversation=is_conversation)
-      relations = get_relations(self.dspy, processed_input, entities, is_conversation=is_conversation)
+      entities = get_entities(self.dspy, processed_input, is_conversation=is_conversation, context=context)
+      relations = get_relations(
+        self.dspy, processed_input, entities, is_conversation=is_conversation, stats=self.relation_stats, context=context
+      )
+      if sources is not None:
+        sources.add(0, relations, [relation_span(processed_input, r) for r in relations])
     else:
-      chunks = chunk_text(processed_input, chunk_size)
+      if is_conversation:
+        # Pack whole turns so no message is split mid-way and speakers stay attached
+        chunks = chunk_conversation(input_data, chunk_size, overlap_turns)
+      else:
+        chunks = chunk_text(processed_input, chunk_size)
       entities = set()
       relations = set()
 
-      def process_chunk(chunk):
-        chunk_entities = get_entities(self.dspy, chunk, is_conversation=is_conversation)
-        chunk_relations = get_relations(self.dspy, chunk, chunk_entities, is_conversation=is_conversation)
-        return chunk_entities, chunk_relations
-
-      # Process chunks in parallel using ThreadPoolExecutor
-      with ThreadPoolExecutor() as executor:
-        results = list(executor.map(process_chunk, chunks))
-        
       # Combine results
-      for chunk_entities, chunk_relations in results:
+      results = self._process_chunks(chunks, is_conversation, entity_registry, provenance, deduplicate, context, triage)
+      for chunk_id, (chunk_entities, chunk_relations, spans) in enumerate(results):
         entities.update(chunk_entities)
         relations.update(chunk_relations)
+        if sources is not None:
+          sources.add(chunk_id, chunk_relations, spans)
+    
+    return self._finish_graph(entities, relations, cluster, context, output_folder, sources)
+
+  def update_conversation(
+    self,
+    graph: Optional[Graph],
+    messages: List[Dict],
+    start_turn: int,
+    chunk_size: int = 5000,
+    overlap_turns: int = 1,
+    context: str = "",
+    cluster: bool = False,
+    entity_registry: Union[bool, EntityRegistry] = False,
+    deduplicate: Union[bool, ChunkDeduplicator] = False,
+    triage: Union[bool, ChunkTriage] = False,
+    provenance: bool = False,
+    output_folder: Optional[str] = None
+  ) -> Graph:
+    """Extend a conversation's graph with only the messages appended since it was built.
+    
+    Args:
+        graph: Graph previously generated from messages[:start_turn], or None
+        messages: The full, appended-to message list
+        start_turn: Number of messages already reflected in graph
+        chunk_size: Max size of text chunks in characters to process
+        overlap_turns: Already-processed turns to include before the new ones as context
+        context: Description of data context, given to the extraction prompts and clustering
+        cluster: Whether to cluster the graph after generation
+        entity_registry: Share entity names across chunks, see generate
+        deduplicate: Reuse results of repeated chunks, see generate
+        triage: Skip chunks unlikely to yield triples, see generate
+        provenance: Record relation sources for the new chunks, numbered after the chunks
+            already in graph.provenance. Kept automatically when graph has provenance
+        output_folder: Path to save the resulting graph
+        
+    Returns:
+        The previous graph merged with the graph of the new turns, or graph itself when
+        no messages were appended
+    """
+    if graph is not None and start_turn >= len(messages):
+      return graph
+    new_messages = messages[max(0, start_turn - overlap_turns):]
+    entities = set(graph.entities) if graph else set()
+    relations = set(graph.relations) if graph else set()
+    previous = graph.provenance if graph else None
+    provenance = provenance or previous is not None
+    sources = ProvenanceBuilder(previous.n_chunks if previous else 0) if provenance else None
+    offset = sources.n_chunks if sources else 0
+    chunks = chunk_conversation(new_messages, chunk_size, overlap_turns)
+    results = self._process_chunks(chunks, True, entity_registry, provenance, deduplicate, context, triage)
+    for chunk_id, (chunk_entities, chunk_relations, spans) in enumerate(results, offset):
+      entities.update(chunk_entities)
+      relations.update(chunk_relations)
+      if sources is not None:
+        sources.add(chunk_id, chunk_relations, spans)
+
+    return self._finish_graph(entities, relations, cluster, context, output_folder, sources, graph)
+
+  def generate_stream(
+    self,
+    source: Union[str, os.PathLike, Iterable[str]],
+    chunk_size: int = 5000,
+    context: str = "",
+    cluster: bool = False,
+    entity_registry: Union[bool, EntityRegistry] = False,
+    deduplicate: Union[bool, ChunkDeduplicator] = False,
+    triage: Union[bool, ChunkTriage] = False,
+    provenance: bool = False,
+    output_folder: Optional[str] = None
+  ) -> Graph:
+    """Generate a knowledge graph from a file, a directory or a stream of text pieces.
+    
+    The input is read and chunked incrementally and at most a few chunks per worker are in
+    flight at once, so neither the corpus nor its sentence list is ever fully in memory.
+    
+    Args:
+        source: Path to a file or directory (every file under it, in sorted order), or an
+            iterable of consecutive text pieces such as an open file or sys.stdin
+        chunk_size: Max size of text chunks in characters to process
+        context: Description of data context, given to the extraction prompts and clustering
+        cluster: Whether to cluster the graph after generation
+        entity_registry: Share entity names across chunks, see generate
+        deduplicate: Reuse results of repeated chunks, see generate
+        triage: Skip chunks unlikely to yield triples, see generate
+        provenance: Record the chunk id and character span each relation came from
+        output_folder: Path to save the resulting graph
+        
+    Returns:
+        Generated knowledge graph
+    """
+    if isinstance(source, (str, os.PathLike)):
+      chunks = iter_file_chunks(os.fspath(source), chunk_size)
+    else:
+      chunks = iter_chunks(source, chunk_size)
+
+    entities = set()
+    relations = set()
+    sources = ProvenanceBuilder() if provenance else None
+    results = self._process_chunks(chunks, False, entity_registry, provenance, deduplicate, context, triage)
+    for chunk_id, (chunk_entities, chunk_relations, spans) in enumerate(results):
+      entities.update(chunk_entities)
+      relations.update(chunk_relations)
+      if sources is not None:
+        sources.add(chunk_id, chunk_relations, spans)
+
+    return self._finish_graph(entities, relations, cluster, context, output_folder, sources)
+
+  def generate_many(
+    self,
+    documents: Iterable[Union[str, List[Dict]]],
+    chunk_size: Optional[int] = None,
+    context: str = "",
+    cluster: bool = False,
+    overlap_turns: int = 0,
+    entity_registry: Union[bool, EntityRegistry] = False,
+    deduplicate: Union[bool, ChunkDeduplicator] = False,
+    triage: Union[bool, ChunkTriage] = False,
+    provenance: bool = False,
+    pack_tokens: Optional[int] = None,
+    stats: Optional[RunStats] = None
+  ) -> Iterator[Graph]:
+    """Generate one graph per document, yielding them in input order.
+    
+    The chunks of all documents share one bounded pool of max_workers, so many small
+    documents and a few large ones keep the workers equally busy. Documents are pulled
+    lazily, and each graph is yielded as soon as its last chunk is done.
+    
+    Args:
+        documents: Iterable of text strings or message lists
+        chunk_size: Max size of text chunks in characters; None sends each document whole
+        context: Description of data context, given to the extraction prompts and clustering
+        cluster: Whether to cluster each document's graph
+        overlap_turns: For message lists, trailing turns of each chunk repeated in the next
+        entity_registry: Share entity names across chunks (and documents), see generate
+        deduplicate: Reuse results of repeated chunks (and documents), see generate
+        triage: Skip chunks (and documents) unlikely to yield triples, see generate
+        provenance: Record relation sources, with chunk ids numbered per document
+        pack_tokens: Pack consecutive small chunks (and documents) of up to this many
+            estimated tokens in total into one entity and one relation request. Packed
+            responses are validated per item; invalid ones are redone one chunk at a time.
+            With an entity registry, a packed request lists the known entities once for all its items
+        stats: RunStats to update with document, chunk and LLM usage counters
+        
+    Returns:
+        Iterator over the documents' graphs
+    """
+    registry = self._resolve_registry(entity_registry)
+    deduplicator = self._resolve_deduplicator(deduplicate)
+    skipped = deduplicator.skipped if deduplicator else 0
+    triager = self._resolve_triage(triage)
+    triaged, downgraded = (triager.skipped, triager.downgraded) if triager else (0, 0)
+    repaired, dropped = self.relation_stats.repaired, self.relation_stats.dropped
+    structured = self.adapter.stats if self.adapter else None
+    parse_failures, saved = (structured.parse_failures, structured.retry_tokens_saved) if structured else (0, 0)
+    lm = self.dspy.settings.lm
+    history = len(lm.history) if lm is not None else 0
+    start = time.perf_counter()
+
+    def tasks():
+      for document in documents:
+        is_conversation = isinstance(document, list)
+        chunks = self._chunk_document(document, chunk_size, overlap_turns)
+        if not chunks:
+          yield None, 0, 0, is_conversation, None
+        for chunk_id, chunk in enumerate(chunks):
+          yield chunk, chunk_id, len(chunks), is_conversation, self._claim(deduplicator, chunk, is_conversation, context)
+
+    def extract(task):
+      chunk, _, _, is_conversation, claim = task
+      if chunk is None:
+        return task, ([], [], [])
+      return task, self._extract_chunk(chunk, is_conversation, registry, provenance, claim, context, triager)
+
+    def extract_pack(pack):
+      live = [task for task in pack if task[0] is not None]
+      results = iter(self._extract_pack(
+        [task[0] for task in live], pack[0][3], registry, provenance, [task[4] for task in live], context, triager
+      ) if live else ())
+      return [(task, next(results) if task[0] is not None else ([], [], [])) for task in pack]
+
+    if pack_tokens:
+      packs = pack_items(
+        tasks(), pack_tokens, size=lambda task: estimate_tokens(task[0] or ""), group=lambda task: task[3]
+      )
+      results = chain.from_iterable(self._map_ordered(extract_pack, packs))
+    else:
+      results = self._map_ordered(extract, tasks())
+
+    entities, relations = set(), set()
+    sources = ProvenanceBuilder() if provenance else None
+    for (_, chunk_id, n_chunks, _, _), (chunk_entities, chunk_relations, spans) in results:
+      entities.update(chunk_entities)
+      relations.update(chunk_relations)
+      if sources is not None and n_chunks:
+        sources.add(chunk_id, chunk_relations, spans)
+      if chunk_id < n_chunks - 1:
+        continue
+
+      graph = self._finish_graph(entities, relations, cluster, context, None, sources)
+      if stats is not None:
+        stats.documents += 1
+        stats.chunks += n_chunks
+        stats.entities += len(graph.entities)
+        stats.relations += len(graph.relations)
+        stats.seconds = round(time.perf_counter() - start, 3)
+        if deduplicator is not None:
+          stats.skipped_chunks += deduplicator.skipped - skipped
+          skipped = deduplicator.skipped
+        if triager is not None:
+          stats.triaged_chunks += triager.skipped - triaged
+          stats.downgraded_chunks += triager.downgraded - downgraded
+          triaged, downgraded = triager.skipped, triager.downgraded
+        stats.repaired_relations += self.relation_stats.repaired - repaired
+        stats.dropped_relations += self.relation_stats.dropped - dropped
+        repaired, dropped = self.relation_stats.repaired, self.relation_stats.dropped
+        if structured is not None:
+          stats.parse_failures += structured.parse_failures - parse_failures
+          stats.retry_tokens_saved += structured.retry_tokens_saved - saved
+          parse_failures, saved = structured.parse_failures, structured.retry_tokens_saved
+        if lm is not None:
+          history = stats.record_lm(lm, history)
+      yield graph
+      entities, relations = set(), set()
+      sources = ProvenanceBuilder() if provenance else None
+
+  def plan(
+    self,
+    documents: Union[str, List[Dict], Iterable[Union[str, List[Dict]]]],
+    chunk_size: Optional[int] = None,
+    context: str = "",
+    cluster: bool = False,
+    overlap_turns: int = 0,
+    pack_tokens: Optional[int] = None,
+    assumptions: Optional[PlanAssumptions] = None
+  ) -> Plan:
+    """Estimate the LLM calls, tokens, cost and wall-clock time of a run without calling a model.
+    
+    Documents are chunked exactly as generate_many would chunk them and prompts are
+    tokenized locally; entity and relation counts and per-call latency come from
+    assumptions. Compare the estimate with what a run actually spent via plan.compare(stats).
     
+    Args:
+        documents: One text string or message list, or an iterable of them
+        chunk_size, context, cluster, overlap_turns, pack_tokens: As for generate_many
+        assumptions: Output rates and latency to project with (PlanAssumptions defaults if None)
+        
+    Returns:
+        Plan with extraction and clustering estimates; the time assumes max_workers concurrent chunks
+    """
+    if isinstance(documents, str) or (isinstance(documents, list) and documents and isinstance(documents[0], dict)):
+      documents = [documents]
+    planner = Planner(getattr(self.lm, "model", self.model), context, pack_tokens, assumptions)
+    for document in documents:
+      planner.add_document(self._chunk_document(document, chunk_size, overlap_turns), isinstance(document, list))
+    return planner.plan(cluster=cluster, concurrency=self._worker_count())
+
+  def batch_job(
+    self,
+    documents: Iterable[Union[str, List[Dict]]],
+    chunk_size: Optional[int] = None,
+    context: str = "",
+    overlap_turns: int = 0
+  ) -> BatchJob:
+    """Prepare extraction of documents through a provider's batch endpoint instead of live calls.
+    
+    Documents are chunked exactly as generate_many would chunk them. Export the job's
+    requests with job.export(path), submit the file to the provider, ingest its result
+    file with job.ingest(path), and repeat for the relation stage. job.graphs() then yields
+    one graph per document, as generate_many would. The requests use this KGGen's model and
+    LM settings.
+    
+    Args:
+        documents: Iterable of text strings or message lists
+        chunk_size, context, overlap_turns: As for generate_many
+        
+    Returns:
+        BatchJob with the entity stage ready to export
+    """
+    job = BatchJob(self, context)
+    for document in documents:
+      job.add_document(self._chunk_document(document, chunk_size, overlap_turns), isinstance(document, list))
+    return job
+
+  @staticmethod
+  def _chunk_document(document: Union[str, List[Dict]], chunk_size: Optional[int], overlap_turns: int = 0) -> list[str]:
+    is_conversation = isinstance(document, list)
+    if not chunk_size:
+      return ["\n".join(format_turns(document))] if is_conversation else [document]
+    if is_conversation:
+      return list(chunk_conversation(document, chunk_size, overlap_turns))
+    return chunk_text(document, chunk_size)
+
+  def _process_chunks(
+    self,
+    chunks: Iterable[str],
+    is_conversation: bool,
+    entity_registry: Union[bool, EntityRegistry] = False,
+    provenance: bool = False,
+    deduplicate: Union[bool, ChunkDeduplicator] = False,
+    context: str = "",
+    triage: Union[bool, ChunkTriage] = False
+  ) -> Iterator[tuple[list[str], list[tuple[str, str, str]], Optional[list[tuple[int, int]]]]]:
+    """Extract entities and relations from each chunk in parallel, yielding results in chunk order.
+    
+    Chunks are pulled from the iterable lazily: only a bounded window of submitted chunks
+    (two per worker) is held at a time, so a streaming source is never materialized.
+    With an entity registry, each chunk's prompt lists recently seen canonical entities and
+    its extracted entities are mapped onto known spellings before relation extraction.
+    With a deduplicator, chunks equivalent to an earlier one reuse its result.
+    With triage, chunks it rejects yield empty results without any LLM call.
+    With provenance, each result also carries the character span of every relation within
+    its chunk (None otherwise).
+    """
+    registry = self._resolve_registry(entity_registry)
+    deduplicator = self._resolve_deduplicator(deduplicate)
+    triager = self._resolve_triage(triage)
+    return self._map_ordered(
+      lambda item: self._extract_chunk(item[0], is_conversation, registry, provenance, item[1], context, triager),
+      ((chunk, self._claim(deduplicator, chunk, is_conversation, context)) for chunk in chunks)
+    )
+
+  @staticmethod
+  def _resolve_adapter(structured: Union[bool, StructuredAdapter]) -> Optional[StructuredAdapter]:
+    if structured is True:
+      return StructuredAdapter()
+    if isinstance(structured, StructuredAdapter):
+      return structured
+    return None
+
+  @staticmethod
+  def _resolve_registry(entity_registry: Union[bool, EntityRegistry]) -> Optional[EntityRegistry]:
+    if entity_registry is True:
+      return EntityRegistry()
+    if isinstance(entity_registry, EntityRegistry):
+      return entity_registry
+    return None
+
+  @staticmethod
+  def _resolve_deduplicator(deduplicate: Union[bool, ChunkDeduplicator]) -> Optional[ChunkDeduplicator]:
+    if deduplicate is True:
+      return ChunkDeduplicator()
+    if isinstance(deduplicate, ChunkDeduplicator):
+      return deduplicate
+    return None
+
+  @staticmethod
+  def _resolve_triage(triage: Union[bool, ChunkTriage]) -> Optional[ChunkTriage]:
+    if triage is True:
+      return ChunkTriage()
+    if isinstance(triage, ChunkTriage):
+      return triage
+    return None
+
+  @staticmethod
+  def _claim(
+    deduplicator: Optional[ChunkDeduplicator],
+    chunk: str,
+    is_conversation: bool,
+    context: str
+  ) -> Optional[tuple[Future, bool]]:
+    # Claimed while submitting, in chunk order, so the first of equivalent chunks is the one extracted.
+    # The prompt also depends on the input kind and context, so results are only shared within them
+    if deduplicator is None:
+      return None
+    return deduplicator.claim(chunk, f"{'conversation' if is_conversation else 'text'}\n{context}")
+
+  def _extract_chunk(
+    self,
+    chunk: str,
+    is_conversation: bool,
+    registry: Optional[EntityRegistry],
+    provenance: bool,
+    claim: Optional[tuple[Future, bool]] = None,
+    context: str = "",
+    triage: Optional[ChunkTriage] = None
+  ) -> tuple[list[str], list[tuple[str, str, str]], Optional[list[tuple[int, int]]]]:
+    if claim is not None and not claim[1]:
+      # Submitted after the equivalent chunk, so that one is already running or done
+      chunk_entities, chunk_relations, _ = claim[0].result()
+    else:
+      try:
+        if triage is not None and not triage.keep(chunk):
+          chunk_entities, chunk_relations = [], []
+        else:
+          chunk_entities, chunk_relations = self._extract_kept(chunk, is_conversation, registry, context, triage)
+      except Exception as e:
+        if claim is not None:
+          claim[0].set_exception(e)
+        raise
+      if claim is not None:
+        claim[0].set_result((chunk_entities, chunk_relations, None))
+    spans = [relation_span(chunk, relation) for relation in chunk_relations] if provenance else None
+    return chunk_entities, chunk_relations, spans
+
+  def _extract_kept(
+    self,
+    chunk: str,
+    is_conversation: bool,
+    registry: Optional[EntityRegistry],
+    context: str = "",
+    triage: Optional[ChunkTriage] = None
+  ) -> tuple[list[str], list[tuple[str, str, str]]]:
+    if registry is None:
+      chunk_entities = get_entities(self.dspy, chunk, is_conversation=is_conversation, context=context)
+    else:
+      chunk_entities = get_entities(
+        self.dspy, chunk, is_conversation=is_conversation, known_entities=registry.recent(), context=context
+      )
+      chunk_entities = registry.canonicalize(chunk_entities)
+    if triage is not None and not triage.needs_relations(chunk_entities):
+      return chunk_entities, []
+    chunk_relations = get_relations(
+      self.dspy, chunk, chunk_entities, is_conversation=is_conversation, stats=self.relation_stats, context=context
+    )
+    return chunk_entities, chunk_relations
+
+  def _extract_pack(
+    self,
+    chunks: list[str],
+    is_conversation: bool,
+    registry: Optional[EntityRegistry],
+    provenance: bool,
+    claims: list[Optional[tuple[Future, bool]]],
+    context: str = "",
+    triage: Optional[ChunkTriage] = None
+  ) -> list[tuple[list[str], list[tuple[str, str, str]], Optional[list[tuple[int, int]]]]]:
+    """Extract several chunks with one entity and one relation request.
+    
+    Chunks claimed by an earlier equivalent chunk aren't sent; they reuse its result, which
+    is either in this pack or in one submitted before it. Chunks triage rejects aren't sent either.
+    """
+    todo = [i for i, claim in enumerate(claims) if claim is None or claim[1]]
+    extracted: dict[int, tuple[list[str], list[tuple[str, str, str]]]] = {}
+    if triage is not None:
+      for i in todo:
+        if not triage.keep(chunks[i]):
+          extracted[i] = [], []
+          if claims[i] is not None:
+            claims[i][0].set_result(([], [], None))
+      todo = [i for i in todo if i not in extracted]
+    try:
+      if len(todo) == 1:
+        extracted[todo[0]] = self._extract_kept(chunks[todo[0]], is_conversation, registry, context, triage)
+      elif todo:
+        extracted.update(zip(todo, self._extract_packed([chunks[i] for i in todo], is_conversation, registry, context, triage)))
+    except Exception as e:
+      for i in todo:
+        if claims[i] is not None:
+          claims[i][0].set_exception(e)
+      raise
+    for i in todo:
+      if claims[i] is not None:
+        claims[i][0].set_result((*extracted[i], None))
+
+    results = []
+    for i, chunk in enumerate(chunks):
+      chunk_entities, chunk_relations = extracted[i] if i in extracted else claims[i][0].result()[:2]
+      spans = [relation_span(chunk, relation) for relation in chunk_relations] if provenance else None
+      results.append((chunk_entities, chunk_relations, spans))
+    return results
+
+  def _extract_packed(
+    self,
+    chunks: list[str],
+    is_conversation: bool,
+    registry: Optional[EntityRegistry],
+    context: str = "",
+    triage: Optional[ChunkTriage] = None
+  ) -> list[tuple[list[str], list[tuple[str, str, str]]]]:
+    known_entities = registry.recent() if registry is not None else None
+    entities = get_entities_packed(
+      self.dspy, chunks, is_conversation=is_conversation, known_entities=known_entities, context=context
+    )
+    if entities is None:
+      entities = [
+        get_entities(self.dspy, chunk, is_conversation=is_conversation, known_entities=known_entities, context=context)
+        for chunk in chunks
+      ]
+    if registry is not None:
+      entities = [registry.canonicalize(chunk_entities) for chunk_entities in entities]
+    relations = [[] for _ in chunks]
+    # Chunks with too few entities for a relation are left out of the relation request
+    wanted = [i for i, chunk_entities in enumerate(entities) if triage is None or triage.needs_relations(chunk_entities)]
+    if wanted:
+      packed = get_relations_packed(
+        self.dspy, [chunks[i] for i in wanted], [entities[i] for i in wanted],
+        is_conversation=is_conversation, stats=self.relation_stats, context=context
+      )
+      if packed is None:
+        packed = [
+          get_relations(self.dspy, chunks[i], entities[i], is_conversation=is_conversation, stats=self.relation_stats, context=context)
+          for i in wanted
+        ]
+      for i, chunk_relations in zip(wanted, packed):
+        relations[i] = chunk_relations
+    return list(zip(entities, relations))
+
+  def close(self):
+    """Close the pooled HTTP connections; the LM can't be called afterwards."""
+    if self.http_client is not None:
+      self.http_client.close()
+      self.http_client = None
+
+  def _openai_client(self):
+    # One pool per KGGen, kept across init_model calls and only created for models that use
+    # it. Every worker can have a request in flight, and a hedged one a duplicate as well
+    def pool():
+      if self.http_client is None:
+        self.http_client = pooled_http_client(self._worker_count() * (2 if self.hedge else 1))
+      return self.http_client
+    return openai_client(self.model, pool, api_key=self.api_key)
+
+  def _worker_count(self) -> int:
+    # Same default as ThreadPoolExecutor
+    return self.max_workers or min(32, (os.cpu_count() or 1) + 4)
+
+  def _map_ordered(self, fn, items: Iterable) -> Iterator:
+    """Apply fn to items on a thread pool, yielding results in input order.
+    
+    Items are pulled lazily and at most two per worker are in flight at a time.
+    """
+    max_workers = self._worker_count()
+    max_pending = 2 * max_workers
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      pending = deque()
+      for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+          yield pending.popleft().result()
+      while pending:
+        yield pending.popleft().result()
+
+  def _finish_graph(
+    self,
+    entities: Iterable[str],
+    relations: Iterable[tuple[str, str, str]],
+    cluster: bool,
+    context: str,
+    output_folder: Optional[str],
+    sources: Optional[ProvenanceBuilder] = None,
+    previous: Optional[Graph] = None
+  ) -> Graph:
     graph = Graph(
       entities = entities,
       relations = relations,
       edges = {relation[1] for relation in relations}
     )
+    if sources is not None:
+      parts = [sources.build(graph.relations)]
+      if previous is not None and previous.provenance is not None:
+        parts.append(previous.provenance.remap(graph.relations))
+      graph.provenance = Provenance.concat(parts)
     
     if cluster:
       graph = self.cluster(graph, context)
@@ -155,10 +758,13 @@ class KGGen:
       output_path = os.path.join(output_folder, 'graph.json')
       
       graph_dict = {
-        'entities': list(entities),
-        'relations': list(relations),
+        'entities': list(graph.entities),
+        'relations': list(graph.relations),
         'edges': list(graph.edges)
       }
+      if graph.provenance is not None:
+        # Rows refer to relations in sorted order, see Provenance
+        graph_dict['provenance'] = graph.provenance.model_dump()
       
       with open(output_path, 'w') as f:
         json.dump(graph_dict, f, indent=2)
@@ -172,7 +778,21 @@ class KGGen:
     model: str = None,
     temperature: float = None,
     api_key: str = None,
+    progress: Optional[Callable[[ClusterProgress], None]] = None,
+    max_calls: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    cluster_map: Optional[Union[ClusterMap, str]] = None,
   ) -> Graph:
+    """Cluster similar entities and edges of a graph
+    
+    Args:
+        progress: Called with a ClusterProgress snapshot after each extract round and batch
+        max_calls: Hard cap on LM calls spent clustering; leftover items stay unclustered
+        max_tokens: Hard cap on LM tokens spent clustering
+        cluster_map: ClusterMap, or path of a JSON one, from earlier runs. Known members are
+            mapped locally and only unseen items reach the model; new assignments are
+            recorded into it (and saved back when given a path)
+    """
     # Initialize dspy with new parameters if any are provided
     if any([model, temperature, api_key]):
       self.init_model(
@@ -181,7 +801,17 @@ class KGGen:
         api_key=api_key or self.api_key
       )
 
-    return cluster_graph(self.dspy, graph, context)
+    path = None
+    if isinstance(cluster_map, (str, os.PathLike)):
+      path = cluster_map
+      cluster_map = ClusterMap.load(path) if os.path.exists(path) else ClusterMap()
+
+    clustered = cluster_graph(
+      self.dspy, graph, context, progress, max_calls, max_tokens, cluster_map=cluster_map
+    )
+    if path is not None:
+      cluster_map.save(path)
+    return clustered
   
   def aggregate(self, graphs: list[Graph]) -> Graph:
     # Initialize empty sets for combined graph
@@ -196,8 +826,18 @@ class KGGen:
       all_edges.update(graph.edges)
     
     # Create and return aggregated graph
-    return Graph(
+    aggregated = Graph(
       entities=all_entities,
       relations=all_relations,
       edges=all_edges
     )
+    
+    # Keep provenance, numbering each graph's chunks after the previous graphs' chunks
+    if any(graph.provenance is not None for graph in graphs):
+      parts, offset = [], 0
+      for graph in graphs:
+        if graph.provenance is not None:
+          parts.append(graph.provenance.remap(aggregated.relations, chunk_offset=offset))
+          offset += graph.provenance.n_chunks
+      aggregated.provenance = Provenance.concat(parts)
+    return aggregated
@@ -1,5 +1,10 @@
-from pydantic import BaseModel, model_validator, Field
-from typing import Tuple, Optional
+import json
+import numpy as np
+from datetime import datetime
+from pydantic import BaseModel, model_validator, Field, PrivateAttr
+from typing import Tuple, Optional, Any, Iterable, Literal
+from .utils.graph_index import GraphIndex, Direction
+from .utils.provenance import Provenance
 
 # ~~~ DATA STRUCTURES ~~~
 class Graph(BaseModel):
@@ -8,6 +13,11 @@ class Graph(BaseModel):
   relations: set[Tuple[str, str, str]] = Field(..., description="List of (subject, predicate, object) triples")
   entity_clusters: Optional[dict[str, set[str]]] = None
   edge_clusters: Optional[dict[str, set[str]]] = None
+  provenance: Optional[Provenance] = Field(None, description="Chunk ids and character spans each relation was extracted from")
+  _retriever: Optional[Any] = PrivateAttr(default=None)
+  _retriever_args: Optional[dict[str, Any]] = PrivateAttr(default=None)
+  _index: Optional[GraphIndex] = PrivateAttr(default=None)
+  _index_key: Optional[tuple[int, int, int]] = PrivateAttr(default=None)
 
   @model_validator(mode='after')
   def validate_consistency(self) -> 'Graph':
@@ -39,4 +49,367 @@ class Graph(BaseModel):
         for value in values:
           if value in edges and value != key:
             raise ValueError(f"Edge cluster value '{value}' appears in edges but is not the cluster key")
+
+    # Provenance saved before it stored its own triples holds rows of the sorted index
+    provenance = self.provenance
+    if provenance is not None and len(provenance) and not provenance.relations:
+      index = self.index
+      self.provenance = Provenance.build(
+        [index.relation(row) for row in provenance.rows], provenance.chunk_ids,
+        provenance.starts, provenance.ends, provenance.n_chunks,
+      )
     return self
+
+  def __eq__(self, other: Any) -> bool:
+    # Compare fields only; cached indexes and retrievers are private attrs pydantic would include
+    if not isinstance(other, Graph):
+      return NotImplemented
+    return all(getattr(self, name) == getattr(other, name) for name in type(self).model_fields)
+
+  def retriever(self, embedder=None, approximate: Optional[bool] = None, index_file: Optional[str] = None):
+    """Return the graph's GraphRetriever, building it on first use and indexing new entities on later calls.
+    
+    Arguments left as None keep the cached retriever's settings. A call giving a different
+    embedder (compared by identity), approximate or index_file builds a new retriever
+    with those settings instead.
+    
+    Args:
+        embedder: Callable mapping a list of strings to an embedding matrix
+        approximate: Use an approximate (faiss HNSW) index instead of exact search (default False)
+        index_file: Saved index to start from, see GraphRetriever.save
+    """
+    from .utils.retriever import GraphRetriever
+    given = {"embedder": embedder, "approximate": approximate, "index_file": index_file}
+    given = {name: value for name, value in given.items() if value is not None}
+    cached = self._retriever_args
+    if self._retriever is None or any(value != cached[name] for name, value in given.items()):
+      args = {"embedder": None, "approximate": False, "index_file": None, **(cached or {}), **given}
+      self._retriever = GraphRetriever(self, **args)
+      self._retriever_args = args
+    else:
+      self._retriever.update()
+    return self._retriever
+
+  def __setattr__(self, name: str, value: Any):
+    super().__setattr__(name, value)
+    if name in ("entities", "edges", "relations"):
+      self.invalidate()
+
+  def invalidate(self):
+    """Drop the cached adjacency index, so the next query rebuilds it.
+
+    Needed after editing entities, edges or relations in place without changing their
+    sizes (e.g. discarding one relation and adding another). Assigning a new set, or an
+    in-place edit that changes a size, is noticed without it.
+    """
+    self._index = None
+
+  @property
+  def index(self) -> GraphIndex:
+    """Adjacency index over the relations, built on first use and rebuilt when the graph's contents change.
+
+    Staleness is checked in O(1): the index is dropped when a field is assigned or
+    invalidate() is called, and rebuilt when a set's size no longer matches it.
+    """
+    key = (len(self.entities), len(self.edges), len(self.relations))
+    if self._index is None or self._index_key != key:
+      self._index = GraphIndex(self.entities, self.edges, self.relations)
+      self._index_key = key
+    return self._index
+
+  def neighbors(self, entity: str, direction: Direction = "out") -> set[str]:
+    """Entities one hop away from entity ("out" follows subject -> object, "in" the reverse)."""
+    index = self.index
+    return index.names(index.neighbor_ids(index.ids([entity]), direction))
+
+  def degree(self, entity: str, direction: Direction = "both") -> int:
+    """Number of relations with entity as subject ("out"), object ("in") or either ("both")."""
+    index = self.index
+    ids = index.ids([entity])
+    if len(ids) == 0:
+      return 0
+    if direction == "out":
+      return int(index.out_degree(ids)[0])
+    if direction == "in":
+      return int(index.in_degree(ids)[0])
+    return len(index.relation_rows(ids, "both"))
+
+  def k_hop(self, entities: Iterable[str], k: int = 1, direction: Direction = "out") -> set[str]:
+    """Entities reachable from the given ones within k hops, including the seeds themselves."""
+    index = self.index
+    reached, _ = index.k_hop(index.ids(entities), k, direction)
+    return index.names(reached)
+
+  def neighborhood(self, entities: Iterable[str], k: int = 2, direction: Direction = "out") -> set[Tuple[str, str, str]]:
+    """Relations traversed while expanding k hops from the given entities."""
+    index = self.index
+    _, rows = index.k_hop(index.ids(entities), k, direction)
+    return {index.relation(row) for row in rows}
+
+  def sources(self, relation: Tuple[str, str, str]) -> list[tuple[int, int, int]]:
+    """(chunk id, start, end) of every chunk span the relation was extracted from.
+
+    Raises:
+        ValueError: If the graph was generated without provenance
+    """
+    if self.provenance is None:
+      raise ValueError("Graph has no provenance; generate it with provenance=True")
+    if tuple(relation) not in self.relations:
+      return []
+    return self.provenance.sources(relation)
+
+  def diff(self, other: 'Graph') -> 'GraphDelta':
+    """Changes that turn this graph into other, so that merge(self, self.diff(other)) == other.
+
+    Relations are compared as int64 keys over a shared interning of both graphs' names,
+    reusing their cached adjacency indexes, instead of as sets of string tuples.
+    """
+    a, b = self.index, other.index
+    entity_ids = dict(a.entity_ids)
+    for name in b.entities:
+      entity_ids.setdefault(name, len(entity_ids))
+    edge_ids = dict(a.edge_ids)
+    for name in b.edges:
+      edge_ids.setdefault(name, len(edge_ids))
+    n_entities, n_edges = max(len(entity_ids), 1), max(len(edge_ids), 1)
+
+    if n_entities * n_entities * n_edges < 2 ** 63:
+      entity_map = np.array([entity_ids[name] for name in b.entities], dtype=np.int64)
+      edge_map = np.array([edge_ids[name] for name in b.edges], dtype=np.int64)
+      t = a.triples.astype(np.int64)
+      a_keys = (t[:, 0] * n_edges + t[:, 1]) * n_entities + t[:, 2]
+      t = b.triples.astype(np.int64)
+      b_keys = (entity_map[t[:, 0]] * n_edges + edge_map[t[:, 1]]) * n_entities + entity_map[t[:, 2]]
+      added = {b.relation(row) for row in np.flatnonzero(~np.isin(b_keys, a_keys, assume_unique=True))}
+      removed = {a.relation(row) for row in np.flatnonzero(~np.isin(a_keys, b_keys, assume_unique=True))}
+    else:
+      # Keys would overflow int64; fall back to set difference
+      added, removed = other.relations - self.relations, self.relations - other.relations
+
+    delta = GraphDelta(
+      added_entities=other.entities - self.entities,
+      removed_entities=self.entities - other.entities,
+      added_edges=other.edges - self.edges,
+      removed_edges=self.edges - other.edges,
+      added_relations=added,
+      removed_relations=removed,
+    )
+    for kind in ("entity_clusters", "edge_clusters"):
+      old, new = getattr(self, kind) or {}, getattr(other, kind) or {}
+      setattr(delta, kind, {rep: members for rep, members in new.items() if old.get(rep) != members})
+      setattr(delta, "removed_" + kind, set(old) - set(new))
+    return delta
+
+  def subgraph(self, entities: Iterable[str]) -> 'Graph':
+    """Induced subgraph on the given entities, keeping only relations between them."""
+    index = self.index
+    ids = index.ids(entities)
+    keep = np.zeros(len(index.entities), dtype=bool)
+    keep[ids] = True
+    rows = index.relation_rows(ids, "out")
+    rows = rows[keep[index.triples[rows, 2]]]
+    relations = {index.relation(row) for row in rows}
+    kept_entities = index.names(ids)
+    edges = {p for _, p, _ in relations}
+
+    entity_clusters = None
+    if self.entity_clusters is not None:
+      entity_clusters = {k: v for k, v in self.entity_clusters.items() if k in kept_entities}
+    edge_clusters = None
+    if self.edge_clusters is not None:
+      edge_clusters = {k: v for k, v in self.edge_clusters.items() if k in edges}
+    subgraph = Graph(
+      entities=kept_entities,
+      edges=edges,
+      relations=relations,
+      entity_clusters=entity_clusters,
+      edge_clusters=edge_clusters
+    )
+    if self.provenance is not None:
+      subgraph.provenance = self.provenance.remap(subgraph.relations)
+    return subgraph
+
+
+class GraphDelta(BaseModel):
+  """Added and removed parts of a graph, as computed by Graph.diff and applied by merge.
+
+  Clusters are delta'd by representative: entity_clusters/edge_clusters hold clusters that
+  are new or whose members changed, removed_* the representatives that disappeared.
+  """
+  added_entities: set[str] = Field(default_factory=set)
+  removed_entities: set[str] = Field(default_factory=set)
+  added_edges: set[str] = Field(default_factory=set)
+  removed_edges: set[str] = Field(default_factory=set)
+  added_relations: set[Tuple[str, str, str]] = Field(default_factory=set)
+  removed_relations: set[Tuple[str, str, str]] = Field(default_factory=set)
+  entity_clusters: dict[str, set[str]] = Field(default_factory=dict)
+  removed_entity_clusters: set[str] = Field(default_factory=set)
+  edge_clusters: dict[str, set[str]] = Field(default_factory=dict)
+  removed_edge_clusters: set[str] = Field(default_factory=set)
+
+  def is_empty(self) -> bool:
+    return not any(getattr(self, name) for name in type(self).model_fields)
+
+  def to_compact(self) -> dict:
+    """Serializable form with each name stored once and everything else as integer ids.
+
+    Relations are flat [s, p, o, s, p, o, ...] lists, clusters [rep, [members]] pairs.
+    """
+    ids: dict[str, int] = {}
+    def intern(name: str) -> int:
+      return ids.setdefault(name, len(ids))
+
+    data: dict[str, Any] = {}
+    for name in ("added_entities", "removed_entities", "added_edges", "removed_edges",
+                 "removed_entity_clusters", "removed_edge_clusters"):
+      data[name] = [intern(item) for item in sorted(getattr(self, name))]
+    for name in ("added_relations", "removed_relations"):
+      data[name] = [intern(part) for triple in sorted(getattr(self, name)) for part in triple]
+    for name in ("entity_clusters", "edge_clusters"):
+      data[name] = [
+        [intern(rep), [intern(member) for member in sorted(members)]]
+        for rep, members in sorted(getattr(self, name).items())
+      ]
+    return {"names": list(ids), **data}
+
+  @classmethod
+  def from_compact(cls, data: dict) -> 'GraphDelta':
+    names = data["names"]
+    fields: dict[str, Any] = {}
+    for name in ("added_entities", "removed_entities", "added_edges", "removed_edges",
+                 "removed_entity_clusters", "removed_edge_clusters"):
+      fields[name] = {names[i] for i in data.get(name, [])}
+    for name in ("added_relations", "removed_relations"):
+      flat = data.get(name, [])
+      fields[name] = {(names[flat[i]], names[flat[i + 1]], names[flat[i + 2]]) for i in range(0, len(flat), 3)}
+    for name in ("entity_clusters", "edge_clusters"):
+      fields[name] = {names[rep]: {names[m] for m in members} for rep, members in data.get(name, [])}
+    return cls(**fields)
+
+  def save(self, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+      json.dump(self.to_compact(), f, ensure_ascii=False, separators=(",", ":"))
+
+  @classmethod
+  def load(cls, path: str) -> 'GraphDelta':
+    with open(path, "r", encoding="utf-8") as f:
+      return cls.from_compact(json.load(f))
+
+
+def merge(base: Graph, delta: GraphDelta) -> Graph:
+  """Apply a delta to a base graph, returning a new graph.
+
+  Raises:
+      ValueError: If the delta doesn't fit the base, e.g. an added relation names an
+          entity that is neither in the base nor added
+  """
+  clusters = {}
+  for kind in ("entity_clusters", "edge_clusters"):
+    old = getattr(base, kind)
+    changed, removed = getattr(delta, kind), getattr(delta, "removed_" + kind)
+    if old is None and not changed:
+      clusters[kind] = None
+      continue
+    merged = {rep: members for rep, members in (old or {}).items() if rep not in removed}
+    merged.update(changed)
+    clusters[kind] = merged
+  merged = Graph(
+    entities=(base.entities - delta.removed_entities) | delta.added_entities,
+    edges=(base.edges - delta.removed_edges) | delta.added_edges,
+    relations=(base.relations - delta.removed_relations) | delta.added_relations,
+    **clusters
+  )
+  if base.provenance is not None:
+    # Added relations have no recorded source; the base's surviving ones keep theirs
+    merged.provenance = base.provenance.remap(merged.relations)
+  return merged
+
+
+class ClusterAssignment(BaseModel):
+  representative: str
+  source: str = Field("llm", description="How the assignment was made: 'llm' for clustered items, 'singleton' for items left alone")
+  run: str = Field("", description="Label of the clustering run that made the assignment")
+
+
+class ClusterMap(BaseModel):
+  """Persisted member -> representative canonicalization for entities and edges.
+
+  cluster_graph applies it locally before asking the model anything, so only items it has
+  never seen are clustered (against the known representatives), and records their
+  assignments back here. Existing assignments and their provenance are never overwritten.
+  """
+  entities: dict[str, ClusterAssignment] = Field(default_factory=dict)
+  edges: dict[str, ClusterAssignment] = Field(default_factory=dict)
+
+  def representatives(self, item_type: Literal["entities", "edges"]) -> dict[str, str]:
+    """Member -> representative mapping for one item type."""
+    return {member: a.representative for member, a in getattr(self, item_type).items()}
+
+  def record(self, item_type: Literal["entities", "edges"], clusters: dict[str, set[str]], run: Optional[str] = None) -> int:
+    """Add assignments for members not already in the map.
+
+    Returns:
+        Number of newly recorded members
+    """
+    assignments = getattr(self, item_type)
+    run = run if run is not None else datetime.now().isoformat(timespec="seconds")
+    added = 0
+    for rep, members in clusters.items():
+      source = "llm" if len(members) > 1 or rep not in members else "singleton"
+      for member in members:
+        if member not in assignments:
+          assignments[member] = ClusterAssignment(representative=rep, source=source, run=run)
+          added += 1
+    return added
+
+  @classmethod
+  def from_graph(cls, graph: Graph, run: Optional[str] = None) -> 'ClusterMap':
+    """Build a map from a clustered graph's entity and edge clusters."""
+    cluster_map = cls()
+    cluster_map.record("entities", graph.entity_clusters or {}, run)
+    cluster_map.record("edges", graph.edge_clusters or {}, run)
+    return cluster_map
+
+  def save(self, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+      f.write(self.model_dump_json(indent=2))
+
+  @classmethod
+  def load(cls, path: str) -> 'ClusterMap':
+    with open(path, "r", encoding="utf-8") as f:
+      return cls.model_validate_json(f.read())
+
+
+class RunStats(BaseModel):
+  """Counters for a batch run, e.g. KGGen.generate_many or the kg-gen CLI.
+
+  LLM counters are read from the LM's history, so they include retries and clustering.
+  """
+  documents: int = 0
+  skipped_documents: int = 0
+  skipped_chunks: int = 0
+  triaged_chunks: int = 0
+  downgraded_chunks: int = 0
+  chunks: int = 0
+  entities: int = 0
+  relations: int = 0
+  repaired_relations: int = 0
+  dropped_relations: int = 0
+  parse_failures: int = 0
+  retry_tokens_saved: int = 0
+  llm_calls: int = 0
+  prompt_tokens: int = 0
+  completion_tokens: int = 0
+  cost: float = 0.0
+  seconds: float = 0.0
+
+  def record_lm(self, lm: Any, since: int) -> int:
+    """Add the usage of lm.history[since:] and return the new history length to pass next time."""
+    history = lm.history
+    for entry in history[since:]:
+      usage = entry.get("usage") or {}
+      self.llm_calls += 1
+      self.prompt_tokens += usage.get("prompt_tokens") or 0
+      self.completion_tokens += usage.get("completion_tokens") or 0
+      self.cost += entry.get("cost") or 0.0
+    return len(history)
@@ -0,0 +1,394 @@
+"""Long-lived extraction service as a dependency-free ASGI app.
+
+  uvicorn "kg_gen.server:create_app" --factory     # or: python -m kg_gen.server --port 8000
+
+Endpoints (JSON bodies, JSON responses):
+  POST /generate   {"input_data": str | [messages], "context", "chunk_size", "cluster"} -> Graph
+  POST /cluster    {"graph": Graph, "context"} -> Graph
+  POST /aggregate  {"graphs": [Graph, ...]} -> Graph
+  GET  /health     queue depth and counters
+
+Concurrent /generate requests are collected for up to batch_window seconds (or max_batch
+requests) and extracted together by KGGen.generate_many, so their chunks share one worker
+pool. A document that fails is retried alone, so it doesn't fail the rest of its batch.
+Requests to every endpoint wait in one bounded queue; when it is full the server answers
+503 right away instead of piling up work. Responses are cached by request body, and the
+KGGen instance (LM client, settings and caches) stays warm across requests.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from pydantic import ValidationError
+
+from .kg_gen import KGGen
+from .models import Graph
+from .utils.chunk_conversation import format_turns
+
+DEFAULT_MAX_BATCH = 16
+DEFAULT_BATCH_WINDOW = 0.02
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_CACHE_SIZE = 1024
+GENERATE_OPTIONS = ("chunk_size", "context", "cluster")
+
+
+class HTTPError(Exception):
+  def __init__(self, status: int, message: str):
+    super().__init__(message)
+    self.status = status
+    self.message = message
+
+
+class ResponseCache:
+  """LRU cache of response bodies keyed by a hash of the request."""
+
+  def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+    self.max_size = max_size
+    self.hits = 0
+    self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+  @staticmethod
+  def key(path: str, body: Any) -> str:
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{path}\n{canonical}".encode("utf-8")).hexdigest()
+
+  def get(self, key: str) -> Optional[bytes]:
+    response = self._entries.get(key)
+    if response is not None:
+      self._entries.move_to_end(key)
+      self.hits += 1
+    return response
+
+  def put(self, key: str, response: bytes):
+    if self.max_size <= 0:
+      return
+    self._entries[key] = response
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_size:
+      self._entries.popitem(last=False)
+
+
+def generate_options(body: dict) -> tuple:
+  """Validated (chunk_size, context, cluster) of a /generate request, in GENERATE_OPTIONS order.
+
+  Raises:
+      ValueError: If an option has the wrong type
+  """
+  chunk_size = body.get("chunk_size")
+  if chunk_size is not None and (not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size <= 0):
+    raise ValueError("chunk_size must be a positive integer or null")
+  context = body.get("context", "")
+  if not isinstance(context, str):
+    raise ValueError("context must be a string")
+  cluster = body.get("cluster", False)
+  if not isinstance(cluster, bool):
+    raise ValueError("cluster must be a boolean")
+  return chunk_size, context, cluster
+
+
+class BatchScheduler:
+  """Micro-batches /generate requests onto KGGen.generate_many behind a bounded queue.
+
+  Other work (clustering, aggregation) is admitted through the same queue, so it counts
+  against queue_size too.
+  """
+
+  def __init__(
+    self,
+    kg: KGGen,
+    max_batch: int = DEFAULT_MAX_BATCH,
+    batch_window: float = DEFAULT_BATCH_WINDOW,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+  ):
+    self.kg = kg
+    self.max_batch = max_batch
+    self.batch_window = batch_window
+    self.queue_size = queue_size
+    self.batches = 0
+    self.batched_requests = 0
+    self.rejected = 0
+    self._queue: Optional[asyncio.Queue] = None
+    self._task: Optional[asyncio.Task] = None
+
+  @property
+  def depth(self) -> int:
+    return self._queue.qsize() if self._queue is not None else 0
+
+  def start(self):
+    if self._task is None or self._task.done():
+      self._queue = asyncio.Queue(maxsize=self.queue_size)
+      self._task = asyncio.get_running_loop().create_task(self._run())
+
+  async def stop(self):
+    if self._task is not None:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+      self._task = None
+
+  async def submit(self, document: Any, options: tuple) -> Graph:
+    """Queue one document and wait for its graph.
+
+    Raises:
+        HTTPError: 503 when the queue is full
+    """
+    return await self._enqueue(document, options)
+
+  async def submit_call(self, fn: Callable[[], Graph]) -> Graph:
+    """Queue a call to run on a worker thread and wait for its result.
+
+    Raises:
+        HTTPError: 503 when the queue is full
+    """
+    return await self._enqueue(fn, None)
+
+  async def _enqueue(self, work: Any, options: Optional[tuple]) -> Graph:
+    self.start()
+    future = asyncio.get_running_loop().create_future()
+    try:
+      self._queue.put_nowait((work, options, future))
+    except asyncio.QueueFull:
+      self.rejected += 1
+      raise HTTPError(503, "Server busy, retry later")
+    return await future
+
+  async def _next_batch(self) -> list:
+    loop = asyncio.get_running_loop()
+    batch = [await self._queue.get()]
+    deadline = loop.time() + self.batch_window
+    while len(batch) < self.max_batch:
+      if not self._queue.empty():
+        batch.append(self._queue.get_nowait())
+        continue
+      remaining = deadline - loop.time()
+      if remaining <= 0:
+        break
+      try:
+        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+      except asyncio.TimeoutError:
+        break
+    return batch
+
+  async def _run(self):
+    while True:
+      batch = await self._next_batch()
+      try:
+        await self._process(batch)
+      except Exception as e:
+        # The scheduler must outlive any batch; whoever is still waiting gets the error
+        for _, _, future in batch:
+          if not future.done():
+            future.set_exception(e)
+
+  async def _process(self, batch: list):
+    self.batches += 1
+    # Requests with the same options are extracted in one generate_many call
+    groups: dict[tuple, list] = {}
+    for work, options, future in batch:
+      if options is None:
+        await self._resolve(future, work)
+      else:
+        groups.setdefault(options, []).append((work, future))
+    for options, items in groups.items():
+      self.batched_requests += len(items)
+      kwargs = dict(zip(GENERATE_OPTIONS, options))
+      documents = [document for document, _ in items]
+      try:
+        graphs = await asyncio.to_thread(lambda: list(self.kg.generate_many(documents, **kwargs)))
+      except Exception:
+        # Redo the group one document at a time, so only the documents that fail get an error
+        for document, future in items:
+          await self._resolve(future, lambda document=document: next(self.kg.generate_many([document], **kwargs)))
+        continue
+      for (_, future), graph in zip(items, graphs):
+        if not future.done():
+          future.set_result(graph)
+
+  @staticmethod
+  async def _resolve(future: asyncio.Future, fn: Callable[[], Graph]):
+    try:
+      result = await asyncio.to_thread(fn)
+    except Exception as e:
+      if not future.done():
+        future.set_exception(e)
+      return
+    if not future.done():
+      future.set_result(result)
+
+
+class KGGenApp:
+  """ASGI application serving a shared KGGen; see the module docstring for the API."""
+
+  def __init__(
+    self,
+    kg: Optional[KGGen] = None,
+    max_batch: int = DEFAULT_MAX_BATCH,
+    batch_window: float = DEFAULT_BATCH_WINDOW,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+  ):
+    self.kg = kg or KGGen()
+    self.scheduler = BatchScheduler(self.kg, max_batch, batch_window, queue_size)
+    self.cache = ResponseCache(cache_size)
+    self.requests = 0
+    self._inflight: dict[str, asyncio.Future] = {}
+    self.routes: dict[str, Callable] = {
+      "/generate": self.generate,
+      "/cluster": self.cluster,
+      "/aggregate": self.aggregate,
+    }
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] == "lifespan":
+      await self.lifespan(receive, send)
+      return
+    if scope["type"] != "http":
+      return
+    try:
+      status, body = await self.handle(scope, receive)
+    except HTTPError as e:
+      status, body = e.status, json.dumps({"error": e.message}).encode("utf-8")
+    except Exception as e:
+      status, body = 500, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if status == 503:
+      headers.append((b"retry-after", b"1"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message["type"] == "lifespan.startup":
+        self.scheduler.start()
+        await send({"type": "lifespan.startup.complete"})
+      elif message["type"] == "lifespan.shutdown":
+        await self.scheduler.stop()
+        await send({"type": "lifespan.shutdown.complete"})
+        return
+
+  async def handle(self, scope, receive) -> tuple[int, bytes]:
+    path = scope["path"]
+    if path == "/health" and scope["method"] == "GET":
+      return 200, json.dumps(self.health()).encode("utf-8")
+    if path not in self.routes:
+      raise HTTPError(404, f"Unknown path {path}")
+    if scope["method"] != "POST":
+      raise HTTPError(405, "Use POST")
+
+    raw = b""
+    while True:
+      message = await receive()
+      raw += message.get("body", b"")
+      if not message.get("more_body"):
+        break
+    try:
+      body = json.loads(raw or b"{}")
+    except json.JSONDecodeError as e:
+      raise HTTPError(400, f"Invalid JSON: {e}")
+    if not isinstance(body, dict):
+      raise HTTPError(400, "Request body must be a JSON object")
+
+    self.requests += 1
+    key = ResponseCache.key(path, body)
+    cached = self.cache.get(key)
+    if cached is not None:
+      return 200, cached
+    # Identical requests already being processed share its result
+    if key in self._inflight:
+      self.cache.hits += 1
+      return 200, await asyncio.shield(self._inflight[key])
+
+    future = asyncio.get_running_loop().create_future()
+    self._inflight[key] = future
+    try:
+      graph = await self.routes[path](body)
+      response = graph.model_dump_json().encode("utf-8")
+      self.cache.put(key, response)
+      future.set_result(response)
+      return 200, response
+    except (ValidationError, ValueError, KeyError, TypeError) as e:
+      future.set_exception(HTTPError(400, str(e)))
+      raise HTTPError(400, str(e))
+    except asyncio.CancelledError:
+      future.cancel()
+      raise
+    except Exception as e:
+      future.set_exception(e)
+      raise
+    finally:
+      del self._inflight[key]
+      if future.done() and not future.cancelled():
+        future.exception()  # mark retrieved when nobody else was waiting
+
+  async def generate(self, body: dict) -> Graph:
+    input_data = body["input_data"]
+    if isinstance(input_data, list):
+      # Malformed messages are answered with 400 here rather than failing inside a batch
+      for _ in format_turns(input_data):
+        pass
+    elif not isinstance(input_data, str):
+      raise ValueError("input_data must be a string or a list of messages")
+    return await self.scheduler.submit(input_data, generate_options(body))
+
+  async def cluster(self, body: dict) -> Graph:
+    graph = Graph.model_validate(body["graph"])
+    context = body.get("context", "")
+    if not isinstance(context, str):
+      raise ValueError("context must be a string")
+    return await self.scheduler.submit_call(lambda: self.kg.cluster(graph, context))
+
+  async def aggregate(self, body: dict) -> Graph:
+    if not isinstance(body["graphs"], list):
+      raise ValueError("graphs must be a list of graphs")
+    graphs = [Graph.model_validate(graph) for graph in body["graphs"]]
+    return await self.scheduler.submit_call(lambda: self.kg.aggregate(graphs))
+
+  def health(self) -> dict:
+    return {
+      "queue_depth": self.scheduler.depth,
+      "requests": self.requests,
+      "cache_hits": self.cache.hits,
+      "batches": self.scheduler.batches,
+      "batched_requests": self.scheduler.batched_requests,
+      "rejected": self.scheduler.rejected,
+    }
+
+
+def create_app(kg: Optional[KGGen] = None, **kwargs) -> KGGenApp:
+  return KGGenApp(kg, **kwargs)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve KGGen over HTTP (requires uvicorn).")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8000)
+  parser.add_argument("--model", default="openai/gpt-4o")
+  parser.add_argument("--workers", type=int, default=None, help="Max chunks extracted concurrently.")
+  parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+  parser.add_argument("--batch-window", type=float, default=DEFAULT_BATCH_WINDOW, help="Seconds to collect a batch.")
+  parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+  parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+  args = parser.parse_args()
+  try:
+    import uvicorn
+  except ImportError as e:
+    raise ImportError("Serving needs an ASGI server. Run `pip install uvicorn`.") from e
+
+  app = create_app(
+    KGGen(model=args.model, max_workers=args.workers),
+    max_batch=args.max_batch,
+    batch_window=args.batch_window,
+    queue_size=args.queue_size,
+    cache_size=args.cache_size,
+  )
+  uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+  main()
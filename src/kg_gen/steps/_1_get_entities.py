@@ -1,11 +1,16 @@
-from typing import List
+from typing import List, Optional
 import dspy 
 
+# First input field, so the system prompt and context form a prefix shared by every chunk
+# of a run, which provider-side prompt caching can reuse
+CONTEXT_FIELD = dspy.InputField(desc="Description of the data the source text comes from; may be empty")
+
 class TextEntities(dspy.Signature):
   """Extract key entities from the source text. Extracted entities are subjects or objects.
   This is for an extraction task, please be THOROUGH and accurate to the reference text."""
   
-  source_text: str = dspy.InputField()  
+  context: str = CONTEXT_FIELD
+  source_text: str = dspy.InputField()
   entities: list[str] = dspy.OutputField(desc="THOROUGH list of key entities")
 
 class ConversationEntities(dspy.Signature):
@@ -13,15 +18,71 @@ class ConversationEntities(dspy.Signature):
   Consider both explicit entities and participants in the conversation.
   This is for an extraction task, please be THOROUGH and accurate."""
   
+  context: str = CONTEXT_FIELD
   source_text: str = dspy.InputField()
   entities: list[str] = dspy.OutputField(desc="THOROUGH list of key entities")
 
-def get_entities(dspy: dspy.dspy, input_data: str, is_conversation: bool = False) -> List[str]:
+class PackedTextEntities(dspy.Signature):
+  """Extract key entities from each of several independent source texts. Extracted entities are subjects or objects.
+  Treat every source on its own: only list an entity for a source if that source mentions it.
+  This is for an extraction task, please be THOROUGH and accurate to the reference text."""
+  
+  context: str = CONTEXT_FIELD
+  sources: list[str] = dspy.InputField()
+  entities_per_source: list[list[str]] = dspy.OutputField(desc="One THOROUGH list of key entities per source, in the order of sources")
+
+class PackedConversationEntities(dspy.Signature):
+  """Extract key entities from each of several independent conversation excerpts. Extracted entities are subjects or objects.
+  Consider both explicit entities and participants in the conversation. Treat every source on its own.
+  This is for an extraction task, please be THOROUGH and accurate."""
+  
+  context: str = CONTEXT_FIELD
+  sources: list[str] = dspy.InputField()
+  entities_per_source: list[list[str]] = dspy.OutputField(desc="One THOROUGH list of key entities per source, in the order of sources")
+
+KNOWN_ENTITIES_FIELD = dspy.InputField(desc="Entities already extracted from other parts of the same source. When the text mentions one of them, use this exact name")
+TextEntitiesWithKnown = TextEntities.append("known_entities", KNOWN_ENTITIES_FIELD, type_=list[str])
+ConversationEntitiesWithKnown = ConversationEntities.append("known_entities", KNOWN_ENTITIES_FIELD, type_=list[str])
+PackedTextEntitiesWithKnown = PackedTextEntities.append("known_entities", KNOWN_ENTITIES_FIELD, type_=list[str])
+PackedConversationEntitiesWithKnown = PackedConversationEntities.append("known_entities", KNOWN_ENTITIES_FIELD, type_=list[str])
+
+def get_entities(
+  dspy: dspy.dspy,
+  input_data: str,
+  is_conversation: bool = False,
+  known_entities: Optional[list[str]] = None,
+  context: str = ""
+) -> List[str]:
+  if known_entities:
+    extract = dspy.Predict(ConversationEntitiesWithKnown if is_conversation else TextEntitiesWithKnown)
+    return extract(context=context, source_text=input_data, known_entities=known_entities).entities
+
   if is_conversation:
     extract = dspy.Predict(ConversationEntities)
   else:
     extract = dspy.Predict(TextEntities)
     
-  result = extract(source_text=input_data)
+  result = extract(context=context, source_text=input_data)
   return result.entities
 
+def get_entities_packed(
+  dspy: dspy.dspy,
+  sources: list[str],
+  is_conversation: bool = False,
+  known_entities: Optional[list[str]] = None,
+  context: str = ""
+) -> Optional[list[list[str]]]:
+  """Entities of several sources from one request, or None when the response doesn't parse
+  or doesn't have exactly one list of names per source."""
+  try:
+    if known_entities:
+      extract = dspy.Predict(PackedConversationEntitiesWithKnown if is_conversation else PackedTextEntitiesWithKnown)
+      result = extract(context=context, sources=sources, known_entities=known_entities).entities_per_source
+    else:
+      extract = dspy.Predict(PackedConversationEntities if is_conversation else PackedTextEntities)
+      result = extract(context=context, sources=sources).entities_per_source
+  except ValueError:  # response didn't parse
+    return None
+  if len(result) != len(sources) or not all(isinstance(entities, list) for entities in result):
+    return None
+  return [[entity for entity in entities if isinstance(entity, str)] for entities in result]
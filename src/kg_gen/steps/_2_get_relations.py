@@ -1,10 +1,17 @@
-from typing import List
+from ..utils.entity_registry import normalize_name
+from ._1_get_entities import CONTEXT_FIELD
+from difflib import get_close_matches
+from typing import List, Optional
 import dspy
+import threading
+
+FUZZY_CUTOFF = 0.9
 
 class TextRelations(dspy.Signature):
   """Extract subject-predicate-object triples from the source text. Subject and object must be from entities list. Entities provided were previously extracted from the same source text.
   This is for an extraction task, please be THOROUGH, accurate, and faithful to the reference text."""
   
+  context: str = CONTEXT_FIELD
   source_text: str = dspy.InputField()
   entities: list[str] = dspy.InputField()
   relations: list[tuple[str, str, str]] = dspy.OutputField(desc="List of subject-predicate-object tuples where subject and object are exact matches to items in entities list. BE THOROUGH")
@@ -18,19 +25,120 @@ class ConversationRelations(dspy.Signature):
   This is for an extraction task, please be THOROUGH, accurate, and faithful to the reference text.
   """
   
+  context: str = CONTEXT_FIELD
   source_text: str = dspy.InputField()
   entities: list[str] = dspy.InputField()
   relations: list[tuple[str, str, str]] = dspy.OutputField(desc="List of subject-predicate-object tuples where subject and object are exact matches to items in entities list. BE THOROUGH")
 
-def get_relations(dspy: dspy.dspy, input_data: str, entities: list[str], is_conversation: bool = False) -> List[str]:
+class PackedTextRelations(dspy.Signature):
+  """Extract subject-predicate-object triples from each of several independent source texts. For each source, subject and object must be from that source's entities list, which was previously extracted from the same source.
+  This is for an extraction task, please be THOROUGH, accurate, and faithful to the reference text."""
+  
+  context: str = CONTEXT_FIELD
+  sources: list[str] = dspy.InputField()
+  entities_per_source: list[list[str]] = dspy.InputField()
+  relations_per_source: list[list[tuple[str, str, str]]] = dspy.OutputField(desc="One list of subject-predicate-object tuples per source, in the order of sources, where subject and object are exact matches to items in that source's entities list. BE THOROUGH")
+
+class PackedConversationRelations(dspy.Signature):
+  """Extract subject-predicate-object triples from each of several independent conversation excerpts, including relations between concepts discussed, between speakers and concepts, and between speakers.
+  For each source, subject and object must be from that source's entities list, which was previously extracted from the same source.
+  This is for an extraction task, please be THOROUGH, accurate, and faithful to the reference text."""
+  
+  context: str = CONTEXT_FIELD
+  sources: list[str] = dspy.InputField()
+  entities_per_source: list[list[str]] = dspy.InputField()
+  relations_per_source: list[list[tuple[str, str, str]]] = dspy.OutputField(desc="One list of subject-predicate-object tuples per source, in the order of sources, where subject and object are exact matches to items in that source's entities list. BE THOROUGH")
+
+class RelationFilterStats:
+  """Thread-safe counts of extracted triples whose subject or object wasn't an exact entity."""
+
+  def __init__(self):
+    self.repaired = 0
+    self.dropped = 0
+    self._lock = threading.Lock()
+
+  def add(self, repaired: int, dropped: int):
+    with self._lock:
+      self.repaired += repaired
+      self.dropped += dropped
+
+class EntityIndex:
+  """Per-chunk lookup of extracted entities.
+
+  Exact names hit a set; otherwise the name is normalized (casefolded, whitespace collapsed,
+  surrounding punctuation trimmed) and looked up in a dict, and only then compared fuzzily
+  against the normalized names with difflib, so near-misses such as "josh smith " or
+  "Josh Smiths" resolve to the extracted spelling instead of being dropped.
+  """
+
+  def __init__(self, entities: list[str], cutoff: float = FUZZY_CUTOFF):
+    self.cutoff = cutoff
+    self._exact = set(entities)
+    self._normalized: dict[str, str] = {}
+    for entity in entities:
+      self._normalized.setdefault(normalize_name(entity), entity)
+
+  def resolve(self, name: str) -> Optional[str]:
+    """Extracted entity name refers to, or None."""
+    if name in self._exact:
+      return name
+    key = normalize_name(name)
+    if key in self._normalized:
+      return self._normalized[key]
+    matches = get_close_matches(key, self._normalized, n=1, cutoff=self.cutoff)
+    return self._normalized[matches[0]] if matches else None
+
+def get_relations(
+  dspy: dspy.dspy,
+  input_data: str,
+  entities: list[str],
+  is_conversation: bool = False,
+  stats: Optional[RelationFilterStats] = None,
+  context: str = ""
+) -> List[str]:
   if is_conversation:
     extract = dspy.Predict(ConversationRelations)
   else:
     extract = dspy.Predict(TextRelations)
     
-  result = extract(source_text=input_data, entities=entities)
-  filtered_relations = [
-    (s, p, o) for s, p, o in result.relations 
-    if s in entities and o in entities
-  ]
-  return filtered_relations
\ No newline at end of file
+  result = extract(context=context, source_text=input_data, entities=entities)
+  return filter_relations(result.relations, entities, stats)
+
+def get_relations_packed(
+  dspy: dspy.dspy,
+  sources: list[str],
+  entities: list[list[str]],
+  is_conversation: bool = False,
+  stats: Optional[RelationFilterStats] = None,
+  context: str = ""
+) -> Optional[list[list[tuple[str, str, str]]]]:
+  """Relations of several sources from one request, each filtered against its own source's
+  entities, or None when the response doesn't parse or doesn't have exactly one list per source."""
+  extract = dspy.Predict(PackedConversationRelations if is_conversation else PackedTextRelations)
+  try:
+    result = extract(context=context, sources=sources, entities_per_source=entities).relations_per_source
+  except ValueError:  # response didn't parse
+    return None
+  if len(result) != len(sources) or not all(isinstance(relations, list) for relations in result):
+    return None
+  return [filter_relations(relations, source_entities, stats) for relations, source_entities in zip(result, entities)]
+
+def filter_relations(
+  relations: list[tuple[str, str, str]],
+  entities: list[str],
+  stats: Optional[RelationFilterStats] = None
+) -> list[tuple[str, str, str]]:
+  """Keep relations whose subject and object resolve to one of entities, rewritten onto its spelling."""
+  index = EntityIndex(entities)
+  filtered_relations = []
+  repaired = 0
+  for s, p, o in relations:
+    subject, obj = index.resolve(s), index.resolve(o)
+    if subject is None or obj is None:
+      continue
+    if (subject, obj) != (s, o):
+      repaired += 1
+    filtered_relations.append((subject, p, obj))
+  if stats is not None:
+    stats.add(repaired, len(relations) - len(filtered_relations))
+  return filtered_relations
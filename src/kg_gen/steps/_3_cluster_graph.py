@@ -1,18 +1,27 @@
-from ..models import Graph
+from ..models import Graph, ClusterMap
 import dspy
-from typing import Optional
+from collections import deque
+from pydantic import BaseModel
+from typing import Callable, Literal, Optional
 
 LOOP_N = 8 
 BATCH_SIZE = 10
+# The extract phase also ends early once at least MIN_PATIENCE rounds in a row found nothing
+# and the last YIELD_WINDOW rounds clustered under YIELD_DROP times the items per token of
+# the whole phase so far (per call, for LMs that report no token usage). Comparing with the
+# phase's own yield keeps the rule independent of how long, and so costly, the item list is
+YIELD_WINDOW = 4
+YIELD_DROP = 0.5
+MIN_PATIENCE = 2
 
 class ExtractCluster(dspy.Signature):
-  """Find one cluster of related items from the list.
+  """Find one cluster of related items from the numbered list.
   A cluster should contain items that are the same in meaning, with different tenses, plural forms, stem forms, or cases. 
-  Return populated list only if you find items that clearly belong together, else return empty list."""
+  Return the ids of the items only if you find items that clearly belong together, else return empty list."""
   
-  items: set[str] = dspy.InputField()
+  items: str = dspy.InputField(desc="one item per line, prefixed by its id")
   context: str = dspy.InputField(desc="the larger context in which the items appear")
-  cluster: set[str] = dspy.OutputField()
+  cluster_ids: list[int] = dspy.OutputField(desc="ids of the items in the cluster")
 
 class ValidateCluster(dspy.Signature):
   """Verify if these items belong in the same cluster.
@@ -33,131 +42,280 @@ class ChooseRepresentative(dspy.Signature):
 
 class CheckExistingClusters(dspy.Signature):
   """Determine if the given items can be added to any of the existing clusters.
-  Return representative of matching cluster for each item, or None if there is no match."""
+  Return the id of the matching cluster for each item, or None if there is no match."""
   
-  items: list[str] = dspy.InputField()
-  clusters: dict[str, set[str]] = dspy.InputField(desc="Mapping of cluster representatives to their cluster members")
+  items: str = dspy.InputField(desc="one item per line, prefixed by its id")
+  clusters: str = dspy.InputField(desc="one existing cluster per line, its id followed by its representative")
   context: str = dspy.InputField(desc="the larger context in which the items appear")
-  cluster_reps_that_items_belong_to: list[Optional[str]] = dspy.OutputField(desc="ordered list of cluster representatives where each is the cluster where that item belongs to, or None if no match. THIS LIST LENGTH IS SAME AS ITEMS LIST LENGTH")
+  cluster_ids_that_items_belong_to: list[Optional[int]] = dspy.OutputField(desc="ordered list of cluster ids where each is the cluster where that item belongs to, or None if no match. THIS LIST LENGTH IS SAME AS ITEMS LIST LENGTH")
+
+
+def number_items(items: list[str]) -> str:
+  """Render items as "id: item" lines, so the model can answer with ids instead of repeating strings."""
+  return "\n".join(f"{i}: {item}" for i, item in enumerate(items))
+
+def check_cluster_ids(inputs: dict, cluster_ids: list) -> Optional[str]:
+  """Problem with a CheckExistingClusters answer that doesn't give one id per item, if any."""
+  expected = len(str(inputs.get("items") or "").splitlines())
+  if len(cluster_ids) != expected:
+    return f"has {len(cluster_ids)} ids for {expected} items; give exactly one id (or None) per item, in order"
+  return None
+
+def window_yield(rounds, total: tuple[int, int, int] = (0, 0, 0)) -> tuple[float, float, bool]:
+  """(items per call, items per 1k tokens, whether the yield has dropped) of a window of
+  (items clustered, calls, tokens) rounds, against the total of all rounds so far."""
+  clustered, calls, tokens = (sum(column) for column in zip(*rounds)) if rounds else (0, 0, 0)
+  all_clustered, all_calls, all_tokens = total
+  per_call = clustered / calls if calls else 0.0
+  per_1k_tokens = 1000 * clustered / tokens if tokens else 0.0
+  if tokens and all_tokens:
+    dropped = clustered * all_tokens < YIELD_DROP * all_clustered * tokens
+  else:
+    dropped = clustered * all_calls < YIELD_DROP * all_clustered * calls
+  return per_call, per_1k_tokens, clustered == 0 or dropped
+
+def resolve_id(item_id, items: list[str]) -> Optional[str]:
+  """Map an id returned by the model back to its item, ignoring ids that are not in the list."""
+  if isinstance(item_id, int) and not isinstance(item_id, bool) and 0 <= item_id < len(items):
+    return items[item_id]
+  return None
+
+
+class ClusterProgress(BaseModel):
+  """Snapshot passed to the cluster_items progress callback after each extract round and batch."""
+  item_type: str
+  phase: Literal["extract", "assign", "done"]
+  calls: int
+  tokens: int
+  clusters: int
+  remaining: int
+  items_per_call: float
+  items_per_1k_tokens: float
+
+
+class ClusterBudget:
+  """Counts the LM calls and tokens spent on clustering and enforces optional hard caps.
+
+  Spending is read from the LM's history, so parse retries and reasoning are counted too.
+  One budget can be shared by several cluster_items calls, e.g. entities and edges.
+  """
 
+  def __init__(self, lm: Optional[dspy.LM] = None, max_calls: Optional[int] = None, max_tokens: Optional[int] = None):
+    self.lm = lm
+    self.max_calls = max_calls
+    self.max_tokens = max_tokens
+    self.calls = 0
+    self.tokens = 0
+    self._seen = len(lm.history) if lm is not None else 0
 
-def cluster_items(dspyi: dspy.dspy, items: set[str], item_type: str = "entities", context: str = "") -> tuple[set[str], dict[str, set[str]]]:
-  """Returns item set and cluster dict mapping representatives to sets of items"""
+  def update(self):
+    if self.lm is None:
+      return
+    history = self.lm.history
+    if len(history) < self._seen:
+      self._seen = 0
+    for entry in history[self._seen:]:
+      self.calls += 1
+      self.tokens += (entry.get("usage") or {}).get("total_tokens") or 0
+    self._seen = len(history)
+
+  @property
+  def exhausted(self) -> bool:
+    self.update()
+    return (
+      (self.max_calls is not None and self.calls >= self.max_calls)
+      or (self.max_tokens is not None and self.tokens >= self.max_tokens)
+    )
+
+
+def cluster_items(
+  dspyi: dspy.dspy,
+  items: set[str],
+  item_type: str = "entities",
+  context: str = "",
+  progress: Optional[Callable[[ClusterProgress], None]] = None,
+  budget: Optional[ClusterBudget] = None,
+  known: Optional[dict[str, str]] = None,
+) -> tuple[set[str], dict[str, set[str]]]:
+  """Returns item set and cluster dict mapping representatives to sets of items
+  
+  Args:
+      progress: Called with a ClusterProgress snapshot after each extract round and batch
+      budget: Caps on LM calls and tokens; once spent, unassigned items become singleton
+          clusters without further calls
+      known: Member -> representative assignments from earlier runs, applied without LM
+          calls; only the other items are clustered, against these representatives too
+  """
   
   context = f"{item_type} of a graph extracted from source text." + context
-  remaining_items = items.copy()
+  budget = budget or ClusterBudget(dspyi.settings.lm)
+  known = known or {}
   clusters = {} 
+  for item in sorted(items):
+    if item in known:
+      clusters.setdefault(known[item], set()).add(item)
+  # Prompts list items and cluster representatives by number; only ids come back
+  remaining_items = sorted(item for item in items if item not in known)
   no_progress_count = 0
+  # (items clustered, calls, tokens) of the most recent extract rounds, and of all of them
+  rounds = deque(maxlen=YIELD_WINDOW)
+  total = (0, 0, 0)
   
   extract = dspyi.Predict(ExtractCluster)
   validate = dspyi.Predict(ValidateCluster)
   choose_rep = dspyi.Predict(ChooseRepresentative)
   check_existing = dspyi.ChainOfThought(CheckExistingClusters)
+
+  def report(phase):
+    if progress is None:
+      return
+    budget.update()
+    items_per_call, items_per_1k_tokens, _ = window_yield(rounds)
+    progress(ClusterProgress(
+      item_type=item_type,
+      phase=phase,
+      calls=budget.calls,
+      tokens=budget.tokens,
+      clusters=len(clusters),
+      remaining=len(remaining_items),
+      items_per_call=items_per_call,
+      items_per_1k_tokens=items_per_1k_tokens,
+    ))
   
-  while len(remaining_items) > 0:
-    e_result = extract(items=remaining_items, context=context)
-    suggested_cluster = e_result.cluster
+  while len(remaining_items) > 0 and not budget.exhausted:
+    calls, tokens = budget.calls, budget.tokens
+    clustered = 0
+    e_result = extract(items=number_items(remaining_items), context=context)
+    suggested_cluster = {resolve_id(i, remaining_items) for i in e_result.cluster_ids} - {None}
     
-    if len(suggested_cluster) > 0:
+    if len(suggested_cluster) > 0 and not budget.exhausted:
       v_result = validate(cluster=suggested_cluster, context=context)
       validated_cluster = v_result.validated_items
       
       if len(validated_cluster) > 1:
         no_progress_count = 0
-        r_result = choose_rep(cluster=validated_cluster, context=context)
-        representative = r_result.representative
+        if budget.exhausted:
+          representative = min(validated_cluster, key=lambda item: (len(item), item))
+        else:
+          r_result = choose_rep(cluster=validated_cluster, context=context)
+          representative = r_result.representative
         
-        clusters[representative] = validated_cluster
-        remaining_items = {item for item in remaining_items if item not in validated_cluster}
-        continue
+        clusters.setdefault(representative, set()).update(validated_cluster)
+        remaining_items = [item for item in remaining_items if item not in validated_cluster]
+        clustered = len(validated_cluster)
       
+    budget.update()
+    rounds.append((clustered, budget.calls - calls, budget.tokens - tokens))
+    total = tuple(a + b for a, b in zip(total, rounds[-1]))
+    report("extract")
+    if clustered:
+      continue
+    
     no_progress_count += 1
     
+    # Stop once extraction has gone quiet rather than always paying for LOOP_N misses
+    if no_progress_count >= MIN_PATIENCE and window_yield(rounds, total)[2]:
+      break
     if no_progress_count >= LOOP_N or len(remaining_items) == 0:
       break
     
   if len(remaining_items) > 0:
-    items_to_process = list(remaining_items) 
+    items_to_process = remaining_items
       
     for i in range(0, len(items_to_process), BATCH_SIZE):
       batch = items_to_process[i:min(i + BATCH_SIZE, len(items_to_process))]
       
-      if not clusters:
+      if not clusters or budget.exhausted:
         for item in batch:
-          clusters[item] = {item}
+          clusters.setdefault(item, set()).add(item)
         continue
       
+      # Representatives only, in insertion order, so earlier cluster ids stay stable across batches
+      reps = list(clusters)
       c_result = check_existing(
-        items=batch,
-        clusters=clusters,
+        items=number_items(batch),
+        clusters=number_items(reps),
         context=context
       )
-      cluster_reps = c_result.cluster_reps_that_items_belong_to  
+      cluster_ids = c_result.cluster_ids_that_items_belong_to
       
       # Process each item with its corresponding representative
       for i, item in enumerate(batch):
-        rep = cluster_reps[i] if i < len(cluster_reps) else None
-        if rep is not None and rep in clusters:
+        rep = resolve_id(cluster_ids[i], reps) if i < len(cluster_ids) else None
+        if rep is not None and rep in clusters and not budget.exhausted:
           new_cluster = clusters[rep] | {item}
           v_result = validate(cluster=new_cluster, context=context)
           validated_items = v_result.validated_items
           if len(validated_items) == len(clusters[rep]) + 1:
             clusters[rep].add(item)
           else:
-            clusters[item] = {item}
+            clusters.setdefault(item, set()).add(item)
         else:
-          clusters[item] = {item}
+          clusters.setdefault(item, set()).add(item)
+      report("assign")
+  remaining_items = []
+  report("done")
   new_items = set(clusters.keys())
   
   return new_items, clusters
 
-def cluster_graph(dspy: dspy.dspy, graph: Graph, context: str = "") -> Graph:
+def cluster_graph(
+  dspy: dspy.dspy,
+  graph: Graph,
+  context: str = "",
+  progress: Optional[Callable[[ClusterProgress], None]] = None,
+  max_calls: Optional[int] = None,
+  max_tokens: Optional[int] = None,
+  cluster_map: Optional[ClusterMap] = None,
+  run: Optional[str] = None,
+) -> Graph:
   """Cluster entities and edges in a graph, updating relations accordingly.
   
   Args:
       dspy: The DSPy runtime
       graph: Input graph with entities, edges, and relations
       context: Additional context string for clustering
+      progress: Called with a ClusterProgress snapshot as clustering advances
+      max_calls: Hard cap on LM calls shared by entity and edge clustering
+      max_tokens: Hard cap on LM tokens shared by entity and edge clustering
+      cluster_map: Assignments from earlier runs to apply first; new ones are recorded into it
+      run: Provenance label for newly recorded assignments (defaults to the current time)
       
   Returns:
       Graph with clustered entities and edges, updated relations, and cluster mappings
   """
-  entities, entity_clusters = cluster_items(dspy, graph.entities, "entities", context)
-  edges, edge_clusters = cluster_items(dspy, graph.edges, "edges", context)
+  budget = ClusterBudget(dspy.settings.lm, max_calls, max_tokens)
+  known_entities = cluster_map.representatives("entities") if cluster_map is not None else None
+  known_edges = cluster_map.representatives("edges") if cluster_map is not None else None
+  entities, entity_clusters = cluster_items(dspy, graph.entities, "entities", context, progress, budget, known_entities)
+  edges, edge_clusters = cluster_items(dspy, graph.edges, "edges", context, progress, budget, known_edges)
+  if cluster_map is not None:
+    cluster_map.record("entities", entity_clusters, run)
+    cluster_map.record("edges", edge_clusters, run)
   
-  # Update relations based on clusters
-  relations: set[tuple[str, str, str]] = set()
-  for s, p, o in graph.relations:
-    # Look up subject in entity clusters
-    if s not in entities:
-      for rep, cluster in entity_clusters.items():
-        if s in cluster:
-          s = rep
-          break
-          
-    # Look up predicate in edge clusters
-    if p not in edges:
-      for rep, cluster in edge_clusters.items():
-        if p in cluster:
-          p = rep
-          break
-          
-    # Look up object in entity clusters
-    if o not in entities:
-      for rep, cluster in entity_clusters.items():
-        if o in cluster:
-          o = rep
-          break
-          
-    relations.add((s, p, o))
-
-  return Graph(
+  # Update relations based on clusters; an item keeps its name if it is a representative,
+  # otherwise it maps to the first cluster it belongs to
+  entity_names, edge_names = {}, {}
+  for names, item_clusters, reps in ((entity_names, entity_clusters, entities), (edge_names, edge_clusters, edges)):
+    for rep, cluster in item_clusters.items():
+      for member in cluster:
+        if member not in reps:
+          names.setdefault(member, rep)
+  relations: set[tuple[str, str, str]] = {
+    (entity_names.get(s, s), edge_names.get(p, p), entity_names.get(o, o))
+    for s, p, o in graph.relations
+  }
+
+  clustered = Graph(
     entities=entities,  
     edges=edges,  
     relations=relations,
     entity_clusters=entity_clusters,
     edge_clusters=edge_clusters
   )
+  if graph.provenance is not None:
+    clustered.provenance = graph.provenance.remap(clustered.relations, entity_names, edge_names)
+  return clustered
 
 if __name__ == "__main__":
   import os
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterator, Optional
+
+import dspy
+
+from ..models import Graph, RunStats
+from ..steps._1_get_entities import get_entities
+from ..steps._2_get_relations import get_relations
+from .provenance import ProvenanceBuilder, relation_span
+
+if TYPE_CHECKING:
+  from ..kg_gen import KGGen
+
+BATCH_URL = "/v1/chat/completions"
+
+
+class BatchPending(Exception):
+  """Raised by BatchLM for a request whose result hasn't been ingested yet."""
+
+
+class BatchLM(dspy.LM):
+  """Stand-in LM for batch runs: answers requests from ingested batch results, and records
+  those it can't answer yet instead of sending them.
+
+  Requests are keyed by a hash of their body, so the key is stable across processes and
+  identical requests (repeated chunks) are exported once.
+  """
+
+  def __init__(self, model: str, kwargs: Optional[dict] = None):
+    super().__init__(model=model, cache=False, num_retries=0)
+    # Credentials and client objects stay out of the exported request bodies
+    self.kwargs = {k: v for k, v in (kwargs or {}).items() if not k.startswith("api_") and k != "client"}
+    self.responses: dict[str, str] = {}
+    self.requests: dict[str, dict] = {}
+
+  def body(self, messages: list[dict], kwargs: dict) -> tuple[str, dict]:
+    """(custom_id, request body) of a chat request, with the provider prefix dropped from the model."""
+    body = {"model": self.model.split("/", 1)[-1], "messages": messages, **self.kwargs, **kwargs}
+    return hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest(), body
+
+  def __call__(self, prompt=None, messages=None, **kwargs):
+    messages = messages or [{"role": "user", "content": prompt}]
+    key, body = self.body(messages, kwargs)
+    if key in self.responses:
+      return [self.responses[key]]
+    self.requests[key] = body
+    raise BatchPending(key)
+
+
+class BatchJob:
+  """Extraction through a provider's batch endpoint, for bulk jobs where latency doesn't matter.
+
+  Chunks are extracted in two stages: export() writes the entity requests of every chunk as
+  an OpenAI-format batch JSONL file, and ingest() reads the provider's result file back.
+  The next export() then writes the relation requests, built from the ingested entities.
+  Results go through the same dspy.Predict parsing and relation filtering as generate_many.
+  Failed results, and responses that don't parse (re-asked in JSON mode), are exported
+  again, so repeat export and ingest until done. save() and load() carry a job across
+  processes while a batch runs.
+  """
+
+  def __init__(self, kg: "KGGen", context: str = ""):
+    self.kg = kg
+    self.context = context
+    self.lm = BatchLM(kg.lm.model, kg.lm.kwargs)
+    # Number of chunks of each document, then per chunk: (text, is_conversation) and results
+    self.documents: list[int] = []
+    self.chunks: list[tuple[str, bool]] = []
+    self.entities: list[Optional[list[str]]] = []
+    self.relations: list[Optional[list[tuple[str, str, str]]]] = []
+    self.errors = 0
+    self.unparsed = 0
+    # Length of lm.history already added to a RunStats by graphs()
+    self.recorded = 0
+
+  def add_document(self, chunks: list[str], is_conversation: bool):
+    self.documents.append(len(chunks))
+    for chunk in chunks:
+      self.chunks.append((chunk, is_conversation))
+      self.entities.append(None)
+      self.relations.append(None)
+
+  @property
+  def pending(self) -> int:
+    """Chunks whose relations aren't known yet."""
+    return sum(relations is None for relations in self.relations)
+
+  @property
+  def done(self) -> bool:
+    return self.pending == 0
+
+  def export(self, path: str) -> int:
+    """Write the requests that can be made now as batch JSONL and return how many there are."""
+    requests = self._advance()
+    with open(path, "w", encoding="utf-8") as f:
+      for key, body in requests.items():
+        f.write(json.dumps({"custom_id": key, "method": "POST", "url": BATCH_URL, "body": body}, ensure_ascii=False) + "\n")
+    return len(requests)
+
+  def ingest(self, path: str) -> int:
+    """Read a batch result file, apply its results and return how many were usable."""
+    usable = 0
+    with open(path, "r", encoding="utf-8") as f:
+      for line in f:
+        if not line.strip():
+          continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+          self.errors += 1
+          continue
+        body = response["body"]
+        self.lm.responses[result["custom_id"]] = body["choices"][0]["message"]["content"]
+        self.lm.history.append(dict(
+          prompt=None, messages=None, kwargs={}, response=body, outputs=None, usage=body.get("usage") or {},
+          cost=None, timestamp=datetime.now().isoformat(), uuid=str(uuid.uuid4()),
+          model=self.lm.model, model_type=self.lm.model_type,
+        ))
+        usable += 1
+    self._advance()
+    return usable
+
+  def graphs(self, cluster: bool = False, provenance: bool = False, stats: Optional[RunStats] = None) -> Iterator[Graph]:
+    """Assemble one graph per document, in input order, once every chunk is done.
+
+    Raises:
+        ValueError: If chunks are still pending
+    """
+    if not self.done:
+      raise ValueError(f"{self.pending} chunks are still pending; export and ingest their results first")
+    if stats is not None:
+      self.recorded = stats.record_lm(self.lm, self.recorded)
+    start = 0
+    for n_chunks in self.documents:
+      entities, relations = set(), set()
+      sources = ProvenanceBuilder() if provenance else None
+      for chunk_id, i in enumerate(range(start, start + n_chunks)):
+        entities.update(self.entities[i])
+        relations.update(self.relations[i])
+        if sources is not None:
+          sources.add(chunk_id, self.relations[i], [relation_span(self.chunks[i][0], r) for r in self.relations[i]])
+      start += n_chunks
+      graph = self.kg._finish_graph(entities, relations, cluster, self.context, None, sources)
+      if stats is not None:
+        stats.documents += 1
+        stats.chunks += n_chunks
+        stats.entities += len(graph.entities)
+        stats.relations += len(graph.relations)
+      yield graph
+
+  def save(self, path: str):
+    """Write the job's chunks, results and ingested responses so far to a JSON file.
+
+    Responses are kept so a reloaded job resumes with the same pending requests, e.g. the
+    JSON-mode re-ask of an answer that didn't parse rather than the original request.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+      json.dump({
+        "model": self.lm.model,
+        "kwargs": self.lm.kwargs,
+        "context": self.context,
+        "documents": self.documents,
+        "chunks": self.chunks,
+        "entities": self.entities,
+        "relations": self.relations,
+        "responses": self.lm.responses,
+        "errors": self.errors,
+        "unparsed": self.unparsed,
+      }, f, ensure_ascii=False)
+
+  @classmethod
+  def load(cls, kg: "KGGen", path: str) -> "BatchJob":
+    """Job saved with save(), assembling its graphs with kg."""
+    with open(path, "r", encoding="utf-8") as f:
+      data = json.load(f)
+    job = cls(kg, data["context"])
+    job.lm = BatchLM(data["model"], data["kwargs"])
+    job.lm.responses = data.get("responses", {})
+    job.errors = data.get("errors", 0)
+    job.unparsed = data.get("unparsed", 0)
+    job.documents = data["documents"]
+    job.chunks = [(chunk, is_conversation) for chunk, is_conversation in data["chunks"]]
+    job.entities = data["entities"]
+    job.relations = [None if r is None else [tuple(relation) for relation in r] for r in data["relations"]]
+    return job
+
+  def _advance(self) -> dict[str, dict]:
+    """Apply the ingested results to every chunk they complete and return the requests still needed."""
+    self.lm.requests = {}
+    with dspy.context(lm=self.lm):
+      for i, (chunk, is_conversation) in enumerate(self.chunks):
+        if self.relations[i] is not None:
+          continue
+        try:
+          if self.entities[i] is None:
+            self.entities[i] = get_entities(dspy, chunk, is_conversation=is_conversation, context=self.context)
+          self.relations[i] = get_relations(
+            dspy, chunk, self.entities[i], is_conversation=is_conversation,
+            stats=self.kg.relation_stats, context=self.context
+          )
+        except BatchPending:
+          continue
+        except Exception:
+          # Neither the response nor its JSON-mode re-ask parsed; give up on the stage
+          self.unparsed += 1
+          if self.entities[i] is None:
+            self.entities[i] = []
+          else:
+            self.relations[i] = []
+    return self.lm.requests
+
+
+def run_batch_locally(requests_path: str, results_path: str, lm: dspy.LM):
+  """Answer a batch JSONL file with lm and write an OpenAI-format result file.
+
+  Stands in for the provider's batch endpoint, e.g. with a MockLM in tests, or to run a
+  batch file against a model without one.
+  """
+  with open(requests_path, "r", encoding="utf-8") as f, open(results_path, "w", encoding="utf-8") as out:
+    for line in f:
+      request = json.loads(line)
+      body = dict(request["body"])
+      messages = body.pop("messages")
+      body.pop("model", None)
+      history = len(lm.history)
+      content = lm(messages=messages, **body)[0]
+      usage = lm.history[-1].get("usage") if len(lm.history) > history else None
+      out.write(json.dumps({
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": request["custom_id"],
+        "response": {
+          "status_code": 200,
+          "request_id": uuid.uuid4().hex,
+          "body": {
+            "object": "chat.completion",
+            "model": lm.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage or {},
+          },
+        },
+        "error": None,
+      }, ensure_ascii=False) + "\n")
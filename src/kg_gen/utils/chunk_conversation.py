@@ -0,0 +1,68 @@
+from collections import deque
+from typing import Iterable, Iterator
+
+from .chunk_text import chunk_text
+
+SPEAKER_ROLES = ("user", "assistant")
+
+
+def format_turns(messages: Iterable[dict]) -> Iterator[str]:
+  """Validate messages and format each user/assistant message as a "role: content" turn."""
+  for message in messages:
+    if not isinstance(message, dict) or 'role' not in message or 'content' not in message:
+      raise ValueError("Messages must be dicts with 'role' and 'content' keys")
+    if message['role'] in SPEAKER_ROLES:
+      yield f"{message['role']}: {message['content']}"
+
+
+def split_turn(turn: str, max_chunk_size: int) -> list[str]:
+  """Split a single turn that exceeds the budget by sentence, repeating the speaker on every piece."""
+  role, content = turn.split(": ", 1)
+  prefix = f"{role}: "
+  return [prefix + piece for piece in chunk_text(content, max(1, max_chunk_size - len(prefix)))]
+
+
+def chunk_conversation(messages: Iterable[dict], max_chunk_size: int, overlap_turns: int = 0) -> Iterator[str]:
+  """Pack whole conversation turns into chunks of at most max_chunk_size characters.
+
+  Turns are never split across chunks unless a single turn is larger than the budget, in
+  which case it is split by sentence on its own. Messages are consumed lazily, so very
+  long histories can be streamed.
+
+  Args:
+      messages: Iterable of message dicts with 'role' and 'content' keys
+      max_chunk_size: Max size of a chunk in characters
+      overlap_turns: Number of trailing turns of each chunk to repeat at the start of the
+          next one, so relations spanning a chunk boundary keep their context
+
+  Returns:
+      Iterator over chunks, each a newline-joined run of "role: content" turns
+  """
+  window: deque[str] = deque()
+  size = 0  # characters in the window, counting one separator per turn
+  fresh = False  # whether the window holds turns not yet emitted
+
+  for turn in format_turns(messages):
+    if len(turn) > max_chunk_size:
+      if fresh:
+        yield "\n".join(window)
+      yield from split_turn(turn, max_chunk_size)
+      window.clear()
+      size, fresh = 0, False
+      continue
+
+    if fresh and size + len(turn) > max_chunk_size:
+      yield "\n".join(window)
+      # Carry over the overlap, dropping it as needed so the new turn still fits
+      carried = list(window)[-overlap_turns:] if overlap_turns else []
+      while carried and sum(len(t) + 1 for t in carried) + len(turn) > max_chunk_size:
+        carried.pop(0)
+      window = deque(carried)
+      size = sum(len(t) + 1 for t in carried)
+
+    window.append(turn)
+    size += len(turn) + 1
+    fresh = True
+
+  if fresh:
+    yield "\n".join(window)
@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
+import sys
+from typing import Iterable, Iterator
+
 import nltk
 
 # Ensure the punkt tokenizer is downloaded
 nltk.download('punkt', quiet=True)
 nltk.download('punkt_tab', quiet=True)
 
+STREAM_BUFFER_SIZE = 1 << 16
+
+
 def chunk_text(text: str, max_chunk_size=500) -> list[str]:
     """
     Chunk text by sentence, respecting a maximum chunk size.
@@ -18,8 +25,75 @@ def chunk_text(text: str, max_chunk_size=500) -> list[str]:
     """
     # Step 1: Split text into sentences
     sentences = nltk.sent_tokenize(text)
+    return list(pack_sentences(sentences, max_chunk_size))
+
+
+def iter_chunks(pieces: Iterable[str], max_chunk_size=500, buffer_size=STREAM_BUFFER_SIZE) -> Iterator[str]:
+    """
+    Streaming version of chunk_text over an iterable of text pieces (lines of a file,
+    blocks read from a socket, ...). Only about buffer_size characters of unchunked text
+    are held at a time, so memory stays bounded regardless of the input size.
+
+    :param pieces: Iterable of consecutive pieces of one text.
+    :param max_chunk_size: The maximum length (in characters) of any chunk.
+    :param buffer_size: Characters to accumulate before sentence-tokenizing.
+    :return: An iterator over text chunks.
+    """
+    return pack_sentences(iter_sentences(pieces, buffer_size), max_chunk_size)
+
+
+def iter_file_chunks(path: str, max_chunk_size=500, buffer_size=STREAM_BUFFER_SIZE) -> Iterator[str]:
+    """
+    Stream chunks from a file, or from every file under a directory (in sorted order).
+    Chunks never span two files.
+    """
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield from iter_file_chunks(os.path.join(root, name), max_chunk_size, buffer_size)
+        return
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        blocks = iter(lambda: f.read(buffer_size), '')
+        yield from iter_chunks(blocks, max_chunk_size, buffer_size)
 
-    chunks = []
+
+def iter_sentences(pieces: Iterable[str], buffer_size=STREAM_BUFFER_SIZE) -> Iterator[str]:
+    """
+    Sentence-tokenize a stream of text pieces. The last sentence of each buffer may be
+    cut off mid-way, so it is carried over and re-tokenized together with the next piece.
+    """
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) < buffer_size:
+            continue
+        sentences = nltk.sent_tokenize(buffer)
+        if not sentences:
+            buffer = ""
+            continue
+        yield from sentences[:-1]
+        # Keep the raw tail (not the stripped sentence) so whitespace before the next piece survives
+        buffer = buffer[buffer.rfind(sentences[-1]):]
+        # A single "sentence" longer than the buffer (e.g. unpunctuated logs) is released
+        # up to its last whitespace so the buffer can't grow without bound; the word being
+        # cut is carried over. Only a buffer with no whitespace at all is released whole.
+        if len(buffer) >= buffer_size:
+            cut = max(buffer.rfind(" "), buffer.rfind("\n"), buffer.rfind("\t"))
+            cut = cut + 1 if cut > 0 else len(buffer)
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+
+    if buffer:
+        yield from nltk.sent_tokenize(buffer)
+
+
+def pack_sentences(sentences: Iterable[str], max_chunk_size=500) -> Iterator[str]:
+    """
+    Greedily pack sentences into chunks of at most max_chunk_size characters.
+    Falls back to word-based chunking if a single sentence is too large.
+    """
     current_chunk = ""
 
     for sentence in sentences:
@@ -29,7 +103,7 @@ def chunk_text(text: str, max_chunk_size=500) -> list[str]:
         else:
             # If the current chunk has some content, push it and start a new one.
             if current_chunk:
-                chunks.append(current_chunk.strip())
+                yield current_chunk.strip()
                 current_chunk = ""
 
             # Check if the sentence itself is larger than the limit.
@@ -42,21 +116,19 @@ def chunk_text(text: str, max_chunk_size=500) -> list[str]:
                     if len(temp_chunk) + len(word) + 1 <= max_chunk_size:
                         temp_chunk += word + " "
                     else:
-                        chunks.append(temp_chunk.strip())
+                        yield temp_chunk.strip()
                         temp_chunk = word + " "
 
                 # Add the leftover if any
                 if temp_chunk:
-                    chunks.append(temp_chunk.strip())
+                    yield temp_chunk.strip()
             else:
                 # If the sentence is smaller than max_chunk_size, just start a new chunk with it.
                 current_chunk = sentence + " "
 
     # If there's a leftover chunk that didn't get pushed, add it
     if current_chunk:
-        chunks.append(current_chunk.strip())
-
-    return chunks
+        yield current_chunk.strip()
 
 
 def main():
@@ -77,16 +149,11 @@ def main():
     )
     args = parser.parse_args()
 
-    # Read the input text
+    # Stream the input text so large files and pipes are never fully loaded
     if args.input_file:
-        with open(args.input_file, 'r', encoding='utf-8') as f:
-            text = f.read()
+        result_chunks = iter_file_chunks(args.input_file, max_chunk_size=args.max_chunk_size)
     else:
-        import sys
-        text = sys.stdin.read()
-
-    # Chunk the text
-    result_chunks = chunk_text(text, max_chunk_size=args.max_chunk_size)
+        result_chunks = iter_chunks(sys.stdin, max_chunk_size=args.max_chunk_size)
 
     # Print or otherwise process the chunks
     for i, chunk in enumerate(result_chunks, start=1):
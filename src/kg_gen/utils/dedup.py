@@ -0,0 +1,118 @@
+import hashlib
+import re
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 64
+DEFAULT_BANDS = 16
+DEFAULT_SHINGLE_SIZE = 3
+
+
+def normalize_text(text: str) -> str:
+  return re.sub(r"\s+", " ", text.casefold()).strip()
+
+
+def shingle_hashes(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> np.ndarray:
+  """64-bit hashes of the text's overlapping word size-grams (the whole text if shorter)."""
+  words = text.split(" ")
+  count = max(1, len(words) - size + 1)
+  shingles = {" ".join(words[i:i + size]) for i in range(count)}
+  return np.array(
+    [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles],
+    dtype=np.uint64,
+  )
+
+
+class ChunkDeduplicator:
+  """Finds chunks that are identical or nearly identical to one already extracted, so their
+  extraction result can be reused instead of calling the LLM again.
+
+  Exact repeats (after casefolding and collapsing whitespace) are found by hash. Near
+  repeats use MinHash signatures over word shingles, bucketed with LSH banding so a lookup
+  only compares against chunks sharing a band; a candidate counts as a duplicate when its
+  estimated Jaccard similarity is at least threshold. Pass the same instance to several
+  runs to reuse results across them; skipped counts the chunks that were not extracted.
+  """
+
+  def __init__(
+    self,
+    threshold: float = DEFAULT_THRESHOLD,
+    num_perm: int = DEFAULT_NUM_PERM,
+    bands: int = DEFAULT_BANDS,
+    shingle_size: int = DEFAULT_SHINGLE_SIZE,
+    seed: int = 0,
+  ):
+    """
+    Args:
+        threshold: Min estimated Jaccard similarity of shingles to count as a duplicate
+        num_perm: MinHash signature length; must be divisible by bands
+        bands: LSH bands; more bands find candidates at lower similarity
+        shingle_size: Words per shingle
+    """
+    if num_perm % bands:
+      raise ValueError("num_perm must be divisible by bands")
+    self.threshold = threshold
+    self.bands = bands
+    self.shingle_size = shingle_size
+    self.skipped = 0
+    rng = np.random.default_rng(seed)
+    # Multiply-shift hash family: odd multipliers, products wrap modulo 2**64
+    self._multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    self._offsets = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    self._exact: dict[str, int] = {}
+    self._signatures: list[np.ndarray] = []
+    self._results: list[Future] = []
+    self._buckets: list[dict[bytes, list[int]]] = [{} for _ in range(bands)]
+    self._lock = threading.Lock()
+
+  def signature(self, text: str) -> np.ndarray:
+    hashes = shingle_hashes(normalize_text(text), self.shingle_size)
+    with np.errstate(over="ignore"):
+      permuted = hashes[:, None] * self._multipliers[None, :] + self._offsets[None, :]
+    return (permuted >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+  def __len__(self) -> int:
+    return len(self._results)
+
+  def claim(self, text: str, namespace: str = "") -> tuple[Future, bool]:
+    """Future holding the extraction result for text, and whether the caller must compute it.
+
+    The first chunk of its kind gets a new future (True) that the caller resolves with its
+    result or exception; an equivalent later chunk gets that same future (False). Chunks
+    only match within the same namespace, e.g. conversation vs plain text.
+    """
+    normalized = normalize_text(text)
+    digest = hashlib.sha1(f"{namespace}\n{normalized}".encode("utf-8")).hexdigest()
+    signature = self.signature(normalized)
+    prefix = namespace.encode("utf-8") + b"\n"
+    bands = [prefix + band.tobytes() for band in np.split(signature, self.bands)]
+    with self._lock:
+      if digest in self._exact:
+        return self._reuse(self._exact[digest])
+      candidates = []
+      for band, bucket in zip(bands, self._buckets):
+        candidates.extend(bucket.get(band, ()))
+      for candidate in dict.fromkeys(candidates):
+        if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+          return self._reuse(candidate)
+
+      key = len(self._results)
+      future = Future()
+      self._results.append(future)
+      self._signatures.append(signature)
+      self._exact[digest] = key
+      for band, bucket in zip(bands, self._buckets):
+        bucket.setdefault(band, []).append(key)
+    return future, True
+
+  def _reuse(self, key: int) -> tuple[Future, bool]:
+    future = self._results[key]
+    # A failed extraction is retried by the next equivalent chunk rather than reused
+    if future.done() and future.exception() is not None:
+      future = self._results[key] = Future()
+      return future, True
+    self.skipped += 1
+    return future, False
@@ -0,0 +1,71 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+DEFAULT_MAX_RECENT = 50
+EDGE_PUNCTUATION = "\"'`.,;:!?()[]{}<>"
+
+
+def normalize_name(name: str) -> str:
+  """Casefold, collapse whitespace and trim surrounding punctuation."""
+  return re.sub(r"\s+", " ", name.casefold()).strip().strip(EDGE_PUNCTUATION).strip()
+
+
+class EntityRegistry:
+  """Thread-safe canonical-name index shared by all chunks of a run.
+
+  The first spelling seen for a normalized name becomes its canonical form. Later chunks
+  get the most recently seen canonical names in their extraction prompt, and any mention
+  that normalizes to a known name is mapped onto the canonical spelling locally, so the
+  same entity isn't re-extracted under several spellings for clustering to merge later.
+  """
+
+  def __init__(self, max_recent: int = DEFAULT_MAX_RECENT):
+    """
+    Args:
+        max_recent: How many recently seen canonical names to feed into later prompts
+    """
+    self.max_recent = max_recent
+    self.reused = 0
+    self._canonical: dict[str, str] = {}
+    self._recent: OrderedDict[str, None] = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._canonical)
+
+  def __contains__(self, name: str) -> bool:
+    return normalize_name(name) in self._canonical
+
+  def lookup(self, name: str) -> Optional[str]:
+    """Canonical spelling of name, or None if it hasn't been seen."""
+    return self._canonical.get(normalize_name(name))
+
+  def recent(self) -> list[str]:
+    """Most recently seen canonical names, newest first."""
+    with self._lock:
+      return list(reversed(self._recent))
+
+  def canonicalize(self, names: Iterable[str]) -> list[str]:
+    """Map names onto canonical spellings, registering unseen ones. Order is kept, duplicates dropped."""
+    result = []
+    seen = set()
+    with self._lock:
+      for name in names:
+        key = normalize_name(name)
+        if not key:
+          continue
+        canonical = self._canonical.get(key)
+        if canonical is None:
+          canonical = self._canonical[key] = name.strip()
+        elif canonical != name:
+          self.reused += 1
+        self._recent[canonical] = None
+        self._recent.move_to_end(canonical)
+        if len(self._recent) > self.max_recent:
+          self._recent.popitem(last=False)
+        if canonical not in seen:
+          seen.add(canonical)
+          result.append(canonical)
+    return result
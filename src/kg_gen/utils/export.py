@@ -0,0 +1,203 @@
+import csv
+import os
+from itertools import islice
+from typing import IO, Iterable, Iterator, Optional, Union
+from urllib.parse import quote
+
+from ..models import Graph
+
+DEFAULT_BASE_IRI = "http://kg-gen.local/"
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHUNK_LINES = 10_000
+ARRAY_DELIMITER = ";"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+SKOS_ALT_LABEL = "http://www.w3.org/2004/02/skos/core#altLabel"
+
+PathOrFile = Union[str, os.PathLike, IO[str]]
+
+
+def aliases(clusters: Optional[dict[str, set[str]]], name: str) -> list[str]:
+  """Cluster members merged into name, other than name itself."""
+  return sorted(member for member in (clusters or {}).get(name, ()) if member != name)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+  iterator = iter(items)
+  while batch := list(islice(iterator, size)):
+    yield batch
+
+
+def write_chunked(lines: Iterable[str], target: PathOrFile, chunk_lines: int = DEFAULT_CHUNK_LINES) -> int:
+  """Write lines to a path or open file chunk_lines at a time. Returns the number of lines."""
+  if isinstance(target, (str, os.PathLike)):
+    with open(target, "w", encoding="utf-8", newline="") as f:
+      return write_chunked(lines, f, chunk_lines)
+  count = 0
+  for chunk in batched(lines, chunk_lines):
+    target.write("".join(chunk))
+    count += len(chunk)
+  return count
+
+
+# ~~~ NEO4J ADMIN IMPORT ~~~
+def write_neo4j_csv(
+  graph: Graph,
+  directory: str,
+  label: str = "Entity",
+  relationship_type: str = "RELATION",
+  array_delimiter: str = ARRAY_DELIMITER,
+) -> tuple[str, str]:
+  """Write node and relationship CSVs for `neo4j-admin database import full`.
+
+  Entities become :Entity nodes keyed by name, relations become relationships carrying
+  the predicate as a property. Cluster members are kept as `aliases` string arrays on the
+  nodes and relationships. Import with:
+
+      neo4j-admin database import full --nodes=entities.csv --relationships=relations.csv
+
+  adding `--array-delimiter=<array_delimiter>` if it isn't ";". neo4j-admin has no way
+  to escape the delimiter, so an alias containing it raises instead of splitting in two.
+
+  Returns:
+      Paths of the nodes and relationships files
+  """
+  def array(clusters, name):
+    members = aliases(clusters, name)
+    for member in members:
+      if array_delimiter in member:
+        raise ValueError(
+          f"Alias {member!r} of {name!r} contains the array delimiter {array_delimiter!r}; "
+          "pass another array_delimiter"
+        )
+    return array_delimiter.join(members)
+
+  os.makedirs(directory, exist_ok=True)
+  nodes_path = os.path.join(directory, "entities.csv")
+  relations_path = os.path.join(directory, "relations.csv")
+  id_space = f"({label})"
+
+  with open(nodes_path, "w", encoding="utf-8", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow([f"name:ID{id_space}", "aliases:string[]", ":LABEL"])
+    for entity in graph.entities:
+      writer.writerow([entity, array(graph.entity_clusters, entity), label])
+
+  with open(relations_path, "w", encoding="utf-8", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow([f":START_ID{id_space}", "predicate", "aliases:string[]", f":END_ID{id_space}", ":TYPE"])
+    for s, p, o in graph.relations:
+      writer.writerow([s, p, array(graph.edge_clusters, p), o, relationship_type])
+
+  return nodes_path, relations_path
+
+
+# ~~~ RDF ~~~
+def iri_part(name: str) -> str:
+  # Percent-encode everything but letters, digits, "_" and "-" so the result is valid in
+  # full IRIs and, unless it starts with "-" or a digit, in Turtle local names
+  return quote(name, safe="").replace(".", "%2E").replace("~", "%7E")
+
+
+def prefixed_name(prefix: str, namespace: str, name: str) -> str:
+  """Turtle name of namespace + iri_part(name): prefixed where the local name is valid,
+  else the full IRI (the same IRI N-Triples uses, rather than a re-encoded one)."""
+  part = iri_part(name)
+  if not part or part[0] == "-" or part[0].isdigit():
+    return f"<{namespace}{part}>"
+  return f"{prefix}:{part}"
+
+
+def literal(value: str) -> str:
+  escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+  return f'"{escaped}"'
+
+
+def iter_ntriples(graph: Graph, base: str = DEFAULT_BASE_IRI) -> Iterator[str]:
+  """N-Triples lines for the graph: its relations, a label for every entity and edge, and
+  cluster members as skos:altLabel."""
+  def entity(name):
+    return f"<{base}entity/{iri_part(name)}>"
+  def edge(name):
+    return f"<{base}relation/{iri_part(name)}>"
+
+  for s, p, o in graph.relations:
+    yield f"{entity(s)} {edge(p)} {entity(o)} .\n"
+  for names, node, clusters in ((graph.entities, entity, graph.entity_clusters), (graph.edges, edge, graph.edge_clusters)):
+    for name in names:
+      yield f"{node(name)} <{RDFS_LABEL}> {literal(name)} .\n"
+      for alias in aliases(clusters, name):
+        yield f"{node(name)} <{SKOS_ALT_LABEL}> {literal(alias)} .\n"
+
+
+def iter_turtle(graph: Graph, base: str = DEFAULT_BASE_IRI) -> Iterator[str]:
+  """Turtle lines for the same statements as iter_ntriples, with prefixed names."""
+  def entity(name):
+    return prefixed_name("e", f"{base}entity/", name)
+  def edge(name):
+    return prefixed_name("r", f"{base}relation/", name)
+
+  yield f"@prefix e: <{base}entity/> .\n"
+  yield f"@prefix r: <{base}relation/> .\n"
+  yield "@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .\n"
+  yield "@prefix skos: <http://www.w3.org/2004/02/skos/core#> .\n\n"
+  for s, p, o in graph.relations:
+    yield f"{entity(s)} {edge(p)} {entity(o)} .\n"
+  for names, node, clusters in ((graph.entities, entity, graph.entity_clusters), (graph.edges, edge, graph.edge_clusters)):
+    for name in names:
+      labels = [f"rdfs:label {literal(name)}"] + [f"skos:altLabel {literal(alias)}" for alias in aliases(clusters, name)]
+      yield f"{node(name)} " + " ; ".join(labels) + " .\n"
+
+
+def write_ntriples(graph: Graph, target: PathOrFile, base: str = DEFAULT_BASE_IRI, chunk_lines: int = DEFAULT_CHUNK_LINES) -> int:
+  """Stream the graph as N-Triples to a path or open file. Returns the number of lines written."""
+  return write_chunked(iter_ntriples(graph, base), target, chunk_lines)
+
+
+def write_turtle(graph: Graph, target: PathOrFile, base: str = DEFAULT_BASE_IRI, chunk_lines: int = DEFAULT_CHUNK_LINES) -> int:
+  """Stream the graph as Turtle to a path or open file. Returns the number of lines written."""
+  return write_chunked(iter_turtle(graph, base), target, chunk_lines)
+
+
+# ~~~ CYPHER ~~~
+def cypher_batches(
+  graph: Graph,
+  batch_size: int = DEFAULT_BATCH_SIZE,
+  label: str = "Entity",
+  relationship_type: str = "RELATION",
+) -> Iterator[tuple[str, dict]]:
+  """Parameterized (query, parameters) pairs that MERGE the graph in batches of UNWIND rows.
+
+  The first statement creates a uniqueness constraint on the node name so the MERGEs use
+  an index lookup instead of a label scan.
+  """
+  yield f"CREATE CONSTRAINT {label.lower()}_name IF NOT EXISTS FOR (n:`{label}`) REQUIRE n.name IS UNIQUE", {}
+
+  node_query = (
+    f"UNWIND $rows AS row MERGE (n:`{label}` {{name: row.name}}) SET n.aliases = row.aliases"
+  )
+  for batch in batched(graph.entities, batch_size):
+    yield node_query, {"rows": [{"name": e, "aliases": aliases(graph.entity_clusters, e)} for e in batch]}
+
+  relation_query = (
+    f"UNWIND $rows AS row "
+    f"MATCH (s:`{label}` {{name: row.subject}}) MATCH (o:`{label}` {{name: row.object}}) "
+    f"MERGE (s)-[r:`{relationship_type}` {{predicate: row.predicate}}]->(o) SET r.aliases = row.aliases"
+  )
+  for batch in batched(graph.relations, batch_size):
+    yield relation_query, {"rows": [
+      {"subject": s, "predicate": p, "object": o, "aliases": aliases(graph.edge_clusters, p)}
+      for s, p, o in batch
+    ]}
+
+
+def write_cypher(graph: Graph, session, batch_size: int = DEFAULT_BATCH_SIZE, **kwargs) -> int:
+  """Run cypher_batches against anything with a neo4j-style session.run(query, parameters).
+
+  Returns:
+      Number of statements run
+  """
+  count = 0
+  for query, parameters in cypher_batches(graph, batch_size, **kwargs):
+    session.run(query, parameters)
+    count += 1
+  return count
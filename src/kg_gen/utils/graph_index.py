@@ -0,0 +1,133 @@
+from typing import Iterable, Literal, Optional
+
+import numpy as np
+
+Direction = Literal["out", "in", "both"]
+
+
+class GraphIndex:
+  """Interned, CSR-style adjacency over a graph's relations.
+
+  Entities and edges are interned to integer ids (their position in sorted order) and the
+  relations are stored once as an (m, 3) int32 array sorted by subject. out_indptr slices
+  that array by subject; in_indptr/in_order slice it by object, so neighborhood queries in
+  either direction are array gathers instead of scans over the relation set.
+  """
+
+  def __init__(self, entities: Iterable[str], edges: Iterable[str], relations: Iterable[tuple[str, str, str]]):
+    self.entities = sorted(entities)
+    self.edges = sorted(edges)
+    self.entity_ids = {name: i for i, name in enumerate(self.entities)}
+    self.edge_ids = {name: i for i, name in enumerate(self.edges)}
+
+    triples = np.array(
+      [(self.entity_ids[s], self.edge_ids[p], self.entity_ids[o]) for s, p, o in relations],
+      dtype=np.int32,
+    ).reshape(-1, 3)
+    n = len(self.entities)
+
+    order = np.lexsort((triples[:, 2], triples[:, 1], triples[:, 0]))
+    self.triples = triples[order]
+    self.out_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(self.triples[:, 0], minlength=n), out=self.out_indptr[1:])
+
+    self.in_order = np.argsort(self.triples[:, 2], kind="stable")
+    self.in_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(self.triples[:, 2], minlength=n), out=self.in_indptr[1:])
+
+  def ids(self, entities: Iterable[str]) -> np.ndarray:
+    return np.array([self.entity_ids[e] for e in entities if e in self.entity_ids], dtype=np.int64)
+
+  def names(self, ids: Iterable[int]) -> set[str]:
+    return {self.entities[i] for i in ids}
+
+  def relation(self, row: int) -> tuple[str, str, str]:
+    s, p, o = self.triples[row]
+    return self.entities[s], self.edges[p], self.entities[o]
+
+  def out_degree(self, ids: np.ndarray) -> np.ndarray:
+    return self.out_indptr[ids + 1] - self.out_indptr[ids]
+
+  def in_degree(self, ids: np.ndarray) -> np.ndarray:
+    return self.in_indptr[ids + 1] - self.in_indptr[ids]
+
+  def relation_rows(self, ids: np.ndarray, direction: Direction = "out") -> np.ndarray:
+    """Rows of self.triples incident to the given entity ids."""
+    if direction == "both":
+      return np.union1d(self.relation_rows(ids, "out"), self.relation_rows(ids, "in"))
+    indptr = self.out_indptr if direction == "out" else self.in_indptr
+    starts, ends = indptr[ids], indptr[ids + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+      return np.zeros(0, dtype=np.int64)
+    # Expand each [start, end) range into explicit positions without a Python loop
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    positions = np.arange(total, dtype=np.int64) + offsets
+    return positions if direction == "out" else self.in_order[positions]
+
+  def neighbor_ids(self, ids: np.ndarray, direction: Direction = "out") -> np.ndarray:
+    if direction == "both":
+      return np.union1d(self.neighbor_ids(ids, "out"), self.neighbor_ids(ids, "in"))
+    rows = self.relation_rows(ids, direction)
+    return np.unique(self.triples[rows, 2 if direction == "out" else 0])
+
+  def k_hop(self, ids: np.ndarray, k: int, direction: Direction = "out") -> tuple[np.ndarray, np.ndarray]:
+    """Expand seed ids k hops.
+
+    Returns:
+        Tuple of (reached entity ids including the seeds, rows of the traversed relations)
+    """
+    visited = np.zeros(len(self.entities), dtype=bool)
+    visited[ids] = True
+    frontier = np.unique(ids)
+    traversed = []
+    for _ in range(k):
+      if len(frontier) == 0:
+        break
+      rows = self.relation_rows(frontier, direction)
+      traversed.append(rows)
+      if direction == "out":
+        reached = self.triples[rows, 2]
+      elif direction == "in":
+        reached = self.triples[rows, 0]
+      else:
+        reached = np.concatenate([self.triples[rows, 0], self.triples[rows, 2]])
+      reached = np.unique(reached)
+      frontier = reached[~visited[reached]]
+      visited[frontier] = True
+    rows = np.unique(np.concatenate(traversed)) if traversed else np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(visited), rows
+
+  def _keys(self, s: np.ndarray, p: np.ndarray, o: np.ndarray) -> Optional[np.ndarray]:
+    """int64 keys ordered like self.triples, or None if they would overflow."""
+    n_entities, n_edges = max(len(self.entities), 1), max(len(self.edges), 1)
+    if n_entities * n_entities * n_edges >= 2 ** 63:
+      return None
+    return (s.astype(np.int64) * n_edges + p) * n_entities + o
+
+  def _find(self, s: np.ndarray, p: np.ndarray, o: np.ndarray) -> np.ndarray:
+    """Rows holding the given id triples, -1 where an id is -1 or the triple is absent."""
+    valid = (s >= 0) & (p >= 0) & (o >= 0)
+    result = np.full(len(s), -1, dtype=np.int64)
+    if len(self.triples) == 0 or not valid.any():
+      return result
+    keys = self._keys(self.triples[:, 0], self.triples[:, 1], self.triples[:, 2])
+    if keys is None:
+      lookup = {tuple(t): row for row, t in enumerate(self.triples.tolist())}
+      for i in np.flatnonzero(valid):
+        result[i] = lookup.get((int(s[i]), int(p[i]), int(o[i])), -1)
+      return result
+    queries = self._keys(s[valid], p[valid], o[valid])
+    positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    result[valid] = np.where(keys[positions] == queries, positions, -1)
+    return result
+
+  def rows(self, relations: Iterable[tuple[str, str, str]]) -> np.ndarray:
+    """Row of each relation in self.triples, or -1 for relations not in the graph."""
+    ids = np.array(
+      [(self.entity_ids.get(s, -1), self.edge_ids.get(p, -1), self.entity_ids.get(o, -1)) for s, p, o in relations],
+      dtype=np.int64,
+    ).reshape(-1, 3)
+    return self._find(ids[:, 0], ids[:, 1], ids[:, 2])
+
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+import dspy
+import numpy as np
+
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_MAX_EXTRA = 0.05
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_WINDOW = 200
+DEFAULT_MAX_WORKERS = 64
+
+
+class HedgedLM(dspy.LM):
+  """Wraps a dspy LM to cut tail latency with hedged requests.
+
+  Latencies of completed calls are kept over a sliding window. Once min_samples are in, a
+  call still running after the window's percentile latency gets a duplicate request, and
+  whichever returns first is used. The loser is cancelled if it hasn't started. A request
+  already on the wire can't be interrupted from a thread, so its response is discarded
+  when it arrives. Both requests are billed, so at most max_extra duplicates per call made
+  are sent; with the default 0.05, hedging adds at most 5% to the call count.
+
+  The wrapped LM's kwargs and history are shared, so usage accounting (RunStats, cost)
+  sees every request, duplicates included.
+  """
+
+  def __init__(
+    self,
+    lm: dspy.LM,
+    percentile: float = DEFAULT_PERCENTILE,
+    max_extra: float = DEFAULT_MAX_EXTRA,
+    min_samples: int = DEFAULT_MIN_SAMPLES,
+    window: int = DEFAULT_WINDOW,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+  ):
+    """
+    Args:
+        lm: LM that makes the actual requests
+        percentile: Latency percentile of recent calls after which a call is hedged
+        max_extra: Max duplicate requests as a fraction of calls made
+        min_samples: Completed calls observed before hedging starts
+        window: Number of recent call latencies the percentile is taken over
+        max_workers: Threads available for concurrent primary and duplicate requests
+    """
+    super().__init__(model=lm.model, model_type=lm.model_type, cache=False, num_retries=0)
+    self.lm = lm
+    self.kwargs = lm.kwargs
+    self.history = lm.history
+    self.percentile = percentile
+    self.max_extra = max_extra
+    self.min_samples = min_samples
+    self.calls = 0
+    self.hedged = 0
+    self.hedge_wins = 0
+    self._latencies: deque[float] = deque(maxlen=window)
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kg-gen-hedge")
+
+  def threshold(self) -> Optional[float]:
+    """Seconds after which a call is hedged, or None while too few calls have completed."""
+    with self._lock:
+      if len(self._latencies) < self.min_samples:
+        return None
+      return float(np.percentile(self._latencies, self.percentile))
+
+  def __call__(self, prompt=None, messages=None, **kwargs):
+    with self._lock:
+      self.calls += 1
+    delay = self.threshold()
+    if delay is None:
+      return self._request(prompt, messages, kwargs)
+
+    primary = self._executor.submit(self._request, prompt, messages, kwargs)
+    futures = [primary]
+    if not wait(futures, timeout=delay).done:
+      with self._lock:
+        hedge = self.hedged < self.max_extra * self.calls
+        if hedge:
+          self.hedged += 1
+      if hedge:
+        futures.append(self._executor.submit(self._request, prompt, messages, kwargs))
+
+    pending = set(futures)
+    while pending:
+      done, pending = wait(pending, return_when=FIRST_COMPLETED)
+      winner = next((future for future in done if future.exception() is None), None)
+      if winner is not None:
+        for future in pending:
+          future.cancel()
+        if winner is not primary:
+          with self._lock:
+            self.hedge_wins += 1
+        return winner.result()
+    return primary.result()
+
+  def _request(self, prompt, messages, kwargs):
+    start = time.perf_counter()
+    outputs = self.lm(prompt=prompt, messages=messages, **kwargs)
+    with self._lock:
+      self._latencies.append(time.perf_counter() - start)
+    return outputs
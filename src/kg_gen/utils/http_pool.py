@@ -0,0 +1,64 @@
+import json
+import os
+from typing import Callable, Optional
+
+import httpx
+import openai
+
+# Idle connections are kept this long, so gaps between documents don't cost a new handshake
+KEEPALIVE_EXPIRY = 60.0
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 600.0
+
+
+def pooled_http_client(max_connections: int) -> httpx.Client:
+  """Keep-alive client holding up to max_connections open connections per host."""
+  limits = httpx.Limits(
+    max_connections=max_connections,
+    max_keepalive_connections=max_connections,
+    keepalive_expiry=KEEPALIVE_EXPIRY,
+  )
+  return httpx.Client(limits=limits, timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT))
+
+
+class PooledOpenAI(openai.OpenAI):
+  """OpenAI client on a shared connection pool, passed to litellm as client=."""
+
+  def __json__(self) -> str:
+    # dspy keys its in-memory request cache on the request's JSON and skips the cache when
+    # that fails. Which pool sends a request doesn't change its response, but the endpoint does
+    return json.dumps(f"pooled-openai-client:{self.base_url}")
+
+
+def openai_client(
+  model: str,
+  http_client: Callable[[], httpx.Client],
+  api_key: Optional[str] = None,
+  api_base: Optional[str] = None,
+) -> Optional[PooledOpenAI]:
+  """Client for model's endpoint on the pool returned by http_client, which is only called
+  when a client is returned.
+
+  The base URL is the one litellm resolves (api_base, the provider's own variables,
+  litellm.api_base or OPENAI_API_BASE). Without one, the openai SDK picks it as it would
+  for a client of its own: OPENAI_BASE_URL, then api.openai.com.
+
+  Returns None when litellm doesn't send model's requests through an OpenAI client (e.g.
+  Anthropic or Gemini models), or when no API key is configured yet.
+  """
+  import litellm
+  try:
+    _, provider, dynamic_key, dynamic_base = litellm.get_llm_provider(model, api_key=api_key, api_base=api_base)
+  except Exception:
+    return None
+  if provider == "openai":
+    api_base = api_base or dynamic_base or litellm.api_base or os.getenv("OPENAI_API_BASE")
+    api_key = api_key or dynamic_key or litellm.api_key or litellm.openai_key or os.getenv("OPENAI_API_KEY")
+  elif provider in litellm.openai_compatible_providers and (api_base or dynamic_base):
+    api_base = api_base or dynamic_base
+    api_key = api_key or dynamic_key or ""
+  else:
+    return None
+  if api_key is None:
+    return None
+  return PooledOpenAI(api_key=api_key, base_url=api_base, http_client=http_client())
@@ -0,0 +1,36 @@
+from typing import Callable, Hashable, Iterable, Iterator, TypeVar
+
+CHARS_PER_TOKEN = 4
+MAX_PACK_ITEMS = 32
+
+T = TypeVar("T")
+
+
+def estimate_tokens(text: str) -> int:
+  """Rough token count of text, at about four characters per token."""
+  return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def pack_items(
+  items: Iterable[T],
+  max_tokens: int,
+  size: Callable[[T], int],
+  group: Callable[[T], Hashable] = lambda item: None,
+  max_items: int = MAX_PACK_ITEMS,
+) -> Iterator[list[T]]:
+  """Group consecutive items into packs of at most max_tokens tokens, as measured by size.
+
+  Items are pulled lazily and keep their order. A pack holds at most max_items items, all
+  with the same group key; an item larger than max_tokens gets a pack of its own.
+  """
+  current: list[T] = []
+  tokens = 0
+  for item in items:
+    item_tokens = size(item)
+    if current and (tokens + item_tokens > max_tokens or len(current) >= max_items or group(item) != group(current[0])):
+      yield current
+      current, tokens = [], 0
+    current.append(item)
+    tokens += item_tokens
+  if current:
+    yield current
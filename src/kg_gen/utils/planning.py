@@ -0,0 +1,255 @@
+import math
+from functools import lru_cache
+from typing import Callable, Optional
+
+import dspy
+from pydantic import BaseModel
+
+from ..models import RunStats
+from ..steps._1_get_entities import ConversationEntities, PackedConversationEntities, PackedTextEntities, TextEntities
+from ..steps._2_get_relations import ConversationRelations, PackedConversationRelations, PackedTextRelations, TextRelations
+from ..steps._3_cluster_graph import (
+  BATCH_SIZE, MIN_PATIENCE, ChooseRepresentative, CheckExistingClusters, ExtractCluster, ValidateCluster,
+)
+from .packing import CHARS_PER_TOKEN, estimate_tokens, pack_items
+
+MESSAGE_OVERHEAD = 4
+# "[[ ## field ## ]]" headers and the completed marker around a response
+OUTPUT_OVERHEAD = 15
+PACKED_ITEM_OVERHEAD = 2
+CLUSTER_ID_TOKENS = 3
+REASONING_TOKENS = 60
+COMPARED = ("chunks", "llm_calls", "prompt_tokens", "completion_tokens", "cost", "seconds")
+
+
+@lru_cache(maxsize=None)
+def token_counter(model: str) -> Callable[[str], int]:
+  """Local token counter for model: its tiktoken encoding when available offline, else
+  cl100k_base, else about four characters per token."""
+  try:
+    import tiktoken
+    try:
+      encoding = tiktoken.encoding_for_model(model.split("/")[-1])
+    except KeyError:
+      encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+  except Exception:
+    return lambda text: -(-len(text) // CHARS_PER_TOKEN)
+
+
+class PlanAssumptions(BaseModel):
+  """Rates a dry run can't measure without calling a model.
+
+  The defaults are rough figures for English prose; for tighter estimates, set them from a
+  small pilot run on the same kind of data.
+  """
+  entities_per_1k_tokens: float = 40.0
+  relations_per_1k_tokens: float = 30.0
+  tokens_per_entity: float = 5.0
+  tokens_per_relation: float = 16.0
+  # Distinct entities per entity mention and distinct predicates per relation, corpus-wide
+  distinct_entity_rate: float = 0.5
+  distinct_edge_rate: float = 0.3
+  # Share of distinct items clustering merges into another item
+  duplicate_rate: float = 0.1
+  seconds_per_call: float = 0.8
+  output_tokens_per_second: float = 60.0
+
+
+class Plan(BaseModel):
+  """Estimated LLM calls, tokens, cost and wall-clock time of a run, from KGGen.plan."""
+  model: str
+  concurrency: int
+  documents: int = 0
+  chunks: int = 0
+  source_tokens: int = 0
+  extraction_calls: int = 0
+  extraction_prompt_tokens: int = 0
+  extraction_completion_tokens: int = 0
+  entities: int = 0
+  edges: int = 0
+  cluster_calls: int = 0
+  cluster_prompt_tokens: int = 0
+  cluster_completion_tokens: int = 0
+  cost: float = 0.0
+  seconds: float = 0.0
+
+  @property
+  def llm_calls(self) -> int:
+    return self.extraction_calls + self.cluster_calls
+
+  @property
+  def prompt_tokens(self) -> int:
+    return self.extraction_prompt_tokens + self.cluster_prompt_tokens
+
+  @property
+  def completion_tokens(self) -> int:
+    return self.extraction_completion_tokens + self.cluster_completion_tokens
+
+  def compare(self, stats: RunStats) -> dict[str, dict[str, float]]:
+    """Estimate, actual value and actual/estimate ratio of each counter RunStats also has."""
+    comparison = {}
+    for name in COMPARED:
+      estimate, actual = getattr(self, name), getattr(stats, name)
+      comparison[name] = {"estimate": estimate, "actual": actual, "ratio": actual / estimate if estimate else 0.0}
+    return comparison
+
+  def report(self, stats: Optional[RunStats] = None) -> str:
+    """Human-readable summary, with actual values next to the estimates when stats is given."""
+    lines = [
+      f"Plan for {self.documents} documents, {self.chunks} chunks, {self.source_tokens} source tokens "
+      f"on {self.model} at concurrency {self.concurrency}:",
+      f"  extraction  {self.extraction_calls} calls, {self.extraction_prompt_tokens} prompt + "
+      f"{self.extraction_completion_tokens} completion tokens",
+    ]
+    if self.cluster_calls:
+      lines.append(
+        f"  clustering  {self.cluster_calls} calls, {self.cluster_prompt_tokens} prompt + "
+        f"{self.cluster_completion_tokens} completion tokens (~{self.entities} entities, ~{self.edges} edges)"
+      )
+    lines.append(f"  total       {self.llm_calls} calls, ${self.cost:.2f}, {self.seconds:.0f}s")
+    if stats is not None:
+      lines.append(f"  {'':18}{'estimate':>14}{'actual':>14}{'ratio':>8}")
+      for name, row in self.compare(stats).items():
+        lines.append(f"  {name:18}{row['estimate']:>14.6g}{row['actual']:>14.6g}{row['ratio']:>8.2f}")
+    return "\n".join(lines)
+
+
+class Planner:
+  """Accumulates the chunks of a prospective run and projects its cost.
+
+  Prompts are rendered with dspy's ChatAdapter exactly as extraction would send them, minus
+  the per-chunk parts, which are tokenized locally. Model outputs (entity and relation
+  counts) are projected from PlanAssumptions. Clustering is projected with the same
+  phases as cluster_items: one extract, validate and choose round per merged group, over a
+  list that shrinks as groups are found, then assignment batches against a growing list of
+  representatives. Prompt tokens therefore grow with the square of the item count.
+  """
+
+  def __init__(
+    self,
+    model: str,
+    context: str = "",
+    pack_tokens: Optional[int] = None,
+    assumptions: Optional[PlanAssumptions] = None,
+  ):
+    self.model = model
+    self.context = context
+    self.pack_tokens = pack_tokens
+    self.assumptions = assumptions or PlanAssumptions()
+    self.count = token_counter(model)
+    self.documents = 0
+    # (estimated tokens as packing sees them, tokens, is_conversation) per chunk
+    self._chunks: list[tuple[int, int, bool]] = []
+
+  def add_document(self, chunks: list[str], is_conversation: bool):
+    self.documents += 1
+    for chunk in chunks:
+      self._chunks.append((estimate_tokens(chunk), self.count(chunk), is_conversation))
+
+  def prompt_tokens(self, signature: type[dspy.Signature], **inputs) -> int:
+    messages = dspy.ChatAdapter().format(signature, [], {"context": self.context, **inputs})
+    return sum(self.count(message["content"]) + MESSAGE_OVERHEAD for message in messages)
+
+  def plan(self, cluster: bool = False, concurrency: int = 1) -> Plan:
+    a = self.assumptions
+    plan = Plan(model=self.model, concurrency=concurrency, documents=self.documents, chunks=len(self._chunks))
+    base = {
+      conversation: (
+        self.prompt_tokens(ConversationEntities if conversation else TextEntities, source_text=""),
+        self.prompt_tokens(ConversationRelations if conversation else TextRelations, source_text="", entities=[]),
+        self.prompt_tokens(PackedConversationEntities if conversation else PackedTextEntities, sources=[]),
+        self.prompt_tokens(
+          PackedConversationRelations if conversation else PackedTextRelations, sources=[], entities_per_source=[]
+        ),
+      )
+      for conversation in (False, True)
+    }
+
+    mentions = relations = 0
+    busy = 0.0
+    if self.pack_tokens:
+      requests = pack_items(self._chunks, self.pack_tokens, size=lambda chunk: chunk[0], group=lambda chunk: chunk[2])
+    else:
+      requests = ([chunk] for chunk in self._chunks)
+    for request in requests:
+      entity_base, relation_base, packed_entity_base, packed_relation_base = base[request[0][2]]
+      packed = len(request) > 1
+      tokens = sum(chunk[1] for chunk in request)
+      n_entities = [max(1, round(chunk[1] * a.entities_per_1k_tokens / 1000)) for chunk in request]
+      n_relations = [round(chunk[1] * a.relations_per_1k_tokens / 1000) for chunk in request]
+      entity_tokens = sum(n * a.tokens_per_entity for n in n_entities)
+      item_overhead = PACKED_ITEM_OVERHEAD * len(request) if packed else 0
+      entity_completion = OUTPUT_OVERHEAD + entity_tokens + item_overhead
+      relation_completion = OUTPUT_OVERHEAD + sum(n * a.tokens_per_relation for n in n_relations) + item_overhead
+
+      plan.source_tokens += tokens
+      plan.extraction_calls += 2
+      plan.extraction_prompt_tokens += round(
+        (packed_entity_base + packed_relation_base if packed else entity_base + relation_base)
+        + 2 * (tokens + item_overhead) + entity_tokens
+      )
+      plan.extraction_completion_tokens += round(entity_completion + relation_completion)
+      busy += 2 * a.seconds_per_call + (entity_completion + relation_completion) / a.output_tokens_per_second
+      mentions += sum(n_entities)
+      relations += sum(n_relations)
+
+    seconds = busy / max(1, concurrency)
+    plan.entities = round(mentions * a.distinct_entity_rate)
+    plan.edges = round(relations * a.distinct_edge_rate)
+    if cluster:
+      for n, item_tokens in ((plan.entities, a.tokens_per_entity), (plan.edges, a.tokens_per_relation / 3)):
+        calls, prompt, completion, busy = self.project_clustering(n, item_tokens + CLUSTER_ID_TOKENS)
+        plan.cluster_calls += calls
+        plan.cluster_prompt_tokens += prompt
+        plan.cluster_completion_tokens += completion
+        seconds += busy
+
+    plan.seconds = round(seconds, 1)
+    plan.cost = self.cost(plan.prompt_tokens, plan.completion_tokens)
+    return plan
+
+  def project_clustering(self, n: int, item_tokens: float) -> tuple[int, int, int, float]:
+    """(calls, prompt tokens, completion tokens, seconds) of cluster_items over n items."""
+    if n == 0:
+      return 0, 0, 0, 0.0
+    a = self.assumptions
+    extract_base = self.prompt_tokens(ExtractCluster, items="")
+    validate_base = self.prompt_tokens(ValidateCluster, cluster=set())
+    choose_base = self.prompt_tokens(ChooseRepresentative, cluster=set())
+    check_base = self.prompt_tokens(CheckExistingClusters, items="", clusters="")
+
+    # Extract phase: groups of two found one per round, then MIN_PATIENCE empty rounds
+    groups = min(round(n * a.duplicate_rate), n // 2)
+    listed = groups * n - groups * (groups - 1)
+    remaining = n - 2 * groups
+    calls = 3 * groups + MIN_PATIENCE
+    prompt = (
+      (groups + MIN_PATIENCE) * extract_base + listed * item_tokens + MIN_PATIENCE * remaining * item_tokens
+      + groups * (validate_base + choose_base + 4 * item_tokens)
+    )
+    completion = groups * (3 * OUTPUT_OVERHEAD + 2 * CLUSTER_ID_TOKENS + 4 * item_tokens) + MIN_PATIENCE * OUTPUT_OVERHEAD
+
+    # Assign phase: each batch is checked against every representative so far, which
+    # includes the singletons of earlier batches
+    batches = math.ceil(remaining / BATCH_SIZE)
+    if groups == 0 and batches:
+      batches -= 1
+    reps = batches * (groups + (0 if groups else BATCH_SIZE)) + BATCH_SIZE * batches * (batches - 1) // 2
+    calls += batches
+    prompt += batches * (check_base + BATCH_SIZE * item_tokens) + reps * item_tokens
+    completion += batches * (OUTPUT_OVERHEAD + REASONING_TOKENS + BATCH_SIZE * CLUSTER_ID_TOKENS)
+
+    seconds = calls * a.seconds_per_call + completion / a.output_tokens_per_second
+    return calls, round(prompt), round(completion), seconds
+
+  def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+    """Dollar cost from litellm's local price table, or 0.0 for models it doesn't know."""
+    try:
+      import litellm
+      prompt_cost, completion_cost = litellm.cost_per_token(
+        model=self.model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+      )
+      return round(prompt_cost + completion_cost, 4)
+    except Exception:
+      return 0.0
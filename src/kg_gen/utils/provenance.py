@@ -0,0 +1,161 @@
+import re
+from array import array
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict, PrivateAttr, field_serializer, field_validator
+
+ARRAY_FIELDS = ("rows", "chunk_ids", "starts", "ends")
+
+
+def mention_spans(text: str, name: str) -> list[tuple[int, int]]:
+  return [m.span() for m in re.finditer(r"(?<!\w)" + re.escape(name) + r"(?!\w)", text, re.IGNORECASE)]
+
+
+def relation_span(text: str, relation: tuple[str, str, str]) -> tuple[int, int]:
+  """Shortest character span of text mentioning both the subject and the object of relation.
+
+  Falls back to the whole text when either isn't mentioned verbatim.
+  """
+  subject, _, obj = relation
+  subjects, objects = mention_spans(text, subject), mention_spans(text, obj)
+  if not subjects or not objects:
+    return 0, len(text)
+  return min(
+    ((min(s[0], o[0]), max(s[1], o[1])) for s in subjects for o in objects),
+    key=lambda span: (span[1] - span[0], span[0]),
+  )
+
+
+class Provenance(BaseModel):
+  """Where a graph's relations were extracted from, as parallel integer arrays.
+
+  Entry i records that relation relations[rows[i]] was found in chunk chunk_ids[i],
+  between characters starts[i] and ends[i] of that chunk. A relation found in several
+  chunks has several entries. The triples are stored with the provenance, not as rows of
+  graph.index, so later edits to graph.relations can't point an entry at another triple.
+  """
+  model_config = ConfigDict(arbitrary_types_allowed=True)
+
+  relations: list[tuple[str, str, str]] = []
+  rows: np.ndarray
+  chunk_ids: np.ndarray
+  starts: np.ndarray
+  ends: np.ndarray
+  n_chunks: int = 0
+  _row_of: Optional[dict[tuple[str, str, str], int]] = PrivateAttr(default=None)
+
+  @field_validator(*ARRAY_FIELDS, mode="before")
+  @classmethod
+  def to_array(cls, value: Any) -> np.ndarray:
+    return np.asarray(value, dtype=np.int32).reshape(-1)
+
+  @field_serializer(*ARRAY_FIELDS)
+  def to_list(self, value: np.ndarray) -> list[int]:
+    return value.tolist()
+
+  def __eq__(self, other: Any) -> bool:
+    if not isinstance(other, Provenance):
+      return NotImplemented
+    return self.n_chunks == other.n_chunks and self.relations == other.relations and all(
+      np.array_equal(getattr(self, name), getattr(other, name)) for name in ARRAY_FIELDS
+    )
+
+  def __len__(self) -> int:
+    return len(self.rows)
+
+  def entries(self, row: int) -> list[tuple[int, int, int]]:
+    """(chunk id, start, end) of every entry for one row of self.relations."""
+    hits = np.flatnonzero(self.rows == row)
+    return [(int(self.chunk_ids[i]), int(self.starts[i]), int(self.ends[i])) for i in hits]
+
+  def sources(self, relation: tuple[str, str, str]) -> list[tuple[int, int, int]]:
+    """(chunk id, start, end) of every entry for relation, empty if it has none."""
+    if self._row_of is None:
+      self._row_of = {r: i for i, r in enumerate(self.relations)}
+    row = self._row_of.get(tuple(relation))
+    return self.entries(row) if row is not None else []
+
+  def remap(
+    self,
+    relations: set[tuple[str, str, str]],
+    entity_names: Optional[dict[str, str]] = None,
+    edge_names: Optional[dict[str, str]] = None,
+    chunk_offset: int = 0,
+  ) -> "Provenance":
+    """Provenance for a graph with the given relations, optionally renaming entities and
+    edges first (e.g. cluster members to representatives) and shifting chunk ids.
+
+    Entries whose relation isn't in relations are dropped; entries that collapse onto the
+    same relation and span are kept once.
+    """
+    entity_names, edge_names = entity_names or {}, edge_names or {}
+    renamed = [(entity_names.get(s, s), edge_names.get(p, p), entity_names.get(o, o)) for s, p, o in self.relations]
+    keep = np.array([relation in relations for relation in renamed], dtype=bool)[self.rows] if renamed else np.zeros(0, bool)
+    return Provenance.build(
+      [renamed[row] for row in self.rows[keep]], self.chunk_ids[keep] + chunk_offset,
+      self.starts[keep], self.ends[keep], self.n_chunks + chunk_offset,
+    )
+
+  def entry_relations(self) -> list[tuple[str, str, str]]:
+    """The relation of each entry."""
+    return [self.relations[row] for row in self.rows]
+
+  @classmethod
+  def build(cls, relations: list[tuple[str, str, str]], chunk_ids, starts, ends, n_chunks: int) -> "Provenance":
+    """Provenance from one relation and span per entry."""
+    table = sorted(set(relations))
+    row_of = {relation: i for i, relation in enumerate(table)}
+    rows = [row_of[relation] for relation in relations]
+    entries = np.stack([np.asarray(a, dtype=np.int32).reshape(-1) for a in (rows, chunk_ids, starts, ends)], axis=1)
+    entries = np.unique(entries, axis=0) if len(entries) else entries
+    return cls(
+      relations=table, rows=entries[:, 0], chunk_ids=entries[:, 1], starts=entries[:, 2], ends=entries[:, 3],
+      n_chunks=n_chunks,
+    )
+
+  @classmethod
+  def concat(cls, parts: Iterable["Provenance"]) -> "Provenance":
+    """Join provenance that already uses the same chunk numbering."""
+    parts = list(parts)
+    if not parts:
+      return cls.build([], [], [], [], 0)
+    return cls.build(
+      [relation for p in parts for relation in p.entry_relations()],
+      *(np.concatenate([getattr(p, name) for p in parts]) for name in ARRAY_FIELDS[1:]),
+      max(p.n_chunks for p in parts),
+    )
+
+
+class ProvenanceBuilder:
+  """Collects (relation, chunk, span) entries while chunks are processed.
+
+  Entries are kept in flat int arrays plus one list of relation tuples, and turned into a
+  Provenance once the graph's final relations are known.
+  """
+
+  def __init__(self, n_chunks: int = 0):
+    self.n_chunks = n_chunks
+    self.relations: list[tuple[str, str, str]] = []
+    self.chunk_ids = array("i")
+    self.starts = array("i")
+    self.ends = array("i")
+
+  def add(self, chunk_id: int, relations: Iterable[tuple[str, str, str]], spans: Iterable[tuple[int, int]]):
+    for relation, (start, end) in zip(relations, spans):
+      self.relations.append(tuple(relation))
+      self.chunk_ids.append(chunk_id)
+      self.starts.append(start)
+      self.ends.append(end)
+    self.n_chunks = max(self.n_chunks, chunk_id + 1)
+
+  def build(self, relations: set[tuple[str, str, str]]) -> Provenance:
+    """Provenance of the collected entries whose relation is among the graph's relations."""
+    keep = np.array([relation in relations for relation in self.relations], dtype=bool)
+    return Provenance.build(
+      [relation for relation, kept in zip(self.relations, keep) if kept],
+      np.frombuffer(self.chunk_ids, dtype=np.int32)[keep],
+      np.frombuffer(self.starts, dtype=np.int32)[keep],
+      np.frombuffer(self.ends, dtype=np.int32)[keep],
+      self.n_chunks,
+    )
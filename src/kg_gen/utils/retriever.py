@@ -0,0 +1,184 @@
+import os
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from ..models import Graph
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_SUFFIX = ".index.npz"
+
+Embedder = Callable[[list[str]], np.ndarray]
+
+
+def default_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL) -> Embedder:
+  """Batched SentenceTransformer encoder; sentence-transformers is an optional dependency."""
+  try:
+    from sentence_transformers import SentenceTransformer
+  except ImportError as e:
+    raise ImportError(
+      "GraphRetriever needs an embedder. Pass one in or run `pip install sentence-transformers`."
+    ) from e
+  model = SentenceTransformer(model_name)
+  return lambda texts: model.encode(texts, batch_size=256, convert_to_numpy=True, show_progress_bar=False)
+
+
+def index_path(graph_path: str) -> str:
+  """Path of the index stored next to a graph file, e.g. graph.json -> graph.index.npz"""
+  return os.path.splitext(graph_path)[0] + INDEX_SUFFIX
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+  embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+  norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+  norms[norms == 0] = 1.0
+  return embeddings / norms
+
+
+class GraphRetriever:
+  """Embedding index over a graph's entities with top-k search and neighborhood expansion.
+
+  Entity embeddings are normalized once and stored as rows of a single matrix, so exact
+  search is one matrix-vector product plus argpartition. With approximate=True an HNSW
+  index from faiss (optional dependency) answers queries instead. Entities added to the
+  graph later are embedded incrementally by update().
+  """
+
+  def __init__(
+    self,
+    graph: Graph,
+    embedder: Optional[Embedder] = None,
+    approximate: bool = False,
+    depth: int = 2,
+    index_file: Optional[str] = None,
+  ):
+    """
+    Args:
+        graph: Graph whose entities are indexed
+        embedder: Callable mapping a list of strings to an embedding matrix
+        approximate: Answer queries from a faiss HNSW index instead of exact search
+        depth: Default number of hops to expand around retrieved entities
+        index_file: Saved index to start from; only entities missing from it are embedded
+    """
+    self.graph = graph
+    self.embedder = embedder
+    self.approximate = approximate
+    self.depth = depth
+    self.names: list[str] = []
+    self.positions: dict[str, int] = {}
+    self._matrix = np.zeros((0, 0), dtype=np.float32)
+    self._active = np.zeros(0, dtype=bool)
+    self._ann = None
+
+    if index_file is not None:
+      saved = np.load(index_file)
+      names = [str(name) for name in saved["names"]]
+      if names:
+        self._append(names, saved["embeddings"].astype(np.float32))
+    self.update()
+
+  @property
+  def embeddings(self) -> np.ndarray:
+    return self._matrix[:len(self.names)]
+
+  def embed(self, texts: list[str]) -> np.ndarray:
+    if self.embedder is None:
+      self.embedder = default_embedder()
+    return normalize(self.embedder(texts))
+
+  def update(self) -> int:
+    """Embed entities added to the graph since the last update and mask removed ones.
+
+    Returns:
+        Number of newly indexed entities
+    """
+    new_names = sorted(e for e in self.graph.entities if e not in self.positions)
+    if new_names:
+      self._append(new_names, self.embed(new_names))
+    # Recomputed every time (O(n), like a query), so a removed entity added back is active again
+    entities = self.graph.entities
+    n = len(self.names)
+    self._active[:n] = np.fromiter((name in entities for name in self.names), dtype=bool, count=n)
+    return len(new_names)
+
+  def _check_dimension(self, embeddings: np.ndarray):
+    if self.names and embeddings.shape[1] != self._matrix.shape[1]:
+      raise ValueError(
+        f"Embeddings have dimension {embeddings.shape[1]} but the index has {self._matrix.shape[1]}; "
+        "use the embedder the index was built with"
+      )
+
+  def _append(self, names: list[str], embeddings: np.ndarray):
+    start, end = len(self.names), len(self.names) + len(names)
+    self._check_dimension(embeddings)
+    if self._matrix.shape[1] != embeddings.shape[1]:
+      self._matrix = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+    if end > self._matrix.shape[0]:
+      # Grow geometrically so repeated small updates stay amortized O(1) per entity
+      capacity = max(end, 2 * self._matrix.shape[0])
+      matrix = np.zeros((capacity, embeddings.shape[1]), dtype=np.float32)
+      matrix[:start] = self._matrix[:start]
+      self._matrix = matrix
+      active = np.zeros(capacity, dtype=bool)
+      active[:start] = self._active[:start]
+      self._active = active
+    self._matrix[start:end] = embeddings
+    self._active[start:end] = True
+    for offset, name in enumerate(names):
+      self.positions[name] = start + offset
+    self.names.extend(names)
+    if self._ann is not None:
+      self._ann.add(embeddings)
+
+  def _ann_index(self):
+    if self._ann is None:
+      try:
+        import faiss
+      except ImportError as e:
+        raise ImportError("approximate=True requires faiss. Run `pip install faiss-cpu`.") from e
+      self._ann = faiss.IndexHNSWFlat(self._matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+      if self.names:
+        self._ann.add(self.embeddings)
+    return self._ann
+
+  def top_k(self, query: str, k: int = 8) -> list[tuple[str, float]]:
+    """Return the k entities most similar to the query with their cosine scores."""
+    if not self.names:
+      return []
+    query_embedding = self.embed([query])
+    self._check_dimension(query_embedding)
+    query_embedding = query_embedding[0]
+
+    if self.approximate:
+      # Over-fetch so masked (removed) entities don't leave the result short
+      fetch = min(len(self.names), k + int((~self._active[:len(self.names)]).sum()))
+      scores, ids = self._ann_index().search(query_embedding[None, :], fetch)
+      hits = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0 and self._active[i]]
+      return [(self.names[i], s) for i, s in hits[:k]]
+
+    scores = self.embeddings @ query_embedding
+    scores[~self._active[:len(self.names)]] = -np.inf
+    k = min(k, int(self._active[:len(self.names)].sum()))
+    if k == 0:
+      return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(self.names[i], float(scores[i])) for i in top]
+
+  def neighborhood(self, entities: Iterable[str], depth: Optional[int] = None) -> set[tuple[str, str, str]]:
+    """Relations reachable by following outgoing edges from the entities up to depth hops."""
+    return self.graph.neighborhood(entities, self.depth if depth is None else depth, "out")
+
+  def retrieve(self, query: str, k: int = 8, depth: Optional[int] = None) -> list[str]:
+    """Return context sentences for the relations around the k entities closest to the query."""
+    entities = [name for name, _ in self.top_k(query, k)]
+    return sorted(f"{s} {p} {o}." for s, p, o in self.neighborhood(entities, depth))
+
+  def save(self, path: str):
+    """Persist the embedding matrix, e.g. to index_path(graph_path)."""
+    np.savez(path, names=np.array(self.names, dtype=str), embeddings=self.embeddings)
+
+  @classmethod
+  def load(cls, graph: Graph, path: str, **kwargs) -> "GraphRetriever":
+    """Load a saved index for the graph and embed only entities the saved index is missing."""
+    return cls(graph, index_file=path, **kwargs)
@@ -0,0 +1,303 @@
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Optional, Union, get_args, get_origin
+
+import dspy
+import json_repair
+import litellm
+from dspy.adapters.json_adapter import _get_structured_outputs_response_format
+from pydantic import TypeAdapter, ValidationError
+
+from ..steps._3_cluster_graph import check_cluster_ids
+from .packing import estimate_tokens
+
+DEFAULT_MAX_REASKS = 1
+# Invalid entries quoted back to the model in a re-ask, at most
+MAX_QUOTED_CHARS = 1000
+# A BadRequestError mentioning one of these refused the schema itself
+SCHEMA_ERROR_TERMS = ("response_format", "json_schema")
+
+# Checks beyond the field's type, keyed by output field name. Each receives the call's
+# inputs and the parsed value and returns a description of the problem, or None.
+FIELD_CHECKS: dict[str, Callable[[dict, Any], Optional[str]]] = {
+  "cluster_ids_that_items_belong_to": check_cluster_ids,
+}
+
+
+class StructuredStats:
+  """Thread-safe counters of structured-output parsing, shared across a run's calls.
+
+  Tokens are estimated locally: a re-ask saves what the retry of the whole call it replaces
+  would have cost (prompt and completion), less what the re-ask itself costs. An answer
+  repaired locally saves the whole retry.
+  """
+
+  def __init__(self):
+    self.calls = 0
+    self.parse_failures = 0
+    self.repaired = 0
+    self.reasks = 0
+    self.unrecovered = 0
+    self.reask_tokens = 0
+    self.retry_tokens_saved = 0
+    self._lock = threading.Lock()
+
+  def add(self, **counts: int):
+    with self._lock:
+      for name, count in counts.items():
+        setattr(self, name, getattr(self, name) + count)
+
+  @property
+  def failure_rate(self) -> float:
+    """Share of answers that weren't valid as returned."""
+    return self.parse_failures / self.calls if self.calls else 0.0
+
+
+class FieldProblem:
+  """An output field that failed validation, with the entries of a list that did pass."""
+
+  def __init__(self, message: str, kept: Optional[list] = None, invalid: Optional[list] = None):
+    self.message = message
+    self.kept = kept
+    self.invalid = invalid or []
+
+
+@lru_cache(maxsize=None)
+def _type_adapter(annotation) -> TypeAdapter:
+  return TypeAdapter(annotation)
+
+
+def _decode(annotation, value: Any) -> Any:
+  """Undo a value sent as a JSON string where the field isn't a string."""
+  if isinstance(value, str) and annotation is not str:
+    try:
+      return json.loads(value)
+    except json.JSONDecodeError:
+      return json_repair.loads(value)
+  return value
+
+
+def validate_field(annotation, value: Any) -> tuple[Any, Optional[FieldProblem]]:
+  """(parsed value, problem) of one output field. For lists and sets, the entries that are
+  valid are kept on the problem, so a re-ask only needs to cover the others."""
+  value = _decode(annotation, value)
+  try:
+    return _type_adapter(annotation).validate_python(value), None
+  except ValidationError as e:
+    origin = get_origin(annotation)
+    if origin in (list, set) and isinstance(value, list):
+      item = _type_adapter(get_args(annotation)[0])
+      kept, invalid = [], []
+      for entry in value:
+        try:
+          kept.append(item.validate_python(entry))
+        except ValidationError:
+          invalid.append(entry)
+      return None, FieldProblem(f"had {len(invalid)} entries that aren't valid", kept, invalid)
+    errors = "; ".join(error["msg"] for error in e.errors()[:3])
+    return None, FieldProblem(f"is missing or invalid ({errors})" if value is not None else "is missing")
+
+
+def _fallback(annotation, problem: FieldProblem) -> Any:
+  """Value of a field that couldn't be recovered, or raise if the field has no empty value."""
+  origin = get_origin(annotation)
+  if problem.kept is not None:
+    return set(problem.kept) if origin is set else problem.kept
+  if origin in (list, set):
+    return origin()
+  if origin is Union and type(None) in get_args(annotation):
+    return None
+  if annotation is str:
+    return ""
+  raise ValueError(f"Output field {problem.message}, after re-asking")
+
+
+class StructuredAdapter(dspy.JSONAdapter):
+  """dspy adapter that requests JSON output and re-asks only for the parts that fail.
+
+  Prompts are formatted as JSON requests. Where litellm reports that the model supports
+  response schemas, the request carries a JSON schema of the output fields, so the
+  backend constrains decoding. Otherwise the model is asked for a JSON object in the
+  prompt alone (a backend rejecting the schema is remembered and sent none from then on).
+
+  Answers are validated locally against each output field's type and its FIELD_CHECKS.
+  Malformed JSON is repaired, and list entries that fail are dropped while the rest are
+  kept. Fields still invalid are re-asked in a follow-up that requests only those
+  fields (or only the failed entries), up to max_reasks times, instead of retrying the
+  whole call. A list field that can't be recovered keeps its valid entries, so a bad
+  answer never raises out of a worker thread.
+
+  Args:
+      response_format: Send a JSON schema with each request; None decides per model
+      max_reasks: Follow-up requests per call for fields that fail validation
+      stats: Counters to update, shared with other adapters if given
+  """
+
+  def __init__(
+    self,
+    response_format: Optional[bool] = None,
+    max_reasks: int = DEFAULT_MAX_REASKS,
+    stats: Optional[StructuredStats] = None,
+  ):
+    super().__init__()
+    self.response_format = response_format
+    self.max_reasks = max_reasks
+    self.stats = stats or StructuredStats()
+    self._schema_support: dict[str, bool] = {}
+    self._lock = threading.Lock()
+
+  def __call__(self, lm, lm_kwargs, signature, demos, inputs, _parse_values=True):
+    messages = self.format(signature, demos, inputs)
+    outputs = self._request(lm, lm_kwargs, signature, messages)
+    return [self._complete(lm, lm_kwargs, signature, inputs, messages, output) for output in outputs]
+
+  def _complete(self, lm, lm_kwargs, signature, inputs: dict, messages: list[dict], output: str) -> dict:
+    values, problems, strict = self._validate(signature, inputs, output)
+    failed = bool(problems) or not strict
+    self.stats.add(calls=1, parse_failures=int(failed))
+    if not failed:
+      return values
+
+    retry_tokens = sum(estimate_tokens(m["content"]) for m in messages) + estimate_tokens(output)
+    if not problems:
+      self.stats.add(repaired=1, retry_tokens_saved=retry_tokens)
+      return values
+
+    reasks = 0
+    while problems and reasks < self.max_reasks:
+      reasks += 1
+      partial = self._partial_signature(signature, problems)
+      reask_messages = self.format(partial, [], inputs)
+      reask_messages[-1] = {"role": "user", "content": self._correction(problems) + "\n\n" + reask_messages[-1]["content"]}
+      answer = self._request(lm, lm_kwargs, partial, reask_messages)[0]
+      tokens = sum(estimate_tokens(m["content"]) for m in reask_messages) + estimate_tokens(answer)
+      self.stats.add(reasks=1, reask_tokens=tokens, retry_tokens_saved=retry_tokens - tokens)
+      new_values, new_problems, _ = self._validate(partial, inputs, answer)
+      for name, problem in list(problems.items()):
+        if name in new_problems:
+          # Entries that were valid in either answer are kept for the next attempt
+          if problem.kept is not None and new_problems[name].kept is not None:
+            new_problems[name].kept = problem.kept + new_problems[name].kept
+          elif problem.kept is not None:
+            new_problems[name].kept = problem.kept
+          continue
+        value = new_values[name]
+        if problem.kept is not None:
+          # A re-ask for the failed entries of a list answers with those entries only
+          value = (set(problem.kept) | value) if isinstance(value, set) else problem.kept + value
+        values[name] = value
+      problems = {name: new_problems[name] for name in problems if name in new_problems}
+
+    if problems:
+      self.stats.add(unrecovered=1)
+      for name, problem in problems.items():
+        values[name] = _fallback(signature.output_fields[name].annotation, problem)
+    return values
+
+  def _validate(self, signature, inputs: dict, output: str) -> tuple[dict, dict[str, FieldProblem], bool]:
+    """(valid values, problems by field, whether the answer was valid JSON as returned)"""
+    raw, strict = self._load(signature, output)
+    values, problems = {}, {}
+    for name, field in signature.output_fields.items():
+      value, problem = validate_field(field.annotation, raw.get(name))
+      if problem is None and name in FIELD_CHECKS:
+        message = FIELD_CHECKS[name](inputs, value)
+        if message is not None:
+          problem = FieldProblem(message)
+      if problem is None:
+        values[name] = value
+      else:
+        problem.message = f"`{name}` {problem.message}"
+        problems[name] = problem
+    return values, problems, strict
+
+  def _load(self, signature, output: str) -> tuple[dict, bool]:
+    """Raw field values of an answer, repairing malformed JSON or reading field headers."""
+    try:
+      data = json.loads(output)
+      if isinstance(data, dict):
+        return data, True
+    except json.JSONDecodeError:
+      pass
+    data = json_repair.loads(output)
+    if isinstance(data, dict) and data.keys() & signature.output_fields.keys():
+      return data, False
+    # Models that ignore the JSON request often fall back to [[ ## field ## ]] sections
+    try:
+      return dspy.ChatAdapter().parse(signature, output, _parse_values=False), False
+    except Exception:
+      return {}, False
+
+  def _request(self, lm, lm_kwargs: dict, signature, messages: list[dict]) -> list[str]:
+    response_format = self._response_format(lm, signature)
+    if response_format is None:
+      return self._texts(lm(messages=messages, **lm_kwargs))
+    try:
+      return self._texts(lm(messages=messages, **lm_kwargs, response_format=response_format))
+    except (litellm.UnsupportedParamsError, litellm.BadRequestError) as e:
+      if not rejects_schema(e):
+        raise
+      with self._lock:
+        self._schema_support[lm.model] = False
+      return self._texts(lm(messages=messages, **lm_kwargs))
+
+  def _response_format(self, lm, signature) -> Optional[dict]:
+    if self.response_format is False:
+      return None
+    with self._lock:
+      supported = self._schema_support.get(lm.model)
+    if supported is None:
+      supported = True if self.response_format else supports_response_schema(lm.model)
+      with self._lock:
+        self._schema_support[lm.model] = supported
+    if not supported:
+      return None
+    # A plain dict, so the request stays JSON for dspy's cache and batch export
+    schema = _get_structured_outputs_response_format(signature).model_json_schema()
+    return {"type": "json_schema", "json_schema": {"name": "outputs", "schema": schema, "strict": False}}
+
+  @staticmethod
+  def _texts(outputs: list) -> list[str]:
+    return [output["text"] if isinstance(output, dict) else output for output in outputs]
+
+  @staticmethod
+  def _partial_signature(signature, problems: dict[str, FieldProblem]):
+    """signature with only the output fields that need a re-ask."""
+    fields = {
+      name: (field.annotation, field) for name, field in signature.fields.items()
+      if name in signature.input_fields or name in problems
+    }
+    return dspy.make_signature(fields, signature.instructions)
+
+  @staticmethod
+  def _correction(problems: dict[str, FieldProblem]) -> str:
+    lines = ["Your previous answer needs fixing:"]
+    for problem in problems.values():
+      line = f"- {problem.message}."
+      if problem.kept is not None:
+        invalid = json.dumps(problem.invalid, ensure_ascii=False, default=str)[:MAX_QUOTED_CHARS]
+        line += f" Answer with corrected versions of only these entries: {invalid}"
+      lines.append(line)
+    lines.append("Answer again for only the fields below.")
+    return "\n".join(lines)
+
+
+def rejects_schema(error: Exception) -> bool:
+  """Whether a failed request was refused for its response_format, rather than e.g. for an
+  over-long prompt or a content policy (also BadRequestErrors in litellm)."""
+  if isinstance(error, litellm.UnsupportedParamsError):
+    return True
+  if isinstance(error, (litellm.ContextWindowExceededError, litellm.ContentPolicyViolationError)):
+    return False
+  message = str(error).lower()
+  return any(term in message for term in SCHEMA_ERROR_TERMS)
+
+
+def supports_response_schema(model: str) -> bool:
+  """Whether litellm knows model to accept a JSON schema as response_format."""
+  try:
+    _, provider, _, _ = litellm.get_llm_provider(model)
+    return litellm.supports_response_schema(model=model, custom_llm_provider=provider)
+  except Exception:
+    return False
@@ -0,0 +1,269 @@
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Optional, Union
+
+import dspy
+
+from src.kg_gen.utils.triage import STOPWORDS
+
+field_header_pattern = re.compile(r"\[\[ ## (\w+) ## \]\]")
+output_field_pattern = re.compile(r"^\d+\. `(\w+)` \(([^)]*)\)", re.MULTILINE)
+entity_pattern = re.compile(r"\b[A-Z][\w'-]*(?:\s+(?:of\s+|the\s+)?[A-Z][\w'-]*)*")
+word_pattern = re.compile(r"[^\W\d_][\w'-]*")
+sentence_pattern = re.compile(r"(?<=[.!?。！？])\s*")
+numbered_pattern = re.compile(r"^(\d+): (.*)$", re.MULTILINE)
+json_requested_pattern = re.compile(r"^Respond with a JSON object", re.MULTILINE)
+
+MAX_FALLBACK_ENTITIES = 10
+MAX_PREDICATE_WORDS = 4
+
+
+def stem(item: str) -> str:
+  """Crude normal form used to decide which items belong in the same cluster."""
+  word = " ".join(item.casefold().split())
+  if word.endswith("ies") and len(word) > 4:
+    return word[:-3] + "y"
+  if word.endswith(("sses", "shes", "ches", "xes", "zes")):
+    return word[:-2]
+  if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+    return word[:-1]
+  return word
+
+
+def heuristic_entities(inputs: dict) -> list[str]:
+  text = str(inputs.get("source_text", ""))
+  # Like a real model, reuse the given spelling of known entities the text mentions
+  folded = text.casefold()
+  entities = [
+    name for name in inputs.get("known_entities") or []
+    if isinstance(name, str) and re.search(r"(?<!\w)" + re.escape(name.casefold()) + r"(?!\w)", folded)
+  ]
+  known = {name.casefold() for name in entities}
+  for match in entity_pattern.finditer(text):
+    name = re.sub(r"'s$", "", match.group(0)).strip()
+    if name.casefold() in STOPWORDS or name.casefold() in known:
+      continue
+    if name not in entities:
+      entities.append(name)
+  if entities:
+    return entities
+
+  # Lowercase or non-Latin text: fall back to the most frequent content words
+  counts = Counter(
+    word.casefold() for word in word_pattern.findall(text)
+    if word.casefold() not in STOPWORDS and len(word) > 3
+  )
+  return [word for word, _ in counts.most_common(MAX_FALLBACK_ENTITIES)]
+
+
+def heuristic_relations(inputs: dict) -> list[tuple[str, str, str]]:
+  text = str(inputs.get("source_text", ""))
+  entities = [e for e in inputs.get("entities") or [] if isinstance(e, str) and e]
+  relations = []
+  for sentence in sentence_pattern.split(text):
+    folded = sentence.casefold()
+    mentions = []
+    for entity in entities:
+      match = re.search(r"(?<!\w)" + re.escape(entity.casefold()) + r"(?!\w)", folded)
+      if match:
+        mentions.append((match.start(), match.end(), entity))
+    mentions.sort()
+    for (_, end, subject), (start, _, obj) in zip(mentions, mentions[1:]):
+      if subject == obj or start < end:
+        continue
+      words = word_pattern.findall(sentence[end:start])
+      predicate = " ".join(words[:MAX_PREDICATE_WORDS]).casefold() or "related to"
+      relation = (subject, predicate, obj)
+      if relation not in relations:
+        relations.append(relation)
+  return relations
+
+
+def heuristic_entities_per_source(inputs: dict) -> list[list[str]]:
+  known = inputs.get("known_entities")
+  return [heuristic_entities({"source_text": source, "known_entities": known}) for source in inputs.get("sources") or []]
+
+
+def heuristic_relations_per_source(inputs: dict) -> list[list[tuple[str, str, str]]]:
+  sources = inputs.get("sources") or []
+  entities = list(inputs.get("entities_per_source") or []) + [[]] * len(sources)
+  return [
+    heuristic_relations({"source_text": source, "entities": source_entities})
+    for source, source_entities in zip(sources, entities)
+  ]
+
+
+def numbered(text: Any) -> dict[int, str]:
+  """Parse "id: item" lines as written by the clustering prompts."""
+  return {int(i): item for i, item in numbered_pattern.findall(str(text or ""))}
+
+
+def heuristic_cluster_ids(inputs: dict) -> list[int]:
+  groups: dict[str, list[int]] = {}
+  for i, item in sorted(numbered(inputs.get("items")).items(), key=lambda pair: pair[1]):
+    groups.setdefault(stem(item), []).append(i)
+  for key in sorted(groups):
+    if len(groups[key]) > 1:
+      return groups[key]
+  return []
+
+
+def heuristic_validated_items(inputs: dict) -> list[str]:
+  cluster = sorted(inputs.get("cluster") or [])
+  if not cluster:
+    return []
+  key, count = Counter(stem(item) for item in cluster).most_common(1)[0]
+  if count < 2:
+    return []
+  return [item for item in cluster if stem(item) == key]
+
+
+def heuristic_representative(inputs: dict) -> str:
+  cluster = sorted(inputs.get("cluster") or [], key=lambda item: (len(item), item))
+  return cluster[0] if cluster else ""
+
+
+def heuristic_cluster_ids_of_items(inputs: dict) -> list[Optional[int]]:
+  cluster_by_stem = {}
+  for i, rep in sorted(numbered(inputs.get("clusters")).items()):
+    cluster_by_stem.setdefault(stem(rep), i)
+  return [cluster_by_stem.get(stem(item)) for _, item in sorted(numbered(inputs.get("items")).items())]
+
+
+HEURISTICS: dict[str, Callable[[dict], Any]] = {
+  "entities": heuristic_entities,
+  "relations": heuristic_relations,
+  "entities_per_source": heuristic_entities_per_source,
+  "relations_per_source": heuristic_relations_per_source,
+  "cluster_ids": heuristic_cluster_ids,
+  "validated_items": heuristic_validated_items,
+  "representative": heuristic_representative,
+  "cluster_ids_that_items_belong_to": heuristic_cluster_ids_of_items,
+  "reasoning": lambda inputs: "Matched items by their normalized form.",
+}
+
+
+def default_value(annotation: str) -> Any:
+  if annotation.startswith(("list", "set", "tuple")):
+    return []
+  if annotation.startswith("dict"):
+    return {}
+  if annotation.startswith("Optional"):
+    return None
+  if annotation == "bool":
+    return False
+  if annotation in ("int", "float"):
+    return 0
+  return ""
+
+
+class MockLM(dspy.LM):
+  """Deterministic stand-in for a remote LM, for offline tests and benchmarks.
+
+  Reads the ChatAdapter-formatted prompt, answers each requested output field with
+  a scripted response or a cheap heuristic, and records history and token usage the
+  same way dspy.LM does so downstream accounting keeps working. Requests asking for
+  JSON (a response_format, or a JSONAdapter prompt) are answered with a JSON object.
+
+  Args:
+      responses: Mapping of output field name to a fixed value or a callable that
+          receives the parsed input fields and returns the value
+      latency: Seconds to sleep per call, or a callable receiving the request
+          messages and returning the delay
+  """
+
+  def __init__(
+    self,
+    responses: Optional[dict[str, Any]] = None,
+    latency: Union[float, Callable[[list[dict]], float]] = 0.0,
+    model: str = "mock/kg-gen",
+  ):
+    super().__init__(model=model, cache=False, num_retries=0)
+    self.responses = responses or {}
+    self.latency = latency
+    self.calls = 0
+    self._lock = threading.Lock()
+
+  def __call__(self, prompt=None, messages=None, **kwargs):
+    messages = messages or [{"role": "user", "content": prompt}]
+    delay = self.latency(messages) if callable(self.latency) else self.latency
+    if delay:
+      time.sleep(delay)
+
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    inputs = parse_fields(messages[-1]["content"])
+    values = {name: self.respond(name, annotation, inputs) for name, annotation in output_fields(system)}
+    if kwargs.get("response_format") or json_requested_pattern.search(messages[-1]["content"]):
+      output = json.dumps(values, ensure_ascii=False)
+    else:
+      sections = []
+      for name, value in values.items():
+        if not isinstance(value, str):
+          value = json.dumps(value, ensure_ascii=False)
+        sections.append(f"[[ ## {name} ## ]]\n{value}")
+      sections.append("[[ ## completed ## ]]")
+      output = "\n\n".join(sections)
+
+    prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+    completion_tokens = len(output) // 4
+    entry = dict(
+      prompt=prompt,
+      messages=messages,
+      kwargs=kwargs,
+      response=None,
+      outputs=[output],
+      usage=dict(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+      ),
+      cost=None,
+      timestamp=datetime.now().isoformat(),
+      uuid=str(uuid.uuid4()),
+      model=self.model,
+      model_type=self.model_type,
+    )
+    with self._lock:
+      self.calls += 1
+      self.history.append(entry)
+    return [output]
+
+  def respond(self, name: str, annotation: str, inputs: dict) -> Any:
+    if name in self.responses:
+      response = self.responses[name]
+      return response(inputs) if callable(response) else response
+    if name in HEURISTICS:
+      return HEURISTICS[name](inputs)
+    return default_value(annotation)
+
+
+def parse_fields(content: str) -> dict[str, Any]:
+  """Split a formatted user turn into its input field values."""
+  content = re.split(r"\n\nRespond with (?:the corresponding output fields|a JSON object)", content, maxsplit=1)[0]
+  fields = {}
+  name, lines = None, []
+  for line in content.splitlines() + ["[[ ## end ## ]]"]:
+    match = field_header_pattern.match(line.strip())
+    if not match:
+      lines.append(line)
+      continue
+    if name is not None:
+      raw = "\n".join(lines).strip()
+      try:
+        fields[name] = json.loads(raw)
+      except json.JSONDecodeError:
+        fields[name] = raw
+    name, lines = match.group(1), []
+  return fields
+
+
+def output_fields(system: str) -> list[tuple[str, str]]:
+  """Read the requested output field names and annotations from the system prompt."""
+  section = system.split("Your output fields are:", 1)[-1]
+  section = section.split("All interactions will be structured", 1)[0]
+  return output_field_pattern.findall(section)
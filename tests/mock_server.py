@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from tests.mock_lm import MockLM
+
+
+class MockServer:
+  """Local OpenAI-compatible chat completions endpoint answered by a MockLM.
+
+  Stands in for a self-hosted model server in tests and benchmarks. Connections are kept
+  alive as HTTP/1.1 allows, and the server counts the requests it answered and the TCP
+  connections they arrived on.
+
+  Args:
+      lm: LM that answers each request (a fresh MockLM if None)
+      latency: Seconds each response is delayed on the server
+  """
+
+  def __init__(self, lm: Optional[MockLM] = None, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+    self.lm = lm or MockLM()
+    self.latency = latency
+    self.requests = 0
+    self.connections = 0
+    self._lock = threading.Lock()
+    self._server = ThreadingHTTPServer((host, port), self._handler())
+    self._server.daemon_threads = True
+    self._thread: Optional[threading.Thread] = None
+
+  @property
+  def url(self) -> str:
+    host, port = self._server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+  def start(self) -> "MockServer":
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+
+  def __enter__(self) -> "MockServer":
+    return self.start()
+
+  def __exit__(self, *exc):
+    self.stop()
+
+  def _count(self, name: str):
+    with self._lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def _handler(self):
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def setup(self):
+        super().setup()
+        server._count("connections")
+
+      def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if server.latency:
+          time.sleep(server.latency)
+        history = len(server.lm.history)
+        content = server.lm(messages=request["messages"])[0]
+        usage = server.lm.history[-1]["usage"] if len(server.lm.history) > history else {}
+        body = json.dumps({
+          "id": f"chatcmpl-{uuid.uuid4().hex}",
+          "object": "chat.completion",
+          "created": int(time.time()),
+          "model": request.get("model", "mock"),
+          "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+          "usage": usage,
+        }).encode()
+        server._count("requests")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
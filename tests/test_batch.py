@@ -0,0 +1,74 @@
+import json
+
+from src.kg_gen import KGGen, RunStats
+from src.kg_gen.utils.batch import BatchJob, run_batch_locally
+from tests.mock_lm import MockLM
+
+DOCUMENTS = [
+  "Linda is the mother of Josh Smith. Josh moved to Paris with his brother Ben.",
+  [{"role": "user", "content": "Did Ada Lovelace work with Charles Babbage?"},
+   {"role": "assistant", "content": "Yes, Ada Lovelace worked with Charles Babbage on the Analytical Engine."}],
+  "",
+  "Linda is the mother of Josh Smith. Josh moved to Paris with his brother Ben.",
+]
+
+def read_jsonl(path):
+  with open(path) as f:
+    return [json.loads(line) for line in f]
+
+def test_two_stage_batch_matches_generate_many(tmp_path):
+  lm = MockLM(model="openai/gpt-4o-mini")
+  lm.kwargs["api_key"] = "sk-secret"
+  kg = KGGen(lm=lm)
+  job = kg.batch_job(DOCUMENTS, context="Family and history notes")
+  provider = MockLM()
+
+  # Stage 1: entity requests; the repeated document is sent once
+  assert job.export(tmp_path / "entities.jsonl") == 3
+  request = read_jsonl(tmp_path / "entities.jsonl")[0]
+  assert request["url"] == "/v1/chat/completions" and request["body"]["model"] == "gpt-4o-mini"
+  assert "api_key" not in request["body"]
+  run_batch_locally(tmp_path / "entities.jsonl", tmp_path / "entities_results.jsonl", provider)
+  assert job.ingest(tmp_path / "entities_results.jsonl") == 3
+  assert job.pending == 4 and not job.done
+
+  # Stage 2: relation requests built from the ingested entities
+  assert job.export(tmp_path / "relations.jsonl") == 3
+  run_batch_locally(tmp_path / "relations.jsonl", tmp_path / "relations_results.jsonl", provider)
+  job.ingest(tmp_path / "relations_results.jsonl")
+  assert job.done and job.export(tmp_path / "empty.jsonl") == 0
+
+  stats = RunStats()
+  graphs = list(job.graphs(stats=stats))
+  assert graphs == list(KGGen(lm=MockLM()).generate_many(DOCUMENTS, context="Family and history notes"))
+  assert (stats.documents, stats.chunks, stats.llm_calls) == (4, 4, 6)
+  assert stats.prompt_tokens > 0
+  # Usage is recorded once, however often the graphs are assembled
+  again = RunStats()
+  list(job.graphs(stats=again))
+  assert again.llm_calls == 0 and again.documents == 4
+
+def test_failed_results_are_exported_again_and_job_survives_restart(tmp_path):
+  kg = KGGen(lm=MockLM())
+  job = kg.batch_job(DOCUMENTS[:2], chunk_size=40)
+  n_chunks = len(job.chunks)
+  assert job.export(tmp_path / "entities.jsonl") == n_chunks
+  run_batch_locally(tmp_path / "entities.jsonl", tmp_path / "results.jsonl", MockLM())
+
+  results = read_jsonl(tmp_path / "results.jsonl")
+  results[0]["response"]["status_code"] = 500
+  results[1]["response"]["body"]["choices"][0]["message"]["content"] = "not a parseable answer"
+  with open(tmp_path / "results.jsonl", "w") as f:
+    f.writelines(json.dumps(result) + "\n" for result in results)
+  assert job.ingest(tmp_path / "results.jsonl") == n_chunks - 1 and job.errors == 1
+
+  job.save(tmp_path / "job.json")
+  job = BatchJob.load(kg, tmp_path / "job.json")
+  # Relation requests for the good chunks, the failed request again and a JSON-mode re-ask
+  assert job.export(tmp_path / "next.jsonl") == n_chunks
+  assert sum("response_format" in request["body"] for request in read_jsonl(tmp_path / "next.jsonl")) == 1
+  while not job.done:
+    run_batch_locally(tmp_path / "next.jsonl", tmp_path / "next_results.jsonl", MockLM())
+    job.ingest(tmp_path / "next_results.jsonl")
+    job.export(tmp_path / "next.jsonl")
+  assert list(job.graphs()) == list(KGGen(lm=MockLM()).generate_many(DOCUMENTS[:2], chunk_size=40))
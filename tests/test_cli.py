@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from src.kg_gen.cli import main
+from src.kg_gen.models import Graph, RunStats
+from tests.mock_lm import MockLM
+
+def write_corpus(path):
+  with open(path, "w") as f:
+    f.write(json.dumps({"id": "family", "text": "Linda is Josh's mother. Ben is Josh's brother."}) + "\n")
+    f.write(json.dumps({"id": "chat", "messages": [{"role": "user", "content": "Paris is in France."}]}) + "\n")
+
+def test_cli_extracts_jsonl_and_writes_stats(tmp_path):
+  corpus = os.path.join(tmp_path, "corpus.jsonl")
+  output = os.path.join(tmp_path, "out")
+  write_corpus(corpus)
+
+  assert main([corpus, "-o", output, "--chunk-size", "30", "--workers", "2", "--quiet"], lm=MockLM()) == 0
+
+  with open(os.path.join(output, "graph.json")) as f:
+    graph = Graph.model_validate_json(f.read())
+  assert ("Paris", "is in", "France") in graph.relations
+  assert ("Ben", "is", "Josh") in graph.relations
+  assert sorted(os.listdir(os.path.join(output, "documents"))) == ["chat.json", "family.json"]
+  with open(os.path.join(output, "stats.json")) as f:
+    stats = RunStats.model_validate_json(f.read())
+  assert stats.documents == 2 and stats.chunks == 3 and stats.llm_calls == 6
+
+def test_cli_resumes_and_exports(tmp_path):
+  corpus = os.path.join(tmp_path, "docs")
+  os.makedirs(corpus)
+  for name, text in [("a.txt", "Kitty chased Dogs."), ("b.txt", "Kitties chased Dog.")]:
+    with open(os.path.join(corpus, name), "w") as f:
+      f.write(text)
+  output = os.path.join(tmp_path, "out")
+  main([corpus, "-o", output, "--quiet"], lm=MockLM())
+  os.remove(os.path.join(output, "documents", "b.txt.json"))
+
+  lm = MockLM()
+  main([corpus, "-o", output, "--cluster", "--format", "ntriples", "--quiet"], lm=lm)
+
+  with open(os.path.join(output, "stats.json")) as f:
+    stats = json.load(f)
+  assert stats["skipped_documents"] == 1 and stats["documents"] == 1
+  with open(os.path.join(output, "graph.nt")) as f:
+    assert "<http://kg-gen.local/entity/Kitty> <http://kg-gen.local/relation/chased> <http://kg-gen.local/entity/Dog> ." in f.read()
+
+def test_cli_plan_is_a_dry_run_compared_after_the_real_run(tmp_path, capsys):
+  corpus = os.path.join(tmp_path, "corpus.jsonl")
+  output = os.path.join(tmp_path, "out")
+  write_corpus(corpus)
+  lm = MockLM()
+
+  assert main([corpus, "-o", output, "--chunk-size", "30", "--plan"], lm=lm) == 0
+  assert lm.calls == 0 and not os.path.exists(os.path.join(output, "graph.json"))
+  assert "6 calls" in capsys.readouterr().out
+
+  main([corpus, "-o", output, "--chunk-size", "30"], lm=lm)
+  assert "llm_calls" in capsys.readouterr().err
+
+def test_cli_jsonl_ids_survive_inserted_lines_and_must_be_unique(tmp_path):
+  corpus = os.path.join(tmp_path, "corpus.jsonl")
+  output = os.path.join(tmp_path, "out")
+  with open(corpus, "w") as f:
+    f.write(json.dumps({"text": "Paris is in France."}) + "\n")
+  main([corpus, "-o", output, "--quiet"], lm=MockLM())
+  with open(corpus, "w") as f:
+    f.write(json.dumps({"text": "Rome is in Italy."}) + "\n")
+    f.write(json.dumps({"text": "Paris is in France."}) + "\n")
+    # Repeated documents without ids are kept apart rather than rejected
+    f.write(json.dumps({"text": "Rome is in Italy."}) + "\n")
+
+  main([corpus, "-o", output, "--quiet"], lm=MockLM())
+  with open(os.path.join(output, "stats.json")) as f:
+    stats = json.load(f)
+  assert stats["skipped_documents"] == 1 and stats["documents"] == 2
+  assert len(os.listdir(os.path.join(output, "documents"))) == 3
+
+  with open(corpus, "a") as f:
+    f.write(json.dumps({"id": "a", "text": "Kitty chased Dogs."}) + "\n")
+    f.write(json.dumps({"id": "a", "text": "Kitties chased Dog."}) + "\n")
+  with pytest.raises(ValueError, match="line 4"):
+    main([corpus, "-o", output, "--quiet"], lm=MockLM())
+
+def test_cli_refuses_to_resume_with_other_extraction_arguments(tmp_path, capsys):
+  corpus = os.path.join(tmp_path, "corpus.jsonl")
+  output = os.path.join(tmp_path, "out")
+  write_corpus(corpus)
+  main([corpus, "-o", output, "--chunk-size", "30", "--quiet"], lm=MockLM())
+
+  with pytest.raises(SystemExit):
+    main([corpus, "-o", output, "--chunk-size", "60", "--quiet"], lm=MockLM())
+  assert "--chunk-size" in capsys.readouterr().err
+
+  lm = MockLM()
+  main([corpus, "-o", output, "--chunk-size", "60", "--no-resume", "--quiet"], lm=lm)
+  assert lm.calls == 4
+  # The new arguments are saved, so the next run resumes with them
+  main([corpus, "-o", output, "--chunk-size", "60", "--quiet"], lm=lm)
+  assert lm.calls == 4
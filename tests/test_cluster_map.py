@@ -0,0 +1,47 @@
+import os
+
+from src.kg_gen import KGGen, ClusterMap
+from src.kg_gen.models import Graph
+from src.kg_gen.steps._3_cluster_graph import cluster_graph
+from tests.mock_lm import MockLM
+
+def graph_of(entities):
+  entities = set(entities)
+  return Graph(entities=entities, edges={"likes"}, relations={(e, "likes", e) for e in entities})
+
+def test_cluster_map_round_trip(tmp_path):
+  path = os.path.join(tmp_path, "clusters.json")
+  kg = KGGen(lm=MockLM())
+
+  kg.cluster(graph_of({"cat", "cats", "dog"}), cluster_map=path)
+  cluster_map = ClusterMap.load(path)
+
+  assert cluster_map.representatives("entities") == {"cat": "cat", "cats": "cat", "dog": "dog"}
+  assert cluster_map.entities["cats"].source == "llm"
+  assert cluster_map.entities["dog"].source == "singleton"
+  assert cluster_map.edges["likes"].representative == "likes"
+
+def test_known_items_are_applied_without_llm_calls():
+  kg = KGGen(lm=MockLM())
+  cluster_map = ClusterMap.from_graph(kg.cluster(graph_of({"cat", "cats", "dog"})), run="first")
+
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+  clustered = kg.cluster(graph_of({"cat", "cats", "dog"}), cluster_map=cluster_map)
+
+  assert lm.calls == 0
+  assert clustered.entities == {"cat", "dog"}
+  assert clustered.entity_clusters["cat"] == {"cat", "cats"}
+
+def test_only_unseen_items_reach_the_llm():
+  cluster_map = ClusterMap.from_graph(KGGen(lm=MockLM()).cluster(graph_of({"cat", "cats", "dog"})), run="first")
+
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+  clustered = cluster_graph(kg.dspy, graph_of({"cat", "cats", "dog", "dogs"}), cluster_map=cluster_map, run="second")
+
+  prompts = "".join(e["messages"][-1]["content"] for e in lm.history)
+  assert "cats" not in prompts
+  assert clustered.entity_clusters["dog"] == {"dog", "dogs"}
+  assert cluster_map.entities["dogs"].run == "second"
+  assert cluster_map.entities["dog"].run == "first"
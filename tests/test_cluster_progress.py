@@ -0,0 +1,76 @@
+from src.kg_gen import KGGen
+from src.kg_gen.models import Graph
+from src.kg_gen.steps._3_cluster_graph import LOOP_N, MIN_PATIENCE, cluster_items, window_yield
+from tests.mock_lm import MockLM, heuristic_cluster_ids
+
+def sparse_graph(n):
+  entities = {f"entity {i}" for i in range(n)}
+  return Graph(entities=entities, edges={"likes"}, relations={("entity 0", "likes", "entity 1")})
+
+def test_sparse_graph_stops_extracting_early():
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+
+  clustered = kg.cluster(sparse_graph(5))
+
+  extract_calls = sum("[[ ## cluster_ids ## ]]" in e["outputs"][0] for e in lm.history)
+  assert extract_calls == 2 * MIN_PATIENCE < 2 * LOOP_N
+  assert clustered.entities == sparse_graph(5).entities
+
+def test_extract_yield_is_judged_against_the_phase_so_far():
+  # Same window, compared with an earlier yield per token that was much higher or about equal
+  window = [(2, 3, 20_000), (0, 1, 5_000), (0, 1, 5_000)]
+  assert window_yield(window, (20, 10, 40_000))[2]
+  assert not window_yield(window, (4, 6, 40_000))[2]
+  assert window_yield([(0, 1, 5_000), (0, 1, 5_000)], (4, 6, 40_000))[2]
+  # Without token usage, per call
+  assert window_yield([(2, 3, 0), (0, 1, 0)], (2, 4, 0)) == (0.5, 0.0, False)
+
+def test_long_item_list_keeps_extracting_while_it_makes_progress():
+  # Every third extract round finds a pair, on a list long enough that each round costs
+  # thousands of tokens; the loop only stops once the finds run out
+  rounds = []
+  def every_third_round(inputs):
+    rounds.append(None)
+    return heuristic_cluster_ids(inputs) if len(rounds) % 3 == 1 and len(rounds) <= 30 else []
+  lm = MockLM(responses={"cluster_ids": every_third_round})
+  kg = KGGen(lm=lm)
+  items = {f"item {i}" for i in range(1000)} | {f"item {i}s" for i in range(10)}
+
+  _, clusters = cluster_items(kg.dspy, items)
+
+  # The last find is in round 28; stopping sooner would leave pairs to the assign phase
+  assert 28 < len(rounds) < 30 + LOOP_N
+  assert sum(len(members) == 2 for members in clusters.values()) == 10
+
+def test_progress_callback_reports_yield():
+  snapshots = []
+  kg = KGGen(lm=MockLM())
+  graph = Graph(
+    entities={"cat", "cats", "dog", "dogs", "bird"},
+    edges={"likes"},
+    relations={("cat", "likes", "dog")}
+  )
+
+  kg.cluster(graph, progress=snapshots.append)
+
+  entities = [s for s in snapshots if s.item_type == "entities"]
+  assert entities[0].phase == "extract" and entities[0].items_per_call > 0
+  assert entities[-1].phase == "done" and entities[-1].remaining == 0
+  assert entities[-1].clusters == 3
+  assert [s.calls for s in snapshots] == sorted(s.calls for s in snapshots)
+
+def test_budget_caps_calls():
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+  graph = Graph(
+    entities={"cat", "cats", "dog", "dogs", "bird", "birds"},
+    edges={"likes", "like"},
+    relations={("cat", "likes", "dog")}
+  )
+
+  clustered = kg.cluster(graph, max_calls=4)
+
+  assert lm.calls == 4
+  assert len(clustered.entities) == 5
+  assert clustered.edges == {"likes", "like"}
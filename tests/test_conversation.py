@@ -0,0 +1,40 @@
+from src.kg_gen import KGGen
+from tests.mock_lm import MockLM
+
+MESSAGES = [
+  {"role": "user", "content": "Is Linda Josh's mother?"},
+  {"role": "assistant", "content": "Yes, Linda is Josh's mother."},
+]
+
+def test_chunked_conversation_keeps_turns_whole():
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+
+  kg.generate(input_data=MESSAGES, chunk_size=40)
+
+  sources = [entry["messages"][-1]["content"] for entry in lm.history[::2]]
+  assert any("user: Is Linda Josh's mother?" in source for source in sources)
+  assert any("assistant: Yes, Linda is Josh's mother." in source for source in sources)
+
+def test_update_conversation_only_processes_new_turns():
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+  graph = kg.generate(input_data=MESSAGES, chunk_size=1000)
+  calls = lm.calls
+
+  messages = MESSAGES + [
+    {"role": "user", "content": "Who is Ben?"},
+    {"role": "assistant", "content": "Ben is Josh's brother."},
+  ]
+  updated = kg.update_conversation(graph, messages, start_turn=len(MESSAGES), overlap_turns=0)
+
+  assert lm.calls - calls == 2
+  new_source = lm.history[-2]["messages"][-1]["content"]
+  assert "Linda" not in new_source
+  assert graph.entities <= updated.entities
+  assert ("Ben", "is", "Josh") in updated.relations
+
+  # Nothing appended since: no overlap turns are re-extracted
+  calls = lm.calls
+  assert kg.update_conversation(updated, messages, start_turn=len(messages)) is updated
+  assert lm.calls == calls
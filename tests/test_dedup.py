@@ -0,0 +1,52 @@
+from src.kg_gen import KGGen
+from src.kg_gen.models import RunStats
+from src.kg_gen.utils.dedup import ChunkDeduplicator
+from tests.mock_lm import MockLM
+
+DISCLAIMER = (
+  "This message and any attachments are confidential and intended solely for the named "
+  "recipient. If you received it in error, notify the sender and delete it. Acme Corp "
+  "accepts no liability for viruses transmitted by this email."
+)
+
+def test_claim_matches_exact_and_near_duplicates_only():
+  deduplicator = ChunkDeduplicator()
+
+  first, new = deduplicator.claim(DISCLAIMER)
+  assert new
+  assert deduplicator.claim("  " + DISCLAIMER.upper() + "\n") == (first, False)
+  assert deduplicator.claim(DISCLAIMER.replace("Acme Corp", "Acme Corp.")) == (first, False)
+  assert deduplicator.claim(DISCLAIMER, namespace="conversation")[1]
+  assert deduplicator.claim("Linda is Josh's mother. Ben is Josh's brother.")[1]
+  assert deduplicator.skipped == 2 and len(deduplicator) == 3
+
+def test_failed_extraction_is_not_reused():
+  deduplicator = ChunkDeduplicator()
+  future, _ = deduplicator.claim(DISCLAIMER)
+  future.set_exception(RuntimeError("provider error"))
+
+  retry, new = deduplicator.claim(DISCLAIMER)
+  assert new and retry is not future and deduplicator.skipped == 0
+
+def test_generate_many_skips_repeated_chunks():
+  documents = [DISCLAIMER, "Linda is Josh's mother.", DISCLAIMER, DISCLAIMER.replace("Acme Corp", "Acme Corp.")]
+  plain_lm, lm = MockLM(), MockLM()
+  plain = list(KGGen(lm=plain_lm, max_workers=4).generate_many(documents))
+
+  stats = RunStats()
+  graphs = list(KGGen(lm=lm, max_workers=4).generate_many(documents, deduplicate=True, stats=stats))
+
+  assert graphs[:3] == plain[:3] and graphs[3] == graphs[0]
+  assert stats.chunks == 4 and stats.skipped_chunks == 2
+  assert lm.calls == plain_lm.calls - 4
+
+def test_generate_reuses_deduplicator_across_runs():
+  deduplicator = ChunkDeduplicator()
+  kg = KGGen(lm=MockLM(), max_workers=2)
+  first = kg.generate(input_data=DISCLAIMER, chunk_size=100, deduplicate=deduplicator)
+  calls = kg.lm.calls
+
+  second = kg.generate(input_data=DISCLAIMER, chunk_size=100, deduplicate=deduplicator, provenance=True)
+
+  assert kg.lm.calls == calls and second.entities == first.entities
+  assert deduplicator.skipped == len(deduplicator) and second.provenance.n_chunks == len(deduplicator)
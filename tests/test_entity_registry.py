@@ -0,0 +1,36 @@
+from src.kg_gen import KGGen
+from src.kg_gen.utils.entity_registry import EntityRegistry
+from tests.mock_lm import MockLM
+
+TEXT = "Josh Smith met Linda at the park. Later, JOSH SMITH called Linda."
+
+def test_canonicalize_maps_variants_onto_first_spelling():
+  registry = EntityRegistry(max_recent=2)
+
+  assert registry.canonicalize(["Josh", "Linda"]) == ["Josh", "Linda"]
+  assert registry.canonicalize([" josh ", "LINDA.", "Ben"]) == ["Josh", "Linda", "Ben"]
+  assert registry.reused == 2
+  assert registry.lookup("JOSH") == "Josh"
+  assert registry.recent() == ["Ben", "Linda"]
+
+def test_generate_with_registry_reuses_entities_across_chunks():
+  plain = KGGen(lm=MockLM(), max_workers=1).generate(input_data=TEXT, chunk_size=40)
+  assert {"Josh Smith", "JOSH SMITH"} <= plain.entities
+
+  lm = MockLM()
+  registry = EntityRegistry()
+  graph = KGGen(lm=lm, max_workers=1).generate(input_data=TEXT, chunk_size=40, entity_registry=registry)
+
+  assert "JOSH SMITH" not in graph.entities
+  assert ("Josh Smith", "called", "Linda") in graph.relations
+  assert "Josh Smith" in lm.history[2]["messages"][-1]["content"]
+  assert len(graph.entities) < len(plain.entities)
+
+def test_packed_requests_list_known_entities_too():
+  documents = ["Josh Smith met Linda.", "Linda met Ben.", "JOSH SMITH called Ben.", "Ben called Linda."]
+  lm = MockLM()
+  graphs = list(KGGen(lm=lm, max_workers=1).generate_many(documents, pack_tokens=12, entity_registry=True))
+
+  assert ("Josh Smith", "called", "Ben") in graphs[2].relations
+  packed = [entry for entry in lm.history if "entities_per_source" in entry["outputs"][0]]
+  assert len(packed) == 2 and "Josh Smith" in packed[1]["messages"][-1]["content"]
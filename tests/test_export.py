@@ -0,0 +1,83 @@
+import csv
+import io
+import os
+
+import pytest
+
+from src.kg_gen.models import Graph
+from src.kg_gen.utils.export import cypher_batches, write_cypher, write_neo4j_csv, write_ntriples, write_turtle
+
+GRAPH = Graph(
+  entities={"Linda", "Josh", 'The "Boss".'},
+  edges={"is mother of", "manages"},
+  relations={("Linda", "is mother of", "Josh"), ('The "Boss".', "manages", "Linda")},
+  entity_clusters={"Josh": {"Josh", "Joshua"}},
+  edge_clusters={"is mother of": {"is mother of", "is the mother of"}},
+)
+
+class FakeSession:
+  def __init__(self):
+    self.runs = []
+
+  def run(self, query, parameters=None):
+    self.runs.append((query, parameters))
+
+def test_neo4j_csv(tmp_path):
+  nodes_path, relations_path = write_neo4j_csv(GRAPH, str(tmp_path))
+
+  with open(nodes_path, newline="") as f:
+    nodes = list(csv.DictReader(f))
+  with open(relations_path, newline="") as f:
+    relations = list(csv.DictReader(f))
+  assert {row["name:ID(Entity)"] for row in nodes} == GRAPH.entities
+  assert next(row for row in nodes if row["name:ID(Entity)"] == "Josh")["aliases:string[]"] == "Joshua"
+  mother = next(row for row in relations if row["predicate"] == "is mother of")
+  assert (mother[":START_ID(Entity)"], mother[":END_ID(Entity)"]) == ("Linda", "Josh")
+  assert mother["aliases:string[]"] == "is the mother of"
+
+def test_ntriples_and_turtle_stream_in_chunks(tmp_path):
+  out = io.StringIO()
+  lines = write_ntriples(GRAPH, out, chunk_lines=2)
+
+  ntriples = out.getvalue().splitlines()
+  # 2 relations, 5 labels, 2 altLabels
+  assert lines == len(ntriples) == 9
+  assert "<http://kg-gen.local/entity/Linda> <http://kg-gen.local/relation/is%20mother%20of> <http://kg-gen.local/entity/Josh> ." in ntriples
+  assert '<http://kg-gen.local/entity/The%20%22Boss%22%2E> <http://www.w3.org/2000/01/rdf-schema#label> "The \\"Boss\\"." .' in ntriples
+
+  path = os.path.join(tmp_path, "graph.ttl")
+  write_turtle(GRAPH, path)
+  with open(path) as f:
+    turtle = f.read()
+  assert "e:Linda r:is%20mother%20of e:Josh ." in turtle
+  assert 'e:Josh rdfs:label "Josh" ; skos:altLabel "Joshua" .' in turtle
+
+def test_cypher_batches_against_fake_session():
+  session = FakeSession()
+
+  statements = write_cypher(GRAPH, session, batch_size=2)
+
+  # constraint, 2 node batches, 1 relation batch
+  assert statements == len(session.runs) == 4
+  assert session.runs[0][0].startswith("CREATE CONSTRAINT")
+  rows = [row for query, params in session.runs if "MERGE (n:" in query for row in params["rows"]]
+  assert {row["name"] for row in rows} == GRAPH.entities
+  assert all("$rows" in query for query, _ in session.runs[1:])
+  relation_rows = list(cypher_batches(GRAPH, batch_size=10))[-1][1]["rows"]
+  assert {"subject": "Linda", "predicate": "is mother of", "object": "Josh", "aliases": ["is the mother of"]} in relation_rows
+
+def test_turtle_uses_full_iris_for_invalid_local_names():
+  graph = Graph(entities={"-Linda", "3M"}, edges={"owns"}, relations={("-Linda", "owns", "3M")})
+  out = io.StringIO()
+  write_turtle(graph, out)
+
+  assert "<http://kg-gen.local/entity/-Linda> r:owns <http://kg-gen.local/entity/3M> ." in out.getvalue()
+
+def test_neo4j_csv_rejects_aliases_containing_the_array_delimiter(tmp_path):
+  graph = Graph(entities={"Josh"}, edges=set(), relations=set(), entity_clusters={"Josh": {"Josh", "Smith; Josh"}})
+
+  with pytest.raises(ValueError, match="array delimiter"):
+    write_neo4j_csv(graph, str(tmp_path))
+  nodes_path, _ = write_neo4j_csv(graph, str(tmp_path), array_delimiter="|")
+  with open(nodes_path, newline="") as f:
+    assert next(csv.DictReader(f))["aliases:string[]"] == "Smith; Josh"
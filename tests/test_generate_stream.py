@@ -0,0 +1,26 @@
+from src.kg_gen import KGGen
+from tests.mock_lm import MockLM
+
+TEXT = "Linda is Josh's mother. Ben is Josh's brother. Andrew is Josh's father. Judy is Andrew's sister."
+
+def test_generate_stream_from_iterator_matches_generate():
+  kg = KGGen(lm=MockLM(), max_workers=2)
+
+  expected = kg.generate(input_data=TEXT, chunk_size=50)
+  streamed = kg.generate_stream((TEXT[i:i + 7] for i in range(0, len(TEXT), 7)), chunk_size=50)
+
+  assert streamed == expected
+
+def test_generate_stream_from_directory(tmp_path):
+  (tmp_path / "docs").mkdir()
+  (tmp_path / "docs" / "1.txt").write_text("Linda is Josh's mother.")
+  (tmp_path / "docs" / "2.txt").write_text("Andrew is Josh's father.")
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+
+  graph = kg.generate_stream(tmp_path / "docs", chunk_size=1000, output_folder=str(tmp_path / "out"))
+
+  assert graph.entities == {"Linda", "Josh", "Andrew"}
+  assert graph.relations == {("Linda", "is", "Josh"), ("Andrew", "is", "Josh")}
+  assert lm.calls == 4
+  assert (tmp_path / "out" / "graph.json").exists()
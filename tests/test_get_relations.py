@@ -0,0 +1,33 @@
+from src.kg_gen import KGGen, RunStats
+from src.kg_gen.steps._2_get_relations import EntityIndex
+from tests.mock_lm import MockLM
+
+RELATIONS = [
+  ["Linda", "is mother of", "Josh Smith"],
+  [" linda", "is mother of", "JOSH SMITH."],
+  ["Linda", "is mother of", "Josh Smiths"],
+  ["Linda", "knows", "Andrew"],
+]
+
+def test_entity_index_resolves_near_misses_only():
+  index = EntityIndex(["Linda", "Josh Smith", "Ben"])
+
+  assert index.resolve("Linda") == "Linda"
+  assert index.resolve("  LINDA, ") == "Linda"
+  assert index.resolve("Josh  Smiths") == "Josh Smith"
+  assert index.resolve("Bens") is None
+  assert index.resolve("Andrew") is None
+
+def test_generate_repairs_and_counts_near_miss_triples():
+  kg = KGGen(lm=MockLM(responses={"entities": ["Linda", "Josh Smith"], "relations": RELATIONS}))
+  graph = kg.generate(input_data="Linda is the mother of Josh Smith.")
+
+  assert graph.relations == {("Linda", "is mother of", "Josh Smith")}
+  assert (kg.relation_stats.repaired, kg.relation_stats.dropped) == (2, 1)
+
+def test_generate_many_reports_repaired_and_dropped():
+  kg = KGGen(lm=MockLM(responses={"entities": ["Linda", "Josh Smith"], "relations": RELATIONS}))
+  stats = RunStats()
+  list(kg.generate_many(["Linda is Josh's mother.", "Linda raised Josh."], stats=stats))
+
+  assert (stats.repaired_relations, stats.dropped_relations) == (4, 2)
@@ -0,0 +1,46 @@
+import os
+
+from src.kg_gen import Graph, GraphDelta, merge
+
+BASE = Graph(
+  entities={"cat", "dog", "bird"},
+  edges={"chases", "likes"},
+  relations={("cat", "chases", "bird"), ("dog", "chases", "cat"), ("dog", "likes", "bird")},
+  entity_clusters={"cat": {"cat", "cats"}, "dog": {"dog"}, "bird": {"bird"}},
+)
+NEW = Graph(
+  entities={"cat", "dog", "fish"},
+  edges={"chases", "eats"},
+  relations={("cat", "chases", "fish"), ("dog", "chases", "cat"), ("cat", "eats", "fish")},
+  entity_clusters={"cat": {"cat", "cats", "kitty"}, "dog": {"dog"}, "fish": {"fish"}},
+)
+
+def test_diff_lists_added_and_removed_parts():
+  delta = BASE.diff(NEW)
+
+  assert delta.added_entities == {"fish"}
+  assert delta.removed_entities == {"bird"}
+  assert delta.added_edges == {"eats"}
+  assert delta.removed_edges == {"likes"}
+  assert delta.added_relations == {("cat", "chases", "fish"), ("cat", "eats", "fish")}
+  assert delta.removed_relations == {("cat", "chases", "bird"), ("dog", "likes", "bird")}
+  assert delta.entity_clusters == {"cat": {"cat", "cats", "kitty"}, "fish": {"fish"}}
+  assert delta.removed_entity_clusters == {"bird"}
+  assert BASE.diff(BASE).is_empty()
+
+def test_merge_applies_delta():
+  merged = merge(BASE, BASE.diff(NEW))
+
+  assert merged == NEW
+  assert merge(NEW, NEW.diff(BASE)) == BASE
+
+def test_compact_delta_round_trip(tmp_path):
+  delta = BASE.diff(NEW)
+  path = os.path.join(tmp_path, "delta.json")
+
+  delta.save(path)
+
+  assert GraphDelta.load(path) == delta
+  compact = delta.to_compact()
+  assert all(isinstance(i, int) for i in compact["added_relations"])
+  assert len(compact["names"]) == len(set(compact["names"]))
@@ -0,0 +1,81 @@
+from src.kg_gen.models import Graph
+
+def chain_graph():
+  return Graph(
+    entities={"a", "b", "c", "d", "e"},
+    edges={"to", "likes"},
+    relations={
+      ("a", "to", "b"),
+      ("b", "to", "c"),
+      ("c", "to", "d"),
+      ("a", "likes", "c"),
+      ("e", "likes", "a"),
+    }
+  )
+
+def test_neighbors_and_degree():
+  graph = chain_graph()
+
+  assert graph.neighbors("a") == {"b", "c"}
+  assert graph.neighbors("a", direction="in") == {"e"}
+  assert graph.neighbors("c", direction="both") == {"a", "b", "d"}
+  assert graph.degree("a", direction="out") == 2
+  assert graph.degree("c", direction="in") == 2
+  assert graph.degree("a") == 3
+  assert graph.degree("missing") == 0
+
+def test_k_hop_and_neighborhood():
+  graph = chain_graph()
+
+  assert graph.k_hop(["a"], k=1) == {"a", "b", "c"}
+  assert graph.k_hop(["a"], k=2) == {"a", "b", "c", "d"}
+  assert graph.k_hop(["d"], k=2, direction="in") == {"d", "c", "b", "a"}
+  assert graph.neighborhood(["b"], k=2) == {("b", "to", "c"), ("c", "to", "d")}
+  assert graph.neighborhood(["b"], k=1, direction="both") == {("a", "to", "b"), ("b", "to", "c")}
+
+def test_subgraph():
+  graph = chain_graph()
+
+  sub = graph.subgraph(["a", "b", "c"])
+
+  assert sub.entities == {"a", "b", "c"}
+  assert sub.relations == {("a", "to", "b"), ("b", "to", "c"), ("a", "likes", "c")}
+  assert sub.edges == {"to", "likes"}
+
+def test_index_rebuilds_after_growth():
+  graph = chain_graph()
+  assert graph.neighbors("d") == set()
+
+  graph.entities.add("f")
+  graph.relations.add(("d", "to", "f"))
+
+  assert graph.neighbors("d") == {"f"}
+
+def test_index_rebuilds_after_same_size_edit():
+  graph = chain_graph()
+  assert graph.neighbors("a") == {"b", "c"}
+
+  graph.relations.discard(("a", "to", "b"))
+  graph.relations.add(("a", "to", "d"))
+  graph.invalidate()
+
+  assert graph.neighbors("a") == {"c", "d"}
+  assert graph.degree("b", direction="in") == 0
+
+def test_repeated_queries_reuse_the_index_without_scanning_the_graph():
+  graph = chain_graph()
+  index = graph.index
+  for _ in range(3):
+    graph.neighbors("a")
+    graph.degree("c")
+  assert graph.index is index
+
+  # The check reads only sizes, so a same-size in-place edit is seen after invalidate()
+  graph.relations.discard(("a", "to", "b"))
+  graph.relations.add(("a", "to", "d"))
+  assert graph.index is index
+  graph.invalidate()
+  assert graph.index is not index
+
+  graph.relations = graph.relations - {("a", "to", "d")}
+  assert graph.neighbors("a") == {"c"}
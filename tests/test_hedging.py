@@ -0,0 +1,53 @@
+import itertools
+import threading
+import time
+
+from src.kg_gen import KGGen
+from src.kg_gen.utils.hedging import HedgedLM
+from tests.mock_lm import MockLM
+
+def stalls_on(*slow_calls, delay=2.0):
+  """MockLM latency that stalls the given (1-based) requests and answers the rest fast."""
+  counter = itertools.count(1)
+  lock = threading.Lock()
+  def latency(messages):
+    with lock:
+      call = next(counter)
+    return delay if call in slow_calls else 0.01
+  return latency
+
+def test_slow_call_is_hedged_and_duplicate_wins():
+  lm = HedgedLM(MockLM(latency=stalls_on(6)), min_samples=5, max_extra=0.5)
+  for _ in range(5):
+    lm(prompt="warm up")
+
+  start = time.perf_counter()
+  lm(prompt="stuck")
+  assert time.perf_counter() - start < 1.0
+  assert (lm.calls, lm.hedged, lm.hedge_wins) == (6, 1, 1)
+  # The stalled original is still in flight; its response will be discarded
+  assert lm.lm.calls == 6 and len(lm.history) == 6
+
+def test_hedging_respects_extra_spend_cap():
+  lm = HedgedLM(MockLM(latency=stalls_on(*range(4, 100), delay=0.1)), min_samples=3, max_extra=0.25)
+  for _ in range(12):
+    lm(prompt="slow provider")
+
+  assert 1 <= lm.hedged <= 0.25 * lm.calls
+
+def test_chunked_generate_with_hedging_avoids_stalled_chunk():
+  text = " ".join(f"Person{i} knows Person{i + 1}." for i in range(20))
+  lm = HedgedLM(MockLM(latency=stalls_on(30, delay=3.0)), min_samples=10, max_extra=0.2)
+  kg = KGGen(lm=lm, max_workers=4)
+
+  start = time.perf_counter()
+  graph = kg.generate(input_data=text, chunk_size=40)
+  assert time.perf_counter() - start < 2.0
+  assert lm.hedge_wins >= 1
+  assert graph == KGGen(lm=MockLM(), max_workers=4).generate(input_data=text, chunk_size=40)
+
+def test_hedge_flag_wraps_lm_once():
+  kg = KGGen(lm=MockLM(), hedge=True)
+  assert isinstance(kg.lm, HedgedLM) and isinstance(kg.lm.lm, MockLM)
+  kg.init_model(lm=kg.lm)
+  assert isinstance(kg.lm.lm, MockLM)
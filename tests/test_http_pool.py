@@ -0,0 +1,49 @@
+from src.kg_gen import KGGen
+from src.kg_gen.utils.http_pool import PooledOpenAI
+from tests.mock_server import MockServer
+
+TEXT = " ".join(f"Pooler{i} calls Pooler{i + 1}." for i in range(24))
+
+def test_chunk_threads_share_pooled_keep_alive_connections(monkeypatch):
+  with MockServer() as server:
+    monkeypatch.setenv("OPENAI_API_BASE", server.url)
+    monkeypatch.setenv("OPENAI_API_KEY", "local")
+    kg = KGGen(model="openai/stand-in", max_workers=4)
+    client = kg.lm.kwargs["client"]
+    assert isinstance(client, PooledOpenAI) and client._client is kg.http_client
+
+    graph = kg.generate(input_data=TEXT, chunk_size=60)
+    assert len(graph.relations) == 24
+    assert server.requests > 20 and server.connections <= 4
+
+    # dspy's request cache still answers repeated requests
+    requests = server.requests
+    assert kg.generate(input_data=TEXT, chunk_size=60) == graph
+    assert server.requests == requests
+    kg.close()
+
+def test_models_not_behind_openai_client_keep_litellm_transport(monkeypatch):
+  monkeypatch.setenv("ANTHROPIC_API_KEY", "local")
+  monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+  kg = KGGen(model="anthropic/claude-3-5-sonnet-20240620")
+  assert "client" not in kg.lm.kwargs and kg.http_client is None
+  # Without a key litellm reports the missing key itself on the first call
+  assert "client" not in KGGen(model="openai/gpt-4o").lm.kwargs
+  assert isinstance(KGGen(model="openai/gpt-4o", api_key="sk-test").lm.kwargs["client"], PooledOpenAI)
+
+def test_openai_base_url_is_used_and_keys_the_request_cache(monkeypatch):
+  monkeypatch.delenv("OPENAI_API_BASE", raising=False)
+  monkeypatch.setenv("OPENAI_API_KEY", "local")
+  # Text of its own, as a closed server's port (and so URL) may be reused
+  text = "Ada Lovelace wrote to Charles Babbage."
+  graphs = []
+  with MockServer() as first, MockServer() as second:
+    for server in (first, second):
+      monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+      kg = KGGen(model="openai/stand-in")
+      assert str(kg.lm.kwargs["client"].base_url).rstrip("/") == server.url
+      graphs.append(kg.generate(input_data=text))
+      kg.close()
+    # The same request to another endpoint isn't answered from the cache
+    assert graphs[0] == graphs[1]
+    assert first.requests > 0 and second.requests == first.requests
@@ -0,0 +1,90 @@
+from src.kg_gen import KGGen
+from src.kg_gen.models import Graph
+from tests.mock_lm import MockLM
+
+
+def test_generate_with_mock_lm():
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+
+  graph = kg.generate(input_data="Linda is Josh's mother. Ben is Josh's brother.")
+
+  assert graph.entities == {"Linda", "Josh", "Ben"}
+  assert ("Linda", "is", "Josh") in graph.relations
+  assert lm.calls == 2
+  assert all(entry["usage"]["prompt_tokens"] > 0 for entry in lm.history)
+
+def test_cluster_with_mock_lm():
+  kg = KGGen(lm=MockLM())
+  graph = Graph(
+    entities={"cat", "cats", "dog", "dogs"},
+    edges={"likes", "like"},
+    relations={("cat", "likes", "dog"), ("cats", "like", "dogs")}
+  )
+
+  clustered = kg.cluster(graph)
+
+  assert clustered.entities == {"cat", "dog"}
+  assert clustered.edges == {"like"}
+  assert clustered.relations == {("cat", "like", "dog")}
+  assert clustered.entity_clusters["cat"] == {"cat", "cats"}
+
+def test_scripted_responses_and_latency():
+  delays = []
+  def latency(messages):
+    delays.append(len(messages))
+    return 0.0
+
+  lm = MockLM(
+    responses={
+      "entities": ["Paris", "France"],
+      "relations": lambda inputs: [("Paris", "is capital of", inputs["entities"][1])],
+    },
+    latency=latency
+  )
+  kg = KGGen(lm=lm)
+
+  graph = kg.generate(input_data="The capital of France is Paris.")
+
+  assert graph.relations == {("Paris", "is capital of", "France")}
+  assert len(delays) == 2
+
+def test_cluster_prompts_use_numbered_ids():
+  lm = MockLM()
+  kg = KGGen(lm=lm)
+  graph = Graph(
+    entities={"cat", "cats", "kitten", "dog"},
+    edges={"likes"},
+    relations={("cat", "likes", "dog"), ("kitten", "likes", "cats")}
+  )
+
+  clustered = kg.cluster(graph)
+
+  assert clustered.entity_clusters["cat"] == {"cat", "cats"}
+  assert "0: cat\n1: cats" in lm.history[0]["messages"][-1]["content"]
+  check = next(e for e in lm.history if "cluster_ids_that_items_belong_to" in e["outputs"][0])
+  # Existing clusters are sent as representatives only, not their member sets
+  assert "cats" not in check["messages"][-1]["content"]
+
+def test_cluster_ignores_unknown_ids():
+  kg = KGGen(lm=MockLM(responses={"cluster_ids": [0, 1, 99]}))
+  graph = Graph(entities={"cat", "cats"}, edges={"likes"}, relations={("cat", "likes", "cats")})
+
+  clustered = kg.cluster(graph)
+
+  assert clustered.entities == {"cat"}
+  assert clustered.entity_clusters["cat"] == {"cat", "cats"}
+
+def test_extraction_prompts_share_context_prefix():
+  lm = MockLM()
+  kg = KGGen(lm=lm, max_workers=1)
+  context = "Family relationships in a biography"
+
+  kg.generate(input_data="Linda is Josh's mother. Ben is Josh's brother.", chunk_size=25, context=context)
+
+  entity_calls = [entry["messages"] for entry in lm.history[::2]]
+  assert len(entity_calls) == 2
+  assert entity_calls[0][0] == entity_calls[1][0]
+  prefix = f"[[ ## context ## ]]\n{context}\n\n[[ ## source_text ## ]]\n"
+  assert all(messages[-1]["content"].startswith(prefix) for messages in entity_calls)
+  assert lm.history[1]["messages"][-1]["content"].startswith(prefix)
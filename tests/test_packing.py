@@ -0,0 +1,47 @@
+from src.kg_gen import KGGen, RunStats
+from src.kg_gen.utils.packing import estimate_tokens, pack_items
+from tests.mock_lm import MockLM
+
+TWEETS = [
+  "Linda is Josh's mother.",
+  "Ben is Josh's brother.",
+  "Paris is in France.",
+  "Andrew is Josh's father.",
+  "",
+  "Berlin is in Germany.",
+]
+
+def test_pack_items_respects_budget_and_groups():
+  items = ["a" * 40, "b" * 40, "c" * 40, "d" * 200, "e" * 4]
+  assert [len(p) for p in pack_items(items, 25, size=estimate_tokens)] == [2, 1, 1, 1]
+  assert [len(p) for p in pack_items(items, 1000, size=estimate_tokens, max_items=3)] == [3, 2]
+  assert [len(p) for p in pack_items(items, 1000, size=estimate_tokens, group=lambda item: item[0] == "d")] == [3, 1, 1]
+
+def test_packed_generate_many_matches_unpacked_with_fewer_calls():
+  plain_lm, lm = MockLM(), MockLM()
+  plain = list(KGGen(lm=plain_lm, max_workers=2).generate_many(TWEETS))
+
+  stats = RunStats()
+  packed = list(KGGen(lm=lm, max_workers=2).generate_many(TWEETS, pack_tokens=500, stats=stats))
+
+  assert packed == plain
+  assert stats.documents == len(TWEETS)
+  assert lm.calls == 2 and plain_lm.calls == 2 * len(TWEETS)
+
+def test_invalid_packed_response_falls_back_per_chunk():
+  lm = MockLM(responses={"entities_per_source": [["Linda", "Josh"]]})
+  graphs = list(KGGen(lm=lm, max_workers=1).generate_many(TWEETS[:2], pack_tokens=500))
+
+  assert ("Linda", "is", "Josh") in graphs[0].relations
+  assert graphs[1].entities == {"Ben", "Josh"}
+  assert lm.calls == 4  # packed entities (rejected), two single entity calls, packed relations
+
+def test_packing_with_dedup_and_provenance():
+  documents = ["Ben is Josh's brother.", "Linda is Josh's mother.", "Ben is Josh's brother."]
+  stats = RunStats()
+  lm = MockLM()
+  graphs = list(KGGen(lm=lm).generate_many(documents, pack_tokens=500, deduplicate=True, provenance=True, stats=stats))
+
+  assert graphs[2] == graphs[0]
+  assert graphs[2].sources(("Ben", "is", "Josh")) == [(0, 0, 11)]
+  assert stats.skipped_chunks == 1 and lm.calls == 2
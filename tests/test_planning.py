@@ -0,0 +1,34 @@
+from src.kg_gen import KGGen, RunStats
+from src.kg_gen.utils.planning import Planner
+from tests.mock_lm import MockLM
+
+def test_plan_matches_extraction_calls_and_tokens():
+  with open("tests/data/kingkiller_chapter_one.txt", encoding="utf-8") as f:
+    text = f.read()
+  kg = KGGen(lm=MockLM(), max_workers=4)
+
+  plan = kg.plan(text, chunk_size=5000)
+  stats = RunStats()
+  list(kg.generate_many([text], chunk_size=5000, stats=stats))
+
+  comparison = plan.compare(stats)
+  assert comparison["chunks"]["ratio"] == 1.0 and comparison["llm_calls"]["ratio"] == 1.0
+  assert 0.8 < comparison["prompt_tokens"]["ratio"] < 1.2
+  assert kg.lm.calls == 2 * plan.chunks
+
+def test_plan_accounts_for_packing():
+  tweets = [f"Person{i} follows Person{i + 1}." for i in range(100)]
+  kg = KGGen(lm=MockLM())
+
+  plan = kg.plan(tweets, pack_tokens=400)
+  list(kg.generate_many(tweets, pack_tokens=400))
+
+  assert plan.documents == 100 and plan.extraction_calls == kg.lm.calls < 20
+
+def test_clustering_projection_grows_faster_than_item_count():
+  planner = Planner("mock/kg-gen")
+  small, large = planner.project_clustering(500, 6), planner.project_clustering(5000, 6)
+
+  assert planner.project_clustering(0, 6) == (0, 0, 0, 0.0)
+  assert large[0] > 9 * small[0]
+  assert large[1] > 50 * small[1]
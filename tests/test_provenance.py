@@ -0,0 +1,62 @@
+from src.kg_gen import KGGen, Graph
+from src.kg_gen.utils.provenance import relation_span
+from tests.mock_lm import MockLM
+
+TEXT = "Linda is Josh's mother. Ben is Josh's brother. Andrew is Josh's father."
+
+def test_relation_span_picks_shortest_mention_pair():
+  assert relation_span("Ben met Carl. Later Ann saw Ben.", ("Ann", "saw", "Ben")) == (20, 31)
+  assert relation_span("No mention here.", ("Ann", "saw", "Ben")) == (0, 16)
+
+def test_generate_records_chunk_spans():
+  kg = KGGen(lm=MockLM(), max_workers=1)
+  graph = kg.generate(input_data=TEXT, chunk_size=30, provenance=True)
+
+  chunks = ["Linda is Josh's mother.", "Ben is Josh's brother.", "Andrew is Josh's father."]
+  assert graph.provenance.n_chunks == 3
+  [(chunk_id, start, end)] = graph.sources(("Ben", "is", "Josh"))
+  assert chunk_id == 1 and chunks[1][start:end] == "Ben is Josh"
+  assert len(graph.provenance) == len(graph.relations)
+
+def test_provenance_survives_aggregate_cluster_and_serialization():
+  kg = KGGen(lm=MockLM(), max_workers=1)
+  first = kg.generate(input_data="Kitty chased Dogs.", provenance=True)
+  second = kg.generate(input_data="Kitties chased Dog.", provenance=True)
+
+  aggregated = kg.aggregate([first, second])
+  assert aggregated.provenance.n_chunks == 2
+  assert aggregated.sources(("Kitties", "chased", "Dog")) == [(1, 0, 18)]
+
+  clustered = kg.cluster(aggregated)
+  rep = ("Kitty", "chased", "Dog")
+  assert clustered.relations == {rep}
+  assert clustered.sources(rep) == [(0, 0, 17), (1, 0, 18)]
+
+  restored = Graph.model_validate_json(clustered.model_dump_json())
+  assert restored == clustered
+  assert restored.sources(rep) == clustered.sources(rep)
+
+def test_sources_follow_the_triple_after_relations_are_edited():
+  kg = KGGen(lm=MockLM(), max_workers=1)
+  graph = kg.generate(input_data=TEXT, chunk_size=30, provenance=True)
+  ben = graph.sources(("Ben", "is", "Josh"))
+
+  # Same-size edit that shifts the sorted rows of every later triple
+  graph.entities.add("Aaron")
+  graph.relations.discard(("Linda", "is", "Josh"))
+  graph.relations.add(("Aaron", "is", "Josh"))
+
+  assert graph.sources(("Ben", "is", "Josh")) == ben
+  assert graph.sources(("Aaron", "is", "Josh")) == []
+  assert graph.sources(("Linda", "is", "Josh")) == []
+
+def test_provenance_saved_as_index_rows_still_loads():
+  kg = KGGen(lm=MockLM(), max_workers=1)
+  graph = kg.generate(input_data=TEXT, chunk_size=30, provenance=True)
+  data = graph.model_dump(mode="json")
+  rows = graph.index.rows(graph.provenance.entry_relations())
+  data["provenance"] = {**data["provenance"], "rows": rows.tolist()}
+  del data["provenance"]["relations"]
+
+  restored = Graph.model_validate(data)
+  assert restored.sources(("Ben", "is", "Josh")) == graph.sources(("Ben", "is", "Josh"))
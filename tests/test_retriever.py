@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from src.kg_gen import GraphRetriever
+from src.kg_gen.models import Graph
+from src.kg_gen.utils.retriever import index_path
+
+VOCAB = ["linda", "josh", "ben", "andrew", "judy", "mother", "brother", "father", "sister"]
+
+def embed(texts):
+  # Bag-of-words over a fixed vocabulary keeps the test independent of any model download
+  return np.array([[text.lower().count(word) + 0.01 * i for i, word in enumerate(VOCAB)] for text in texts])
+
+def family_graph():
+  return Graph(
+    entities={"Linda", "Josh", "Ben", "Andrew"},
+    edges={"is mother of", "is brother of", "is father of"},
+    relations={
+      ("Linda", "is mother of", "Josh"),
+      ("Ben", "is brother of", "Josh"),
+      ("Andrew", "is father of", "Ben"),
+    }
+  )
+
+def test_top_k_and_retrieve():
+  graph = family_graph()
+  retriever = graph.retriever(embedder=embed)
+
+  assert retriever.top_k("Who is Linda?", k=1)[0][0] == "Linda"
+  assert retriever.retrieve("Andrew", k=1) == ["Andrew is father of Ben.", "Ben is brother of Josh."]
+  assert retriever.retrieve("Andrew", k=1, depth=1) == ["Andrew is father of Ben."]
+
+def test_incremental_update():
+  graph = family_graph()
+  retriever = graph.retriever(embedder=embed)
+  assert len(retriever.names) == 4
+
+  graph.entities.add("Judy")
+  graph.edges.add("is sister of")
+  graph.relations.add(("Judy", "is sister of", "Andrew"))
+
+  assert graph.retriever() is retriever
+  assert len(retriever.names) == 5
+  assert retriever.top_k("Judy", k=1)[0][0] == "Judy"
+  assert "Judy is sister of Andrew." in retriever.retrieve("Judy", k=1)
+
+def test_removed_entity_added_back_is_searchable_again():
+  graph = family_graph()
+  retriever = graph.retriever(embedder=embed)
+
+  graph.entities.discard("Linda")
+  graph.retriever()
+  assert "Linda" not in [name for name, _ in retriever.top_k("Linda", 4)]
+
+  graph.entities.add("Linda")
+  graph.retriever()
+  assert retriever.top_k("Linda", 1)[0][0] == "Linda"
+
+def test_save_and_load(tmp_path):
+  graph = family_graph()
+  retriever = GraphRetriever(graph, embedder=embed)
+  path = index_path(str(tmp_path / "graph.json"))
+  retriever.save(path)
+
+  calls = []
+  def counting_embed(texts):
+    calls.append(list(texts))
+    return embed(texts)
+
+  graph.entities.add("Judy")
+  loaded = GraphRetriever.load(graph, path, embedder=counting_embed)
+
+  assert path.endswith("graph.index.npz")
+  assert calls == [["Judy"]]
+  assert np.allclose(loaded.embeddings[:4], retriever.embeddings)
+
+def test_different_arguments_build_a_new_retriever():
+  graph = family_graph()
+  retriever = graph.retriever(embedder=embed)
+  assert graph.retriever(embedder=embed) is retriever
+
+  def other_embed(texts):
+    return embed(texts) * 2
+
+  rebuilt = graph.retriever(embedder=other_embed)
+  assert rebuilt is not retriever and rebuilt.embedder is other_embed
+
+def test_embeddings_of_another_dimension_are_rejected(tmp_path):
+  graph = family_graph()
+  path = str(tmp_path / "graph.index.npz")
+  GraphRetriever(graph, embedder=embed).save(path)
+  graph.entities.add("Judy")
+
+  with pytest.raises(ValueError, match="dimension"):
+    GraphRetriever.load(graph, path, embedder=lambda texts: np.ones((len(texts), 3)))
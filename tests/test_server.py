@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+from src.kg_gen import KGGen
+from src.kg_gen.server import create_app
+from tests.mock_lm import MockLM
+
+async def request(app, method, path, body=None):
+  messages = [{"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}]
+  sent = []
+  async def receive():
+    return messages.pop(0)
+  async def send(message):
+    sent.append(message)
+  await app({"type": "http", "method": method, "path": path}, receive, send)
+  return sent[0]["status"], json.loads(sent[1]["body"])
+
+def test_concurrent_generate_requests_are_batched_and_cached():
+  lm = MockLM(latency=0.01)
+  app = create_app(KGGen(lm=lm), batch_window=0.05)
+  texts = ["Linda is Josh's mother.", "Ben is Josh's brother.", "Paris is in France."]
+
+  async def run():
+    results = await asyncio.gather(*(request(app, "POST", "/generate", {"input_data": t}) for t in texts))
+    repeat = await request(app, "POST", "/generate", {"input_data": texts[0]})
+    health = await request(app, "GET", "/health")
+    return results, repeat, health
+
+  results, repeat, (_, health) = asyncio.run(run())
+
+  assert [status for status, _ in results] == [200, 200, 200]
+  assert ["Paris", "is in", "France"] in results[2][1]["relations"]
+  assert repeat == results[0]
+  assert health["batches"] == 1 and health["batched_requests"] == 3
+  assert health["cache_hits"] == 1
+  assert lm.calls == 6
+
+def test_full_queue_answers_503():
+  app = create_app(KGGen(lm=MockLM(latency=0.05)), queue_size=1, max_batch=1, batch_window=0)
+  texts = [f"Person{i} met Person{i + 1}." for i in range(4)]
+
+  async def run():
+    return await asyncio.gather(*(request(app, "POST", "/generate", {"input_data": t}) for t in texts))
+
+  statuses = [status for status, _ in asyncio.run(run())]
+  assert 503 in statuses and 200 in statuses
+
+def test_cluster_aggregate_and_errors():
+  app = create_app(KGGen(lm=MockLM()))
+  graph = {"entities": ["cat", "cats"], "edges": ["likes"], "relations": [["cat", "likes", "cats"]]}
+
+  async def run():
+    return (
+      await request(app, "POST", "/cluster", {"graph": graph}),
+      await request(app, "POST", "/aggregate", {"graphs": [graph, graph]}),
+      await request(app, "POST", "/generate", {}),
+      await request(app, "GET", "/generate"),
+      await request(app, "POST", "/nope", {}),
+    )
+
+  clustered, aggregated, missing, wrong_method, unknown = asyncio.run(run())
+
+  assert clustered[0] == 200 and clustered[1]["entities"] == ["cat"]
+  assert aggregated[0] == 200 and sorted(aggregated[1]["entities"]) == ["cat", "cats"]
+  assert (missing[0], wrong_method[0], unknown[0]) == (400, 405, 404)
+
+def test_bad_requests_fail_alone_and_scheduler_keeps_running():
+  def latency(messages):
+    if "Boom" in messages[-1]["content"]:
+      raise RuntimeError("model failed")
+    return 0.0
+
+  app = create_app(KGGen(lm=MockLM(latency=latency)), batch_window=0.05)
+  texts = ["Linda is Josh's mother.", "Boom went the engine.", "Ben is Josh's brother."]
+
+  async def run():
+    batched = await asyncio.gather(
+      *(request(app, "POST", "/generate", {"input_data": t}) for t in texts),
+      request(app, "POST", "/generate", {"input_data": [{"role": "user"}]}),
+      request(app, "POST", "/generate", {"input_data": texts[0], "context": ["x"]}),
+    )
+    after = await request(app, "POST", "/generate", {"input_data": "Paris is in France."})
+    return batched, after
+
+  batched, after = asyncio.run(run())
+  assert [status for status, _ in batched] == [200, 500, 200, 400, 400]
+  assert "Linda" in batched[0][1]["entities"] and "Ben" in batched[2][1]["entities"]
+  assert after[0] == 200 and ["Paris", "is in", "France"] in after[1]["relations"]
@@ -0,0 +1,81 @@
+import dspy
+import litellm
+import pytest
+
+from src.kg_gen import KGGen, RunStats
+from src.kg_gen.steps._3_cluster_graph import CheckExistingClusters, number_items
+from src.kg_gen.utils.structured import StructuredAdapter
+from tests.mock_lm import MockLM, heuristic_cluster_ids_of_items, heuristic_relations
+
+TEXT = "Linda is the mother of Josh Smith. Josh moved to Paris with his brother Ben."
+LONG_TEXT = " ".join(f"Walker{i} met Walker{i + 1} in Town{i}." for i in range(30))
+
+def scripted(*answers):
+  """Response callable giving each answer in turn, then the last one."""
+  calls = []
+  def respond(inputs):
+    calls.append(inputs)
+    answer = answers[min(len(calls), len(answers)) - 1]
+    return answer(inputs) if callable(answer) else answer
+  return respond
+
+def test_invalid_entries_are_kept_apart_and_reasked_alone():
+  lm = MockLM(responses={"relations": scripted(
+    lambda inputs: [["Walker0", "Town0"]] + heuristic_relations(inputs)[1:],
+    [["Walker0", "met", "Walker1"]],
+  )})
+  kg = KGGen(lm=lm, structured=StructuredAdapter(response_format=True))
+  stats = RunStats()
+  graph = next(kg.generate_many([LONG_TEXT], stats=stats))
+
+  assert graph == KGGen(lm=MockLM()).generate(input_data=LONG_TEXT)
+  reask = lm.history[-1]
+  assert "response_format" in reask["kwargs"]
+  assert '[["Walker0", "Town0"]]' in reask["messages"][-1]["content"]
+  assert reask["outputs"][0] == '{"relations": [["Walker0", "met", "Walker1"]]}'
+  assert kg.adapter.stats.reasks == 1 and kg.adapter.stats.unrecovered == 0
+  # Only the failed entry is generated again, not the whole list
+  assert stats.parse_failures == 1 and stats.retry_tokens_saved > 0
+  assert stats.llm_calls == 3
+
+def test_cluster_ids_of_the_wrong_length_are_reasked():
+  lm = MockLM(responses={"cluster_ids_that_items_belong_to": scripted([0], heuristic_cluster_ids_of_items)})
+  adapter = StructuredAdapter()
+  with dspy.context(lm=lm, adapter=adapter):
+    result = dspy.Predict(CheckExistingClusters)(
+      items=number_items(["cats", "dogs", "fish"]), clusters=number_items(["cat", "dog"]), context=""
+    )
+  assert result.cluster_ids_that_items_belong_to == [0, 1, None]
+  assert "has 1 ids for 3 items" in lm.history[-1]["messages"][-1]["content"]
+  assert lm.calls == 2 and adapter.stats.failure_rate == 1.0
+
+def test_unusable_answers_degrade_to_empty_results_without_raising():
+  class SchemaRejectingLM(MockLM):
+    def __call__(self, prompt=None, messages=None, **kwargs):
+      if "response_format" in kwargs:
+        raise litellm.BadRequestError("response_format is not supported", model=self.model, llm_provider="openai")
+      return super().__call__(prompt, messages, **kwargs)
+
+  lm = SchemaRejectingLM(responses={"relations": "no relations here"})
+  kg = KGGen(lm=lm, structured=StructuredAdapter(response_format=True, max_reasks=2))
+  graph = kg.generate(input_data=TEXT)
+
+  assert graph.relations == set() and graph.entities
+  assert kg.adapter.stats.reasks == 2 and kg.adapter.stats.unrecovered == 1
+  # The schema was rejected once and not sent again
+  assert all("response_format" not in entry["kwargs"] for entry in lm.history)
+  assert kg.adapter._schema_support[lm.model] is False
+  # KGGen configures dspy globally; put the default adapter back for later tests
+  KGGen(lm=MockLM())
+
+def test_errors_unrelated_to_the_schema_are_raised_and_keep_it():
+  class OverlongLM(MockLM):
+    def __call__(self, prompt=None, messages=None, **kwargs):
+      raise litellm.ContextWindowExceededError("prompt is too long", model=self.model, llm_provider="openai")
+
+  lm = OverlongLM()
+  adapter = StructuredAdapter(response_format=True)
+  with dspy.context(lm=lm, adapter=adapter):
+    with pytest.raises(litellm.ContextWindowExceededError):
+      dspy.Predict(CheckExistingClusters)(items="0: cats", clusters="0: cat", context="")
+  assert adapter._schema_support[lm.model] is True
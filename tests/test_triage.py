@@ -0,0 +1,66 @@
+import nltk
+
+from src.kg_gen import KGGen
+from src.kg_gen.models import RunStats
+from src.kg_gen.utils import triage as triage_module
+from src.kg_gen.utils.triage import ChunkTriage
+from tests.mock_lm import MockLM
+
+PROSE = "Linda is the mother of Josh Smith. Josh moved to Paris with his brother Ben."
+LINKS = " ".join(f"[{i}] https://example.com/news/2023-06-0{i % 9}/item-{i}" for i in range(12))
+TABLE = "| year | q1 | q2 |\n|---|---|---|\n| 2019 | 1.2 | 3.4 |\n| 2020 | 2.2 | 3.1 |"
+CODE = "def f(x):\n    return {k: v for k, v in x.items() if v > 0}\n\nprint(f({'a': 1}))"
+
+def test_scores_prose_above_tables_links_and_code():
+  triage = ChunkTriage(use_nltk=False)
+  assert triage.score(PROSE)[0] > 0.25
+  for text in (LINKS, TABLE, CODE, ""):
+    assert triage.score(text)[0] < triage.threshold
+
+  assert [triage.keep(text) for text in (PROSE, LINKS, TABLE)] == [True, False, False]
+  assert (triage.checked, triage.skipped) == (3, 2)
+
+def test_generate_skips_triaged_chunks_keeping_prose_triples():
+  text = f"{PROSE}\n\n{LINKS}\n\n{TABLE}"
+  plain_lm, lm = MockLM(), MockLM()
+  plain = KGGen(lm=plain_lm).generate(input_data=text, chunk_size=200)
+
+  triage = ChunkTriage()
+  graph = KGGen(lm=lm).generate(input_data=text, chunk_size=200, triage=triage)
+
+  # Only the triples made up from URL fragments are lost
+  assert graph.relations == KGGen(lm=MockLM()).generate(input_data=PROSE).relations < plain.relations
+  assert (triage.checked, triage.skipped) == (5, 4) and (lm.calls, plain_lm.calls) == (2, 10)
+
+def test_chunk_with_one_entity_skips_relation_call():
+  lm = MockLM(responses={"entities": ["Linda"]})
+  triage = ChunkTriage()
+  graph = KGGen(lm=lm).generate(input_data=PROSE, chunk_size=500, triage=triage)
+
+  assert graph.entities == {"Linda"} and not graph.relations
+  assert lm.calls == 1 and triage.downgraded == 1
+
+def test_generate_many_reports_triaged_chunks_when_packed():
+  documents = [PROSE, LINKS, "Ben visited Rome.", TABLE]
+  stats = RunStats()
+  graphs = list(KGGen(lm=MockLM(), max_workers=2).generate_many(documents, triage=True, pack_tokens=1000, stats=stats))
+
+  assert [len(graph.relations) > 0 for graph in graphs] == [True, False, True, False]
+  assert (stats.triaged_chunks, stats.downgraded_chunks, stats.llm_calls) == (2, 0, 2)
+
+def test_tagged_phrases_when_nltk_data_is_installed(monkeypatch):
+  # Stand-ins for nltk.pos_tag and nltk.ne_chunk, whose data may not be installed here
+  def pos_tag(words):
+    return [(w, "NNP" if w[0].isupper() else "NN" if len(w) > 3 else "DT") for w in words]
+
+  def ne_chunk(tags):
+    return [nltk.Tree("PERSON", [tag]) if tag[1] == "NNP" else tag for tag in tags]
+
+  monkeypatch.setattr(triage_module, "_tagger", lambda: pos_tag)
+  monkeypatch.setattr(triage_module, "_ne_chunker", lambda: ne_chunk)
+  tags = pos_tag(["Linda", "is", "the", "mother", "of", "Josh", "Smith"])
+  assert ChunkTriage._tagged_phrases(pos_tag, [word for word, _ in tags]) == 3
+
+  triage = ChunkTriage()
+  assert triage.score(PROSE)[1] == ChunkTriage._tagged_phrases(pos_tag, PROSE.replace(".", "").split())
+  assert triage.keep(PROSE) and not triage.keep(TABLE)
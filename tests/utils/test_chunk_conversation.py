@@ -0,0 +1,48 @@
+import unittest
+from src.kg_gen.utils.chunk_conversation import chunk_conversation
+
+MESSAGES = [
+    {"role": "system", "content": "You are helpful."},
+    {"role": "user", "content": "What is the capital of France?"},
+    {"role": "assistant", "content": "The capital of France is Paris."},
+    {"role": "user", "content": "And of Italy?"},
+    {"role": "assistant", "content": "The capital of Italy is Rome."},
+]
+
+class TestChunkConversation(unittest.TestCase):
+    def test_whole_turns_are_packed(self):
+        """Turns are never split and system messages are skipped."""
+        result = list(chunk_conversation(MESSAGES, max_chunk_size=80))
+
+        self.assertEqual(result, [
+            "user: What is the capital of France?\nassistant: The capital of France is Paris.",
+            "user: And of Italy?\nassistant: The capital of Italy is Rome.",
+        ])
+        for chunk in result:
+            self.assertTrue(len(chunk) <= 80)
+
+    def test_overlap_turns(self):
+        """The last turn of each chunk is repeated at the start of the next."""
+        result = list(chunk_conversation(MESSAGES, max_chunk_size=80, overlap_turns=1))
+
+        self.assertEqual(result[1], "assistant: The capital of France is Paris.\nuser: And of Italy?")
+        self.assertTrue(result[-1].endswith("assistant: The capital of Italy is Rome."))
+        for chunk in result:
+            self.assertTrue(len(chunk) <= 80)
+
+    def test_oversized_turn_keeps_speaker(self):
+        """A turn larger than the budget is split by sentence with the speaker on every piece."""
+        long_turn = {"role": "assistant", "content": "Paris is large. Rome is old. Berlin is busy."}
+
+        result = list(chunk_conversation([MESSAGES[1], long_turn], max_chunk_size=40))
+
+        self.assertEqual(result[0], "user: What is the capital of France?")
+        self.assertTrue(all(chunk.startswith("assistant: ") for chunk in result[1:]))
+        self.assertTrue(all(len(chunk) <= 40 for chunk in result))
+
+    def test_invalid_message(self):
+        with self.assertRaises(ValueError):
+            list(chunk_conversation([{"content": "no role"}], max_chunk_size=40))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
+import os
+import tempfile
 import unittest
-from src.kg_gen.utils.chunk_text import chunk_text
+from src.kg_gen.utils.chunk_text import chunk_text, iter_chunks, iter_file_chunks
 
 class TestChunkText(unittest.TestCase):
     def test_single_short_sentence(self):
@@ -81,5 +83,47 @@ class TestChunkText(unittest.TestCase):
         # Check the last chunk contains "Another short sentence."
         self.assertTrue("Another short sentence." in result[-1])
 
+    def test_iter_chunks_matches_chunk_text(self):
+        """Streaming the text in small pieces gives the same chunks as chunking it at once."""
+        with open(os.path.join(os.path.dirname(__file__), "..", "data", "kingkiller_chapter_one.txt"), encoding="utf-8") as f:
+            text = f.read()
+        pieces = (text[i:i + 300] for i in range(0, len(text), 300))
+
+        result = list(iter_chunks(pieces, max_chunk_size=1000, buffer_size=2000))
+
+        self.assertEqual(result, chunk_text(text, max_chunk_size=1000))
+
+    def test_iter_chunks_bounds_unpunctuated_input(self):
+        """A stream with no sentence boundaries is still released in bounded pieces."""
+        pieces = ("word " for _ in range(2000))
+
+        result = list(iter_chunks(pieces, max_chunk_size=100, buffer_size=500))
+
+        self.assertTrue(all(len(chunk) <= 100 for chunk in result))
+        self.assertEqual(sum(chunk.count("word") for chunk in result), 2000)
+
+    def test_iter_chunks_does_not_split_words_at_the_buffer_boundary(self):
+        """Unpunctuated input is cut at whitespace, even when words straddle the buffer size."""
+        words = [f"token{i}" for i in range(1000)]
+        text = " ".join(words)
+        pieces = (text[i:i + 7] for i in range(0, len(text), 7))
+
+        result = list(iter_chunks(pieces, max_chunk_size=100, buffer_size=333))
+
+        self.assertEqual([word for chunk in result for word in chunk.split()], words)
+
+    def test_iter_file_chunks_directory(self):
+        """Every file under a directory is chunked, in sorted order, without mixing files."""
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(os.path.join(folder, "b"))
+            with open(os.path.join(folder, "a.txt"), "w") as f:
+                f.write("First file.")
+            with open(os.path.join(folder, "b", "c.txt"), "w") as f:
+                f.write("Second file.")
+
+            result = list(iter_file_chunks(folder, max_chunk_size=50))
+
+        self.assertEqual(result, ["First file.", "Second file."])
+
 if __name__ == "__main__":
     unittest.main()